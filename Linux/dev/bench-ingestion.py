@@ -0,0 +1,176 @@
+"""
+Benchmark de ingesta de pymqtt-listener.py: motor "hilos" (callback de paho +
+EscritorEnSegundoPlano) contra motor "asyncio" (IngestaAsync).
+
+No usa el broker: simula la entrega de paho llamando a `encolar()` lo más
+rápido posible (en ráfagas, como loop_read), y mide cuántos mensajes por
+segundo quedan efectivamente escritos en disco (CSV + binario) en una
+carpeta temporal. En el motor de hilos la cola descarta al llenarse; en el
+asyncio se pausa al productor (contrapresión), así que se informan ambos.
+
+Uso:
+    python3 bench-ingestion.py [--mensajes 50000] [--lento-ms 0] [--listener RUTA]
+
+--lento-ms agrega un destino extra que tarda esa cantidad de ms por lote
+(p.ej. una base remota o métricas lentas) para ver cómo afecta a cada motor.
+"""
+import os
+import sys
+import time
+import shutil
+import types
+import asyncio
+import logging
+import argparse
+import tempfile
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+LISTENER_RUTAS = [
+    os.path.join(AQUI, '..', 'installation', 'pymqtt-listener.py'),
+    '/usr/local/bin/pymqtt-listener.py',
+]
+
+# Payloads representativos (una muestra por mensaje)
+PAYLOADS = [
+    ("measure/environment",   b"25.50,60.00,1013.20"),
+    ("measure/radiation",     b"850.50"),
+    ("measure/temperature",   b"45.20"),
+    ("measure/level_in",      b"15.50,50.00,3200"),
+    ("measure/level_out",     b"5.20,10.00,850"),
+    ("measure/chamber_level", b"120.0"),
+]
+
+RAFAGA = 50   # Mensajes por "lectura de socket"
+
+
+def cargar_listener(ruta, base_dir):
+    """
+    pymqtt-listener.py (nombre con guion) con LOG_DIR_BASE y SQLITE_DB en
+    `base_dir`, como tests/test_listener_orden.py: al importarlo crea la
+    carpeta del mes y el log, y no tienen que ir a /home/log.
+    """
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    if carpeta not in sys.path:
+        sys.path.insert(0, carpeta)
+    with open(ruta, encoding='utf-8') as f:
+        fuente = f.read().replace("'/home/log", repr(base_dir)[:-1])
+    modulo = types.ModuleType("pymqtt_listener")
+    modulo.__file__ = ruta
+    exec(compile(fuente, ruta, 'exec'), modulo.__dict__)
+    logging.getLogger().setLevel(logging.ERROR)   # Sin "💾 Guardado" durante la medición
+    return modulo
+
+
+class DestinoLento:
+    """Destino que solo demora `ms` por lote."""
+
+    def __init__(self, ms):
+        self.ms = ms
+
+    def escribir_filas(self, nombre_variable, filas):
+        pass
+
+    def cerrar_lote(self):
+        time.sleep(self.ms / 1000.0)
+
+    def vaciar(self, fsync=False):
+        pass
+
+    def cerrar_todos(self):
+        pass
+
+    def reiniciar(self):
+        pass
+
+    def cantidad_abiertos(self):
+        return 0
+
+
+def bench_hilos(listener, carpeta, mensajes, lento_ms):
+    esc = listener.crear_escritor(carpeta, nombre="bench-hilos", motor="hilos")
+    if lento_ms:
+        esc.destinos.append(DestinoLento(lento_ms))
+    esc.start()
+
+    inicio = time.perf_counter()
+    for i in range(mensajes):
+        topic, payload = PAYLOADS[i % len(PAYLOADS)]
+        esc.encolar(topic, payload)
+        if i % RAFAGA == 0:
+            time.sleep(0)   # Ceder el GIL como lo hace el hilo de red entre lecturas
+    fin_recepcion = time.perf_counter()
+    esc.detener(timeout=None)
+    fin = time.perf_counter()
+    return esc.estadisticas(), fin_recepcion - inicio, fin - inicio
+
+
+def bench_asyncio(listener, carpeta, mensajes, lento_ms):
+    ingesta = listener.crear_escritor(carpeta, nombre="bench-asyncio", motor="asyncio")
+    if lento_ms:
+        lento = DestinoLento(lento_ms)
+        ingesta.destinos.append(lento)
+        ingesta.salidas.append(listener.DestinoAsync(lento))
+
+    async def principal():
+        leyendo = asyncio.Event()
+        leyendo.set()
+        ingesta.al_pausar = leyendo.clear
+        ingesta.al_reanudar = leyendo.set
+        tarea = asyncio.get_running_loop().create_task(ingesta.correr())
+
+        inicio = time.perf_counter()
+        for i in range(mensajes):
+            if i % RAFAGA == 0:
+                await asyncio.sleep(0)
+                await leyendo.wait()
+            topic, payload = PAYLOADS[i % len(PAYLOADS)]
+            ingesta.encolar(topic, payload)
+        fin_recepcion = time.perf_counter()
+        ingesta.detener()
+        await tarea
+        return fin_recepcion - inicio, time.perf_counter() - inicio
+
+    recepcion, total = asyncio.run(principal())
+    return ingesta.estadisticas(), recepcion, total
+
+
+def informar(nombre, est, recepcion, total):
+    escritos = est['escritos']
+    print(f"{nombre:8s} | recibidos {est['recibidos']:7d} | escritos {escritos:7d} | "
+          f"descartados {est['descartados']:6d} | pausas {est.get('pausas', 0):4d} | "
+          f"recepción {recepcion:6.2f}s | total {total:6.2f}s | "
+          f"{escritos / total:9.0f} msg/s persistidos")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mensajes', type=int, default=50000)
+    parser.add_argument('--lento-ms', type=float, default=0.0)
+    parser.add_argument('--listener', default=next((r for r in LISTENER_RUTAS if os.path.exists(r)), None))
+    args = parser.parse_args()
+
+    if not args.listener:
+        sys.exit("No se encontró pymqtt-listener.py (usar --listener)")
+    base_dir = tempfile.mkdtemp(prefix="bench-log-")
+    try:
+        correr(cargar_listener(args.listener, base_dir), args)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def correr(listener, args):
+
+    print(f"--- Benchmark de ingesta: {args.mensajes} mensajes, destino lento {args.lento_ms} ms/lote ---")
+    print(f"    Backend {listener.STORAGE_BACKEND}, binario {listener.ALMACEN_BINARIO}, "
+          f"durabilidad {listener.DURABILIDAD}, lote {listener.LOTE_MAX_FILAS} filas")
+
+    for nombre, funcion in (("hilos", bench_hilos), ("asyncio", bench_asyncio)):
+        carpeta = tempfile.mkdtemp(prefix=f"bench-{nombre}-")
+        try:
+            informar(nombre, *funcion(listener, carpeta, args.mensajes, args.lento_ms))
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
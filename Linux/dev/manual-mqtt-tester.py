@@ -7,6 +7,9 @@ import paho.mqtt.client as mqtt
 BROKER = "localhost"
 PORT = 1883
 
+# Hora actual en epoch ms (para las muestras con hora del dispositivo)
+AHORA_MS = int(time.time() * 1000)
+
 # Lista de datos simulados para probar TODOS los tópicos V2.0
 # Formato: (Tópico, Payload)
 TEST_PAYLOADS = [
@@ -20,11 +23,21 @@ TEST_PAYLOADS = [
     # Float: 45.2 °C (Temp Interna)
     ("measure/temperature", "45.20"),               
     
-    # CSV: Peso=15.5kg, Distancia=50.0cm
-    ("measure/level_in",    "15.50,50.00"),         
+    # CSV: Peso=15.5kg, Distancia=50.0cm, Volumen=3200ml
+    ("measure/level_in",    "15.50,50.00,3200"),    
     
-    # CSV: Peso=5.2kg, Distancia=10.0cm
-    ("measure/level_out",   "5.20,10.00"),          
+    # CSV: Peso=5.2kg, Distancia=10.0cm, Volumen=850ml
+    ("measure/level_out",   "5.20,10.00,850"),      
+
+    # Payload inválido: va a YYYY_MM_DD_quarantine.csv, no al CSV de datos
+    ("measure/environment", "25.50,sin_dato"),      
+
+    # --- LOTES (varias muestras por mensaje, ver anii_protocol.py) ---
+    # Una muestra con hora del dispositivo
+    ("measure/radiation",   f"851.00@{AHORA_MS}"),
+
+    # Lote JSON: 4 muestras de nivel de cámara cada 250 ms
+    ("measure/chamber_level", f'{{"v":1,"t0":{AHORA_MS},"s":[[0,120.0],[250,121.5],[500,123.0],[750,124.5]]}}'),
 
     # --- CONTROL ---
     ("control/in_valve",    "1"), # Válvula Abierta
@@ -64,6 +77,7 @@ def main():
     print("   -> level_in.csv")
     print("   -> level_out.csv")
     print("   -> control_in.csv...")
+    print("   -> quarantine.csv (payload inválido de prueba)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
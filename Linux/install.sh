@@ -14,6 +14,7 @@
 #### - telegram-uploader.service                          ####
 #### - weather-logger.py                                  ####
 #### - weather-logger.service                             ####
+#### - anii_*.py (módulos comunes a todos los servicios)  ####
 #### deben estar en la carpeta installation.              ####
 ##############################################################
 
@@ -64,6 +65,21 @@ sudo mv dev/awake-keeper.py /home/utils
 sudo chmod 777 net.sh
 sudo chmod 777 scada.sh
 
+##############################################################
+####      Módulos comunes (importados por los scripts)    ####
+##############################################################
+
+#Los módulos anii_*.py van junto a los scripts en /usr/local/bin
+#Se copian (no se mueven) porque scada.sh también los necesita
+
+for modulo in installation/anii_*.py; do
+    if [ -f "$modulo" ]; then
+        sudo cp "$modulo" /usr/local/bin/
+    else
+        echo "⚠️  No se encontraron módulos anii_*.py en el directorio"
+    fi
+done
+
 ##############################################################
 ####           Ubicación de pymqtt-listener.py            ####
 ##############################################################
@@ -0,0 +1,367 @@
+"""
+Catálogo de carpetas para el explorador de archivos del SCADA (/api/files).
+
+    catalogo = CatalogoArchivos('/home/log', ceder=lambda: socketio.sleep(0))
+    catalogo.precargar()          # Recorre el árbol una vez (tarea de fondo)
+    catalogo.vigilar()            # Bucle de inotify (otra tarea de fondo)
+    pagina = catalogo.listar('2025_12', campo='name', desc=False, limite=200, cursor=None)
+
+Cada carpeta se escanea una vez (scandir + stat) y queda en memoria con el
+tamaño y la cantidad de archivos acumulados de sus subcarpetas. inotify
+marca como sucia solo la carpeta que cambió y borra los totales de sus
+ancestros (recalcularlos suma lo que ya está en memoria). Sin inotify
+(otro sistema operativo o se agotó max_user_watches) una carpeta se
+revalida con su mtime o cuando pasan `ttl_s` segundos.
+
+Los nombres que empiezan con '.' no se listan ni se cuentan. El cursor de
+la paginación es la clave de orden del último elemento devuelto, así que
+si la carpeta cambia entre páginas no se repiten ni se saltean elementos.
+"""
+import os
+import json
+import errno
+import time
+import base64
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+# Eventos de inotify (<sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+MASCARA_CATALOGO = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+                    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+CAMPOS_ORDEN = ('name', 'size', 'mtime')
+
+
+class Inotify:
+    """inotify(7) por ctypes (sin dependencias). Lanza OSError si el sistema no lo tiene."""
+
+    _EVENTO = struct.Struct('iIII')   # wd, mask, cookie, len
+
+    def __init__(self):
+        nombre = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(nombre, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify no disponible")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._rutas = {}    # wd -> carpeta
+
+    def agregar(self, ruta, mascara=MASCARA_CATALOGO):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(ruta), mascara)
+        if wd < 0:
+            codigo = ctypes.get_errno()
+            raise OSError(codigo, os.strerror(codigo), ruta)
+        self._rutas[wd] = ruta
+        return wd
+
+    def leer(self, timeout=None):
+        """[(carpeta, nombre, máscara), ...]; espera hasta `timeout` s (None = sin límite)."""
+        listos, _, _ = select.select([self.fd], [], [], timeout)
+        if not listos:
+            return []
+        try:
+            datos = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        eventos = []
+        pos = 0
+        while pos + self._EVENTO.size <= len(datos):
+            wd, mascara, _, largo = self._EVENTO.unpack_from(datos, pos)
+            pos += self._EVENTO.size
+            nombre = os.fsdecode(datos[pos:pos + largo].rstrip(b'\0'))
+            pos += largo
+            carpeta = self._rutas.pop(wd, None) if mascara & IN_IGNORED else self._rutas.get(wd)
+            eventos.append((carpeta, nombre, mascara))
+        return eventos
+
+    def cerrar(self):
+        os.close(self.fd)
+
+
+class _Carpeta:
+    __slots__ = ('entradas', 'mtime', 'escaneada', 'vigilada', 'sucia', 'totales', 'ordenes')
+
+    def __init__(self, entradas, mtime, vigilada):
+        self.entradas = entradas       # nombre -> (es_dir, tamaño, mtime)
+        self.mtime = mtime
+        self.escaneada = time.monotonic()
+        self.vigilada = vigilada
+        self.sucia = False
+        self.totales = None            # (bytes, archivos) recursivos; None = recalcular
+        self.ordenes = {}              # (campo, desc) -> [nombres]
+
+
+class CatalogoArchivos:
+    def __init__(self, base_dir, ceder=None, ttl_s=30, usar_inotify=True):
+        self.base_dir = os.path.abspath(base_dir)
+        self.ceder = ceder             # Se llama entre carpeta y carpeta al recorrer el árbol
+        self.ttl_s = ttl_s
+        self._carpetas = {}            # ruta absoluta -> _Carpeta
+        self._lock = threading.RLock()
+        self.escaneos = 0              # Carpetas leídas del disco (para métricas)
+        self.inotify = None
+        if usar_inotify:
+            try:
+                self.inotify = Inotify()
+            except OSError as e:
+                logging.warning(f"⚠️ Catálogo sin inotify ({e}): se revalida por mtime")
+
+    # -----------------------------------------------------
+    # Consulta
+    # -----------------------------------------------------
+    def listar(self, relativa='', campo='name', desc=False, limite=200, cursor=None):
+        """
+        {'path', 'entries', 'next', 'total', 'size', 'files'} de la carpeta
+        `relativa` (las carpetas primero). Cada entrada: name, path, is_dir,
+        size, mtime y, si es carpeta, files (ambos acumulados). FileNotFoundError
+        si no existe, ValueError si `campo` o `cursor` no son válidos.
+        """
+        if campo not in CAMPOS_ORDEN:
+            raise ValueError(f"orden desconocido: {campo}")
+        base = os.path.normpath(self.base_dir)
+        ruta = os.path.normpath(os.path.join(base, relativa))
+        # Nada fuera de base_dir (tampoco carpetas hermanas con el mismo prefijo)
+        carpeta = self._obtener(ruta) if ruta == base or ruta.startswith(base + os.sep) else None
+        if carpeta is None:
+            raise FileNotFoundError(relativa)
+        total_bytes, total_archivos = self.totales(ruta)
+
+        with self._lock:
+            orden = carpeta.ordenes.get((campo, desc))
+            if orden is None:
+                orden = carpeta.ordenes[(campo, desc)] = self._ordenar(carpeta.entradas, campo, desc)
+            entradas = dict(carpeta.entradas)
+
+        inicio = 0
+        if cursor:
+            clave_cursor = _leer_cursor(cursor)
+            inicio = _primero_despues(orden, entradas, campo, desc, clave_cursor)
+        pagina = orden[inicio:inicio + limite]
+
+        resultado = []
+        for nombre in pagina:
+            es_dir, tamano, mtime = entradas[nombre]
+            entrada = {'name': nombre, 'is_dir': es_dir, 'size': tamano, 'mtime': int(mtime),
+                       'path': os.path.relpath(os.path.join(ruta, nombre), self.base_dir)}
+            if es_dir:
+                entrada['size'], entrada['files'] = self.totales(os.path.join(ruta, nombre))
+            resultado.append(entrada)
+
+        siguiente = None
+        if inicio + limite < len(orden) and pagina:
+            siguiente = _escribir_cursor(_clave(pagina[-1], entradas[pagina[-1]], campo))
+        return {'path': relativa, 'entries': resultado, 'next': siguiente, 'total': len(orden),
+                'size': total_bytes, 'files': total_archivos}
+
+    def totales(self, ruta):
+        """(bytes, archivos) de la carpeta y todas sus subcarpetas."""
+        carpeta = self._obtener(ruta)
+        if carpeta is None:
+            return 0, 0
+        with self._lock:
+            if carpeta.totales is not None and not carpeta.sucia:
+                return carpeta.totales
+            entradas = list(carpeta.entradas.items())
+        total_bytes = total_archivos = 0
+        for nombre, (es_dir, tamano, _) in entradas:
+            if es_dir:
+                b, a = self.totales(os.path.join(ruta, nombre))
+                total_bytes += b
+                total_archivos += a
+            else:
+                total_bytes += tamano
+                total_archivos += 1
+        with self._lock:
+            if self._carpetas.get(ruta) is carpeta and not carpeta.sucia:
+                carpeta.totales = (total_bytes, total_archivos)
+        return total_bytes, total_archivos
+
+    def precargar(self):
+        """Recorre el árbol entero (los totales de la raíz); conviene al arrancar."""
+        inicio = time.perf_counter()
+        total_bytes, total_archivos = self.totales(self.base_dir)
+        logging.info(f"🗂️ Catálogo de {self.base_dir}: {len(self._carpetas)} carpetas, "
+                     f"{total_archivos} archivos, {total_bytes / 1e6:.1f} MB en {time.perf_counter() - inicio:.2f} s")
+
+    # -----------------------------------------------------
+    # Invalidación
+    # -----------------------------------------------------
+    def vigilar(self):
+        """Bucle de eventos de inotify (no vuelve). Sin inotify no hace nada."""
+        if self.inotify is None:
+            return
+        while True:
+            try:
+                eventos = self.inotify.leer()
+            except OSError as e:
+                logging.error(f"❌ Error leyendo inotify: {e}")
+                time.sleep(1)
+                continue
+            for carpeta, nombre, mascara in eventos:
+                self._evento(carpeta, nombre, mascara)
+
+    def _evento(self, carpeta, nombre, mascara):
+        if mascara & IN_Q_OVERFLOW:
+            # Se perdieron eventos: todo a revalidar
+            with self._lock:
+                for c in self._carpetas.values():
+                    c.sucia = True
+                    c.totales = None
+            return
+        if carpeta is None:
+            return
+        if mascara & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            self._olvidar(carpeta)
+            return
+        if mascara & IN_ISDIR and mascara & (IN_DELETE | IN_MOVED_FROM):
+            self._olvidar(os.path.join(carpeta, nombre))
+        self.invalidar(carpeta)
+
+    def invalidar(self, ruta):
+        """La carpeta se vuelve a escanear al consultarla; sus ancestros recalculan totales."""
+        with self._lock:
+            carpeta = self._carpetas.get(ruta)
+            if carpeta is not None:
+                carpeta.sucia = True
+            self._invalidar_totales(ruta)
+
+    def _invalidar_totales(self, ruta):
+        while True:
+            carpeta = self._carpetas.get(ruta)
+            if carpeta is not None:
+                carpeta.totales = None
+            if ruta == self.base_dir or len(ruta) <= len(self.base_dir):
+                return
+            ruta = os.path.dirname(ruta)
+
+    def _olvidar(self, ruta):
+        with self._lock:
+            prefijo = ruta + os.sep
+            for r in [r for r in self._carpetas if r == ruta or r.startswith(prefijo)]:
+                del self._carpetas[r]
+            self._invalidar_totales(os.path.dirname(ruta))
+
+    # -----------------------------------------------------
+    # Escaneo
+    # -----------------------------------------------------
+    def _obtener(self, ruta):
+        """_Carpeta al día de `ruta` (la escanea si hace falta) o None si no existe."""
+        with self._lock:
+            carpeta = self._carpetas.get(ruta)
+            if carpeta is not None and not carpeta.sucia:
+                if carpeta.vigilada:
+                    return carpeta
+                try:
+                    mtime = os.stat(ruta).st_mtime
+                except OSError:
+                    mtime = None
+                if mtime == carpeta.mtime and time.monotonic() - carpeta.escaneada < self.ttl_s:
+                    return carpeta
+
+        vigilada = carpeta.vigilada if carpeta is not None else self._vigilar(ruta)
+        nueva = self._escanear(ruta, vigilada)
+        with self._lock:
+            if nueva is None:
+                self._carpetas.pop(ruta, None)
+            else:
+                self._carpetas[ruta] = nueva
+            self._invalidar_totales(ruta)
+        if self.ceder is not None:
+            self.ceder()
+        return nueva
+
+    def _vigilar(self, ruta):
+        if self.inotify is None:
+            return False
+        try:
+            # Antes de escanear: lo que cambie durante el escaneo genera un evento
+            self.inotify.agregar(ruta)
+            return True
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR):   # Si no existe, _escanear lo informa
+                logging.warning(f"⚠️ Sin inotify para {ruta}: {e}")
+            return False
+
+    def _escanear(self, ruta, vigilada):
+        self.escaneos += 1
+        try:
+            mtime = os.stat(ruta).st_mtime
+            entradas = {}
+            with os.scandir(ruta) as it:
+                for entrada in it:
+                    if entrada.name.startswith('.'):
+                        continue
+                    try:
+                        es_dir = entrada.is_dir(follow_symlinks=False)
+                        st = entrada.stat(follow_symlinks=False)
+                    except OSError:
+                        continue   # Borrado entre scandir y stat
+                    entradas[entrada.name] = (es_dir, 0 if es_dir else st.st_size, st.st_mtime)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return _Carpeta(entradas, mtime, vigilada)
+
+    @staticmethod
+    def _ordenar(entradas, campo, desc):
+        nombres = sorted(entradas, key=lambda n: _clave(n, entradas[n], campo)[1:], reverse=desc)
+        # Carpetas primero, en cualquier orden
+        return [n for n in nombres if entradas[n][0]] + [n for n in nombres if not entradas[n][0]]
+
+
+# =========================================================
+# CURSOR DE PAGINACIÓN
+# =========================================================
+def _clave(nombre, entrada, campo):
+    """(grupo, valor, nombre): grupo 0 = carpetas, 1 = archivos (las carpetas, con tamaño 0 acá, quedan por nombre)."""
+    es_dir, tamano, mtime = entrada
+    valor = {'name': nombre, 'size': tamano, 'mtime': mtime}[campo]
+    return (0 if es_dir else 1, valor, nombre)
+
+
+def _primero_despues(orden, entradas, campo, desc, cursor):
+    """Índice del primer nombre de `orden` que va después de la clave `cursor` (búsqueda binaria)."""
+    def despues(nombre):
+        grupo, valor, n = _clave(nombre, entradas[nombre], campo)
+        if grupo != cursor[0]:
+            return grupo > cursor[0]
+        return (valor, n) < tuple(cursor[1:]) if desc else (valor, n) > tuple(cursor[1:])
+
+    bajo, alto = 0, len(orden)
+    while bajo < alto:
+        medio = (bajo + alto) // 2
+        if despues(orden[medio]):
+            alto = medio
+        else:
+            bajo = medio + 1
+    return bajo
+
+
+def _escribir_cursor(clave):
+    return base64.urlsafe_b64encode(json.dumps(clave).encode()).decode().rstrip('=')
+
+
+def _leer_cursor(texto):
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4)))
+        grupo, valor, nombre = clave
+        return int(grupo), valor, str(nombre)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"cursor inválido: {e}")
@@ -0,0 +1,152 @@
+"""
+Logging común para todos los servicios del desalinizador.
+
+Cada servicio llama a `configurar_logging('<servicio>.log')` en lugar de
+copiar el `logging.basicConfig`. Diferencias con el esquema anterior:
+
+- Los handlers (archivo + consola) corren en un hilo aparte detrás de un
+  QueueHandler/QueueListener: quien llama a logging.info() no espera al disco.
+- El archivo sigue en /home/log/YYYY_MM/<servicio>.log, pero la carpeta del
+  mes se recalcula en cada cambio de mes mientras el proceso corre.
+- Límite de frecuencia por punto de llamada (archivo:línea) y muestreo
+  opcional con `extra={'muestreo': N}` (registra 1 de cada N).
+"""
+import os
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+
+LOG_DIR_BASE = '/home/log'
+FORMATO = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Por cada línea de código que loguea: como mucho LIMITE_MENSAJES cada
+# LIMITE_PERIODO_S segundos. CRITICAL nunca se limita.
+LIMITE_MENSAJES = 20
+LIMITE_PERIODO_S = 60.0
+
+
+class ArchivoMensualHandler(logging.FileHandler):
+    """FileHandler que cambia a /base/YYYY_MM/<nombre> cuando empieza un mes nuevo."""
+
+    def __init__(self, base_dir, nombre_archivo, encoding='utf-8'):
+        self.base_dir = base_dir
+        self.nombre_archivo = nombre_archivo
+        self._mes_actual = datetime.now().strftime('%Y_%m')
+        self._proximo_mes = _inicio_mes_siguiente(datetime.now())
+        _crear_carpeta(os.path.join(base_dir, self._mes_actual))
+        super().__init__(self._ruta(), encoding=encoding, delay=True)
+
+    def _ruta(self):
+        return os.path.join(self.base_dir, self._mes_actual, self.nombre_archivo)
+
+    def emit(self, record):
+        if record.created >= self._proximo_mes:
+            self._rotar(datetime.fromtimestamp(record.created))
+        super().emit(record)
+
+    def _rotar(self, ahora):
+        self.acquire()
+        try:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self._mes_actual = ahora.strftime('%Y_%m')
+            self._proximo_mes = _inicio_mes_siguiente(ahora)
+            _crear_carpeta(os.path.join(self.base_dir, self._mes_actual))
+            self.baseFilename = os.path.abspath(self._ruta())
+        finally:
+            self.release()
+
+
+class LimitadorFrecuencia(logging.Filter):
+    """
+    Deja pasar como mucho `maximo` mensajes por `periodo_s` desde cada punto
+    de llamada. Al abrirse una ventana nueva, el primer mensaje indica
+    cuántos se omitieron en la anterior.
+    """
+
+    def __init__(self, maximo=LIMITE_MENSAJES, periodo_s=LIMITE_PERIODO_S):
+        super().__init__()
+        self.maximo = maximo
+        self.periodo_s = periodo_s
+        self._ventanas = {}     # clave -> [inicio_ventana, emitidos, omitidos]
+        self._muestras = {}     # clave -> contador para 'muestreo'
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL:
+            return True
+
+        clave = (record.pathname, record.lineno)
+        with self._lock:
+            # Muestreo explícito: 1 de cada N
+            muestreo = getattr(record, 'muestreo', 1)
+            if muestreo > 1:
+                n = self._muestras.get(clave, 0)
+                self._muestras[clave] = n + 1
+                if n % muestreo:
+                    return False
+
+            ventana = self._ventanas.get(clave)
+            if ventana is None or record.created - ventana[0] >= self.periodo_s:
+                omitidos = ventana[2] if ventana else 0
+                self._ventanas[clave] = [record.created, 1, 0]
+                if omitidos:
+                    record.msg = f"{record.getMessage()} (+{omitidos} mensajes similares omitidos)"
+                    record.args = None
+                return True
+
+            if ventana[1] < self.maximo:
+                ventana[1] += 1
+                return True
+
+            ventana[2] += 1
+            return False
+
+
+def configurar_logging(nombre_archivo, base_dir=LOG_DIR_BASE, nivel=logging.INFO,
+                       maximo=LIMITE_MENSAJES, periodo_s=LIMITE_PERIODO_S):
+    """
+    Configura el logger raíz del servicio y devuelve la ruta del log actual.
+    Ej: configurar_logging('pymqtt-listener.log') -> /home/log/2025_12/pymqtt-listener.log
+    """
+    formato = logging.Formatter(FORMATO)
+
+    archivo = ArchivoMensualHandler(base_dir, nombre_archivo)
+    archivo.setFormatter(formato)
+    consola = logging.StreamHandler()   # Mostrar en consola (systemd)
+    consola.setFormatter(formato)
+
+    cola = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(cola, archivo, consola, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    handler_cola = logging.handlers.QueueHandler(cola)
+    handler_cola.addFilter(LimitadorFrecuencia(maximo, periodo_s))
+
+    raiz = logging.getLogger()
+    for h in list(raiz.handlers):
+        raiz.removeHandler(h)
+    raiz.addHandler(handler_cola)
+    raiz.setLevel(nivel)
+
+    return archivo.baseFilename
+
+
+def _inicio_mes_siguiente(fecha):
+    # Se arma el día 1 directamente: con replace(month=...) el 31/01 daría 31/02
+    anio, mes = (fecha.year + 1, 1) if fecha.month == 12 else (fecha.year, fecha.month + 1)
+    return datetime(anio, mes, 1).timestamp()
+
+
+def _crear_carpeta(ruta):
+    if not os.path.exists(ruta):
+        try:
+            os.makedirs(ruta, exist_ok=True)
+            print(f"📁 Carpeta de logs mensuales creada: {ruta}")
+        except OSError as e:
+            print(f"CRITICAL ERROR: No se pudo crear directorio de logs {ruta}: {e}")
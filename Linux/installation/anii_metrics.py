@@ -0,0 +1,210 @@
+"""
+Métricas en formato de texto de Prometheus, sin dependencias externas
+(compartido por pymqtt-listener.py y el SCADA).
+
+    metricas = RegistroMetricas()
+    mensajes = metricas.contador('anii_mensajes_total', 'Mensajes MQTT', ['topic'])
+    mensajes.inc('measure/radiation')
+    latencia = metricas.histograma('anii_parseo_segundos', 'Parseo', ['topic'])
+    latencia.observar(0.00012, 'measure/radiation')
+    metricas.medidor('anii_cola', 'Mensajes en cola', funcion=lambda: cola.qsize())
+    texto = metricas.exponer()      # GET /metrics
+
+Registrar cuesta un lock y una suma (o una búsqueda binaria en los
+límites del histograma), así que se puede dejar siempre activo. Los
+valores que ya existen en otro lado (contadores del escritor, profundidad
+de la cola) se leen con `funcion` solo cuando alguien consulta /metrics.
+`funcion` devuelve un número o {(valores de etiquetas): número}.
+"""
+import os
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites por defecto de los histogramas de latencia (segundos)
+LIMITES_LATENCIA = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _muestras(self):
+        """[(sufijo, {etiqueta: valor}, número), ...] para exponer()."""
+        if self.funcion is not None:
+            resultado = self.funcion()
+            if not isinstance(resultado, dict):
+                resultado = {(): resultado}
+        else:
+            with self._lock:
+                resultado = dict(self._valores)
+        return [('', dict(zip(self.etiquetas, clave)), valor) for clave, valor in resultado.items()]
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for sufijo, etiquetas, valor in self._muestras():
+            lineas.append(f"{self.nombre}{sufijo}{_etiquetas(etiquetas)} {_numero(valor)}")
+        return lineas
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, *etiquetas, n=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + n
+
+
+class Medidor(_Metrica):
+    tipo = 'gauge'
+
+    def fijar(self, valor, *etiquetas):
+        with self._lock:
+            self._valores[etiquetas] = valor
+
+    def inc(self, *etiquetas, n=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + n
+
+    def dec(self, *etiquetas, n=1):
+        self.inc(*etiquetas, n=-n)
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor, *etiquetas):
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._valores.get(etiquetas)
+            if serie is None:
+                # [conteos por límite (+Inf al final), suma, cantidad]
+                serie = self._valores[etiquetas] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def _muestras(self):
+        with self._lock:
+            copia = {clave: (list(s[0]), s[1], s[2]) for clave, s in self._valores.items()}
+        muestras = []
+        for clave, (conteos, suma, cantidad) in copia.items():
+            etiquetas = dict(zip(self.etiquetas, clave))
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (float('inf'),), conteos):
+                acumulado += conteo
+                muestras.append(('_bucket', dict(etiquetas, le=_numero(limite)), acumulado))
+            muestras.append(('_sum', etiquetas, suma))
+            muestras.append(('_count', etiquetas, cantidad))
+        return muestras
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+        self._lock = threading.Lock()
+
+    def _agregar(self, metrica):
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._agregar(Contador(nombre, ayuda, etiquetas, funcion))
+
+    def medidor(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._agregar(Medidor(nombre, ayuda, etiquetas, funcion))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def exponer(self):
+        """Texto para GET /metrics. Una métrica que falla no corta las demás."""
+        with self._lock:
+            metricas = list(self._metricas)
+        lineas = []
+        for metrica in metricas:
+            try:
+                lineas.extend(metrica.exponer())
+            except Exception as e:
+                logging.error(f"❌ Error en métrica {metrica.nombre}: {e}")
+        return '\n'.join(lineas) + '\n'
+
+
+def archivos_abiertos_proceso():
+    """Descriptores abiertos por este proceso (Linux)."""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return 0
+
+
+def arranque_proceso():
+    """(segundos desde el booteo hasta que arrancó este proceso, segundos que lleva corriendo) (Linux)."""
+    try:
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        with open('/proc/self/stat') as f:
+            # El nombre (campo 2) puede tener espacios: se corta después del ')'
+            campos = f.read().rsplit(')', 1)[1].split()
+        inicio = int(campos[19]) / os.sysconf('SC_CLK_TCK')   # starttime (campo 22)
+        return inicio, uptime - inicio
+    except (OSError, ValueError, IndexError):
+        return 0.0, 0.0
+
+
+def servir_metricas(registro, puerto, host='127.0.0.1'):
+    """Exportador HTTP en un hilo aparte: GET /metrics en host:puerto."""
+
+    class _Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            cuerpo = registro.exponer().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', TIPO_CONTENIDO)
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass   # Cada consulta no va al log
+
+    servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    partes = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{clave}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    if isinstance(valor, float):
+        return repr(valor)
+    return str(valor)
@@ -0,0 +1,276 @@
+"""
+Tópicos, encabezados y formato de los payloads MQTT (compartido por
+pymqtt-listener.py y el SCADA).
+
+Se aceptan tres formatos en cualquier tópico:
+
+1. Texto de una muestra (el histórico de la unidad de control):
+       "25.50,60.00,1013.20"
+   opcionalmente con la hora del dispositivo en epoch ms:
+       "25.50,60.00,1013.20@1765432100123"
+
+2. Lote JSON (versión 1). Cada muestra es [epoch_ms, v1, v2, ...]; si se
+   indica "t0", el primer elemento es un desfasaje en ms desde t0:
+       {"v": 1, "s": [[1765432100000, 25.5, 60.0, 1013.2], ...]}
+       {"v": 1, "t0": 1765432100000, "s": [[0, 120.0], [250, 121.5], ...]}
+
+3. Lote binario (versión 1), little-endian:
+       uint8 0xB1 | uint8 columnas | uint16 muestras | int64 t0_ms
+       y por muestra: uint32 dt_ms | float32 x columnas
+
+`decodificar_payload()` devuelve siempre [(ts_ms o None, [valores]), ...];
+ts_ms es None cuando el dispositivo no mandó hora (usar la de recepción).
+
+Esquemas por tópico
+-------------------
+`RegistroEsquemas` arma, a partir de HEADERS, un parser por tópico que
+convierte cada valor a su tipo (float o int) una sola vez y rechaza las
+muestras con otra cantidad de columnas, valores no numéricos o no finitos
+(nan, inf) y horas que no son un entero finito. Cualquier error al
+decodificar o convertir sale como ErrorPayload (nunca otra excepción). Lleva
+contadores de aceptados/rechazados y la latencia de parseo por tópico
+(y la registra en un Histograma de anii_metrics.py si se le pasa uno).
+Los floats que llegan como texto conservan el texto original
+(NumeroTexto), para que el CSV siga guardando "25.50" y no "25.5".
+"""
+import json
+import math
+import time
+import struct
+import threading
+
+# Lista de tópicos a escuchar -> nombre de la variable (y del CSV)
+TOPICS = {
+    # Sensores
+    "measure/environment":   "environment",
+    "measure/radiation":     "radiation",
+    "measure/temperature":   "temperature",
+    "measure/level_in":      "level_in",
+    "measure/level_out":     "level_out",
+    "measure/chamber_level": "chamber_level", # Agregado para evitar warnings
+    
+    # Control (Eventos)
+    "control/in_valve":      "control_in",
+    "control/out_valve":     "control_out",
+    "control/process":       "control_process"
+}
+
+# Definición de Encabezados CSV
+HEADERS = {
+    'environment':   ['Time', 'Amb_Temp(°C)', 'Humidity(%)', 'Pressure(hPa)'],
+    'radiation':     ['Time', 'Radiation(W/m^2)'],
+    'temperature':   ['Time', 'Internal_Temp(°C)'],
+    'level_in':      ['Time', 'Weight(kg)', 'Distance(cm)', 'Volume(ml)'],
+    'level_out':     ['Time', 'Weight(kg)', 'Distance(cm)', 'Volume(ml)'],
+    'chamber_level': ['Time', 'Volume(ml)'],
+    
+    'control_in':      ['Time', 'State(1=OPEN/0=CLOSE)'],
+    'control_out':     ['Time', 'State(1=OPEN/0=CLOSE)'],
+    'control_process': ['Time', 'State(1=START/0=STOP)']
+}
+
+# Variables cuyos valores son enteros (estados); el resto es float
+VARIABLES_ENTERAS = {'control_in', 'control_out', 'control_process'}
+
+MARCA_BINARIO_V1 = 0xB1
+CABECERA_LOTE = struct.Struct('<BBHq')
+
+
+def decodificar_payload(payload):
+    """Decodifica bytes (o str) en una lista de muestras (ts_ms | None, valores)."""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if not payload:
+        return []
+
+    if payload[0] == MARCA_BINARIO_V1:
+        return _decodificar_binario(payload)
+
+    texto = payload.decode().strip()
+    if texto.startswith('{'):
+        return _decodificar_json(texto)
+
+    datos, arroba, marca = texto.rpartition('@')
+    if arroba:
+        try:
+            return [(int(marca), datos.split(','))]
+        except ValueError:
+            return [(None, datos.split(','))]
+    return [(None, texto.split(','))]
+
+
+def _decodificar_json(texto):
+    lote = json.loads(texto)
+    if lote.get('v') != 1:
+        raise ValueError(f"Versión de lote no soportada: {lote.get('v')}")
+
+    t0 = lote.get('t0')
+    muestras = []
+    for muestra in lote.get('s', []):
+        if not muestra:
+            continue
+        ts = muestra[0]
+        if ts is not None:
+            # int() de Infinity/NaN lanza OverflowError/ValueError: parsear() los rechaza
+            ts = int(ts) + (int(t0) if t0 is not None else 0)
+        muestras.append((ts, list(muestra[1:])))
+    return muestras
+
+
+def _decodificar_binario(payload):
+    if len(payload) < CABECERA_LOTE.size:
+        raise ValueError("Lote binario incompleto")
+    _, columnas, cantidad, t0 = CABECERA_LOTE.unpack_from(payload)
+
+    formato = struct.Struct('<I' + 'f' * columnas)
+    esperado = CABECERA_LOTE.size + cantidad * formato.size
+    if len(payload) < esperado:
+        raise ValueError(f"Lote binario incompleto: {len(payload)} de {esperado} bytes")
+
+    return [(t0 + dt, list(valores))
+            for dt, *valores in formato.iter_unpack(payload[CABECERA_LOTE.size:esperado])]
+
+
+def codificar_lote_json(muestras, t0=None):
+    """muestras = [(epoch_ms, [valores]), ...] -> str del lote JSON v1."""
+    if t0 is None:
+        s = [[ts] + list(valores) for ts, valores in muestras]
+        return json.dumps({'v': 1, 's': s}, separators=(',', ':'))
+    s = [[ts - t0] + list(valores) for ts, valores in muestras]
+    return json.dumps({'v': 1, 't0': t0, 's': s}, separators=(',', ':'))
+
+
+def codificar_lote_binario(muestras):
+    """muestras = [(epoch_ms, [valores]), ...] (misma cantidad de valores) -> bytes."""
+    if not muestras:
+        return b''
+    t0 = muestras[0][0]
+    columnas = len(muestras[0][1])
+    formato = struct.Struct('<I' + 'f' * columnas)
+    partes = [CABECERA_LOTE.pack(MARCA_BINARIO_V1, columnas, len(muestras), t0)]
+    partes.extend(formato.pack(ts - t0, *valores) for ts, valores in muestras)
+    return b''.join(partes)
+
+
+# =========================================================
+# ESQUEMAS POR TÓPICO
+# =========================================================
+class ErrorPayload(ValueError):
+    """Payload que no respeta el esquema de su tópico."""
+
+
+def _a_entero(valor):
+    return int(float(valor))
+
+
+class NumeroTexto(float):
+    """float que se escribe (str/repr, y por lo tanto en el CSV) tal como llegó en el payload."""
+
+    def __new__(cls, texto):
+        numero = super().__new__(cls, texto)
+        numero.texto = texto.strip()
+        return numero
+
+    def __repr__(self):
+        return self.texto
+
+    __str__ = __repr__
+
+
+def _a_float(valor):
+    return NumeroTexto(valor) if isinstance(valor, str) else float(valor)
+
+
+class EsquemaTopico:
+    """Parser precompilado de un tópico: cantidad de columnas y tipo de cada una."""
+
+    def __init__(self, topic, variable, encabezado, entero=False):
+        self.topic = topic
+        self.variable = variable
+        self.columnas = len(encabezado) - 1
+        self.conversores = tuple([_a_entero if entero else _a_float] * self.columnas)
+
+        self.aceptados = 0
+        self.rechazados = 0
+        self.latencia_total_s = 0.0
+        self.latencia_max_s = 0.0
+
+    def convertir(self, valores):
+        if len(valores) != self.columnas:
+            raise ErrorPayload(f"se esperaban {self.columnas} valores y llegaron {len(valores)}")
+        try:
+            convertidos = [conv(v) for conv, v in zip(self.conversores, valores)]
+        except (TypeError, ValueError, OverflowError):
+            raise ErrorPayload(f"valor no numérico en {valores!r}")
+        if not all(map(math.isfinite, convertidos)):
+            raise ErrorPayload(f"valor no finito en {valores!r}")
+        return convertidos
+
+    def parsear(self, payload):
+        """Devuelve [(ts_ms | None, [valores tipados]), ...] o lanza ErrorPayload."""
+        try:
+            muestras = decodificar_payload(payload)
+        except Exception as e:
+            # json/struct/int() pueden lanzar casi cualquier cosa (p.ej.
+            # OverflowError con Infinity): para el que llama es un payload inválido
+            raise ErrorPayload(f"{type(e).__name__}: {e}")
+        if not muestras:
+            raise ErrorPayload("payload vacío")
+        return [(_ts_valido(ts), self.convertir(valores)) for ts, valores in muestras]
+
+
+def _ts_valido(ts):
+    if ts is not None and type(ts) is not int:
+        raise ErrorPayload(f"hora inválida: {ts!r}")
+    return ts
+
+
+class RegistroEsquemas:
+    """Esquemas de todos los tópicos + contadores (seguro entre hilos)."""
+
+    def __init__(self, topics=TOPICS, encabezados=HEADERS, enteras=VARIABLES_ENTERAS, histograma=None):
+        self._lock = threading.Lock()
+        self.histograma = histograma    # .observar(segundos, topic)
+        self.esquemas = {
+            topic: EsquemaTopico(topic, variable, encabezados.get(variable, ['Time', 'Value']),
+                                 entero=variable in enteras)
+            for topic, variable in topics.items()
+        }
+
+    def obtener(self, topic):
+        return self.esquemas.get(topic)
+
+    def parsear(self, topic, payload):
+        """
+        Parsea el payload según el esquema del tópico y actualiza contadores.
+        Lanza KeyError si el tópico no tiene esquema y ErrorPayload si es inválido.
+        """
+        esquema = self.esquemas[topic]
+        inicio = time.perf_counter()
+        try:
+            muestras = esquema.parsear(payload)
+        except ErrorPayload:
+            with self._lock:
+                esquema.rechazados += 1
+            raise
+        latencia = time.perf_counter() - inicio
+        with self._lock:
+            esquema.aceptados += 1
+            esquema.latencia_total_s += latencia
+            if latencia > esquema.latencia_max_s:
+                esquema.latencia_max_s = latencia
+        if self.histograma is not None:
+            self.histograma.observar(latencia, topic)
+        return muestras
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                topic: {
+                    'aceptados': e.aceptados,
+                    'rechazados': e.rechazados,
+                    'latencia_media_us': round(1e6 * e.latencia_total_s / e.aceptados, 1) if e.aceptados else 0.0,
+                    'latencia_max_us': round(1e6 * e.latencia_max_s, 1),
+                }
+                for topic, e in self.esquemas.items()
+            }
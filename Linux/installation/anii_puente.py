@@ -0,0 +1,134 @@
+"""
+Puente MQTT por socket Unix (compartido por mqtt-bridge.py y el SCADA).
+
+Un solo proceso (mqtt-bridge.py) mantiene la conexión con el broker y
+reenvía cada mensaje a todos los procesos conectados al socket, así el
+SCADA puede correr varios workers web sin una conexión MQTT por worker.
+Los workers también publican (comandos) a través del puente.
+
+    cliente = ClientePuente('/run/anii-mqtt.sock', desde=time.time() - 60)
+    cliente.on_message = on_message      # (cliente, userdata, msg) como en paho
+    cliente.loop_forever()               # Conecta, recibe y reconecta
+    cliente.publish('control/process', '1', qos=1)
+
+Al conectarse, el worker manda '$puente/desde' (epoch s). El puente
+responde con el último mensaje de cada tópico y los mensajes recientes
+recibidos después de `desde`, marcados como repetición, y recién después
+con los nuevos. Tras un corte el cliente pide desde el último mensaje
+que procesó, así que no se pierde nada que siga en el buffer del puente.
+
+Trama (en los dos sentidos), little-endian:
+    f64 hora de recepción (epoch s) | u8 banderas | u16 largo del tópico |
+    u32 largo del payload | tópico UTF-8 | payload
+Banderas: REPETICION (del buffer del puente), y en las publicaciones del
+worker los dos bits bajos de QOS_MASCARA son el QoS pedido.
+"""
+import time
+import socket
+import struct
+import logging
+import threading
+
+CABECERA = struct.Struct('<dBHI')
+
+REPETICION = 0x04
+QOS_MASCARA = 0x03
+
+TOPICO_DESDE = '$puente/desde'
+
+
+def trama(topico, payload, recibido=0.0, banderas=0):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    crudo = topico.encode()
+    return CABECERA.pack(recibido, banderas, len(crudo), len(payload)) + crudo + payload
+
+
+def leer_trama(lector):
+    """(recibido, banderas, tópico, payload) de un archivo de socket (makefile('rb')); None si se cerró."""
+    cabecera = lector.read(CABECERA.size)
+    if len(cabecera) < CABECERA.size:
+        return None
+    recibido, banderas, largo_topico, largo_payload = CABECERA.unpack(cabecera)
+    cuerpo = lector.read(largo_topico + largo_payload)
+    if len(cuerpo) < largo_topico + largo_payload:
+        return None
+    return recibido, banderas, cuerpo[:largo_topico].decode(), cuerpo[largo_topico:]
+
+
+class Mensaje:
+    """Lo que on_message necesita de un MQTTMessage de paho, más la hora de recepción en el puente."""
+    __slots__ = ('topic', 'payload', 'recibido', 'repeticion')
+
+    def __init__(self, topic, payload, recibido, repeticion=False):
+        self.topic = topic
+        self.payload = payload
+        self.recibido = recibido
+        self.repeticion = repeticion
+
+
+class ClientePuente:
+    """Cliente del puente con la forma de paho (on_message, publish, loop_forever)."""
+
+    def __init__(self, ruta, desde=None, reintento_s=2):
+        self.ruta = ruta
+        self.desde = desde if desde is not None else time.time()
+        self.reintento_s = reintento_s
+        self.on_message = None
+        self.on_connect = None          # (cliente, userdata, flags, rc) al conectar con el puente
+        self.conectado = False
+        self._sock = None
+        self._lock = threading.Lock()   # Un solo escritor por vez en el socket
+
+    def publish(self, topic, payload, qos=0):
+        """True si se entregó al puente (que publica en el broker con ese QoS)."""
+        datos = trama(topic, str(payload) if not isinstance(payload, (bytes, str)) else payload,
+                      time.time(), qos & QOS_MASCARA)
+        with self._lock:
+            if self._sock is None:
+                return False
+            try:
+                self._sock.sendall(datos)
+                return True
+            except OSError as e:
+                logging.warning(f"⚠️ No se pudo publicar {topic} por el puente: {e}")
+                return False
+
+    def loop_forever(self):
+        while True:
+            try:
+                self._atender()
+            except OSError as e:
+                if self.conectado:
+                    logging.warning(f"⚠️ Puente MQTT desconectado: {e}")
+                else:
+                    logging.debug(f"Puente MQTT no disponible ({self.ruta}): {e}")
+            finally:
+                with self._lock:
+                    if self._sock is not None:
+                        self._sock.close()
+                    self._sock = None
+                self.conectado = False
+            time.sleep(self.reintento_s)
+
+    def _atender(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.ruta)
+        with self._lock:
+            self._sock = sock
+            sock.sendall(trama(TOPICO_DESDE, repr(self.desde)))
+        self.conectado = True
+        logging.info(f"✅ Conectado al puente MQTT ({self.ruta})")
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+        lector = sock.makefile('rb')
+        while True:
+            leido = leer_trama(lector)
+            if leido is None:
+                raise ConnectionError("el puente cerró la conexión")
+            recibido, banderas, topico, payload = leido
+            # Desde dónde pedir si se corta (lo de antes ya se procesó)
+            self.desde = max(self.desde, recibido)
+            if self.on_message:
+                self.on_message(self, None, Mensaje(topico, payload, recibido, bool(banderas & REPETICION)))
@@ -0,0 +1,1159 @@
+"""
+Destinos de almacenamiento de las mediciones (usados por pymqtt-listener.py)
+y funciones de lectura para el resto de los servicios.
+
+Todos los destinos guardan en /home/log/YYYY_MM_DD/ y comparten la misma
+interfaz, para que el hilo escritor del listener los trate igual:
+
+    escribir_filas(nombre_variable, filas)   # filas = [(ts_s, rx_s, [valores]), ...]
+    cerrar_lote()                            # fin de cada lote del escritor
+    vaciar(fsync=False)
+    cerrar_todos() / reiniciar() / cantidad_abiertos()
+
+`ts_s` es la hora de la muestra (la del dispositivo si vino en el payload)
+y `rx_s` la hora de recepción en el listener, ambas en epoch con decimales.
+
+Los CSV agregan al final la columna 'Epoch_ms' (hora de la muestra en epoch
+ms) para ordenar y cruzar variables sin reconstruir fechas desde 'Time'.
+
+Formato binario (YYYY_MM_DD_<variable>.bin)
+-------------------------------------------
+Cabecera de 16 bytes: b'ANIIBIN1', uint16 columnas, uint16 bytes por valor
+(4 = float32, 8 = float64) y 4 bytes reservados. Después, registros de
+ancho fijo little-endian: int64 epoch en ms + un float por columna de
+HEADERS (sin 'Time'). Se puede abrir sin parsear con `abrir_memmap()` o
+buscar por timestamp con `buscar_indice()` (búsqueda binaria, sin numpy).
+
+Base SQLite (AlmacenSQLite)
+---------------------------
+Una tabla por variable (environment, radiation, ...) con `ts_ms` indexado y
+una columna REAL por cada columna de HEADERS. Modo WAL: los lectores
+(SCADA, exportaciones, análisis) no bloquean al escritor. Los CSV diarios
+se generan desde la base con `exportar_csv()`.
+
+Resúmenes (AlmacenResumenes)
+----------------------------
+Agregados por variable calculados al ingresar cada muestra, en
+/home/log/rollups/YYYY_MM_DD/YYYY_MM_DD_<variable>_<1m|15m|1h>.csv:
+
+    Time, Epoch_ms, Count, <col>_min, <col>_max, <col>_mean, <col>_last, ...
+
+Una fila por intervalo cerrado (alineado a la hora local), escrita cuando
+llega una muestra posterior al fin del intervalo + `margen_s` o cuando la
+variable deja de reportar. Para gráficos de días/semanas se leen con
+`leer_resumenes()` (un punto por intervalo, sin recorrer las muestras) y se
+combinan con `agregar_resumenes()`. `recalcular_resumenes()` los rehace
+desde los CSV crudos (días previos a activarlos o tras un corte de luz).
+
+Lectura incremental de CSV (LectorCSV)
+--------------------------------------
+Parsea un CSV diario una vez en todas sus columnas y después solo los
+bytes agregados al final (caché por ruta, validada con inodo y tamaño).
+
+Historial en memoria (BufferCircular)
+-------------------------------------
+Últimas N muestras (epoch s, valor) de una variable en dos array('d')
+prealocados, para que el SCADA responda /api/history sin releer archivos.
+Cada muestra queda numerada (1, 2, ...): con el último número visto un
+cliente pide solo lo posterior (`desde_secuencia()`), en O(1).
+
+Reducción de puntos
+-------------------
+`reducir_lttb()` (Largest-Triangle-Three-Buckets, conserva la forma de la
+curva) y `reducir_minmax()` (mínimo y máximo por tramo, conserva picos)
+bajan una serie a N puntos para graficar; `agrupar_resumenes()` hace lo
+mismo con intervalos de resúmenes, exacto para min/max/media.
+"""
+import os
+import re
+import csv
+import math
+import time
+import struct
+import sqlite3
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+MAX_ARCHIVOS_ABIERTOS = 16
+
+MAGIA_BINARIO = b'ANIIBIN1'
+CABECERA_BINARIO = struct.Struct('<8sHHI')
+
+# Resoluciones de los resúmenes: etiqueta -> segundos
+RESOLUCIONES_RESUMEN = {'1m': 60, '15m': 900, '1h': 3600}
+CAMPOS_RESUMEN = ('min', 'max', 'mean', 'last')
+
+
+# =========================================================
+# BASE: UN ARCHIVO ABIERTO POR (DÍA, VARIABLE)
+# =========================================================
+class _RegistroDiario:
+    """
+    Mantiene abierto un archivo por (día, variable) para no pagar
+    open/stat/close en cada mensaje. Los archivos menos usados se cierran
+    al superar `max_abiertos` y los de días anteriores al empezar uno nuevo.
+    Las subclases definen `extension`, `_abrir_archivo` y `_escribir`.
+    """
+
+    extension = None
+
+    def __init__(self, base_dir, max_abiertos=MAX_ARCHIVOS_ABIERTOS):
+        self.base_dir = base_dir
+        self.max_abiertos = max_abiertos
+        self._abiertos = OrderedDict()   # (dia, variable) -> entrada (con .archivo)
+        self._dia_actual = None
+        self._dia_mas_reciente = None
+        self._inicio_dia = 0.0
+        self._fin_dia = 0.0
+
+    def _dia_de(self, ts):
+        """Carpeta 'YYYY_MM_DD' del timestamp (cacheada mientras no cambie el día)."""
+        if self._inicio_dia <= ts < self._fin_dia:
+            return self._dia_actual
+
+        inicio = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._inicio_dia = inicio.timestamp()
+        self._fin_dia = (inicio + timedelta(days=1)).timestamp()
+        self._dia_actual = inicio.strftime('%Y_%m_%d')
+
+        if self._dia_mas_reciente is None or self._dia_actual > self._dia_mas_reciente:
+            # Día nuevo: cerrar lo de días anteriores
+            self._dia_mas_reciente = self._dia_actual
+            for clave in [c for c in self._abiertos if c[0] != self._dia_actual]:
+                self._abiertos.pop(clave).archivo.close()
+
+        # Verificar/Crear Directorio del DÍA (dentro de la base)
+        # Ej: /home/log/2025_12_11/
+        daily_dir = os.path.join(self.base_dir, self._dia_actual)
+        if not os.path.exists(daily_dir):
+            os.makedirs(daily_dir, exist_ok=True)
+            logging.info(f"📂 Carpeta de datos diaria creada: {daily_dir}")
+        return self._dia_actual
+
+    def _obtener(self, dia, nombre_variable):
+        clave = (dia, nombre_variable)
+        entrada = self._abiertos.get(clave)
+        if entrada is not None:
+            self._abiertos.move_to_end(clave)
+            return entrada
+
+        # Cerrar el menos usado si se alcanzó el límite
+        while len(self._abiertos) >= self.max_abiertos:
+            _, vieja = self._abiertos.popitem(last=False)
+            vieja.archivo.close()
+
+        ruta = os.path.join(self.base_dir, dia, f"{dia}_{nombre_variable}{self.extension}")
+        entrada = self._abrir_archivo(ruta, nombre_variable)
+        self._abiertos[clave] = entrada
+        return entrada
+
+    def escribir_filas(self, nombre_variable, filas):
+        for ts, _, valores in filas:
+            entrada = self._obtener(self._dia_de(ts), nombre_variable)
+            self._escribir(entrada, ts, valores)
+
+    def cerrar_lote(self):
+        pass
+
+    def vaciar(self, fsync=False):
+        """Pasa los buffers de Python al SO y opcionalmente a disco."""
+        for entrada in self._abiertos.values():
+            entrada.archivo.flush()
+            if fsync:
+                os.fsync(entrada.archivo.fileno())
+
+    def cerrar_todos(self):
+        for entrada in self._abiertos.values():
+            try:
+                entrada.archivo.close()
+            except OSError as e:
+                logging.error(f"❌ Error cerrando archivo {entrada.archivo.name}: {e}")
+        self._abiertos.clear()
+
+    def reiniciar(self):
+        """Cierra todo y fuerza a recrear carpeta y archivos en la próxima escritura."""
+        self.cerrar_todos()
+        self._inicio_dia = self._fin_dia = 0.0
+
+    def cantidad_abiertos(self):
+        return len(self._abiertos)
+
+    def _abrir_archivo(self, ruta, nombre_variable):
+        raise NotImplementedError
+
+    def _escribir(self, entrada, ts, valores):
+        raise NotImplementedError
+
+
+class _Entrada:
+    __slots__ = ('archivo', 'writer', 'formato', 'columnas', 'ultimo_ms', 'con_epoch')
+
+    def __init__(self, archivo, writer=None, formato=None, columnas=0, ultimo_ms=None, con_epoch=True):
+        self.archivo = archivo
+        self.writer = writer
+        self.formato = formato
+        self.columnas = columnas
+        self.ultimo_ms = ultimo_ms
+        self.con_epoch = con_epoch
+
+
+# =========================================================
+# CSV DIARIO (formato histórico, lo leen MATLab y los uploaders)
+# =========================================================
+class RegistroCSV(_RegistroDiario):
+    """
+    Escribe /home/log/YYYY_MM_DD/YYYY_MM_DD_<variable>.csv con su cabecera.
+    Cada fila se ajusta a las columnas de la cabecera para que 'Epoch_ms'
+    quede siempre en la última columna. Un archivo que ya existía con la
+    cabecera anterior (sin 'Epoch_ms', p.ej. el del día de la actualización)
+    se sigue escribiendo con ese formato, sin filas de distinto largo.
+    """
+
+    extension = '.csv'
+
+    def __init__(self, base_dir, encabezados, max_abiertos=MAX_ARCHIVOS_ABIERTOS):
+        super().__init__(base_dir, max_abiertos)
+        self.encabezados = encabezados
+
+    def _abrir_archivo(self, ruta, nombre_variable):
+        archivo = open(ruta, 'a', newline='')
+        writer = csv.writer(archivo)
+
+        encabezado = self.encabezados.get(nombre_variable, ['Time', 'Value'])
+
+        # Escribir cabecera solo si el archivo es nuevo
+        if archivo.tell() == 0:
+            writer.writerow(encabezado + ['Epoch_ms'])
+            return _Entrada(archivo, writer=writer, columnas=len(encabezado) - 1)
+
+        # Ya existía: se respeta su cabecera
+        with open(ruta, newline='') as existente:
+            previo = next(csv.reader(existente), None) or encabezado + ['Epoch_ms']
+        con_epoch = previo[-1:] == ['Epoch_ms']
+        return _Entrada(archivo, writer=writer, columnas=len(previo) - 1 - con_epoch, con_epoch=con_epoch)
+
+    def _escribir(self, entrada, ts, valores):
+        if len(valores) != entrada.columnas:
+            valores = (valores + [''] * entrada.columnas)[:entrada.columnas]
+        fila = [time.strftime('%H:%M:%S', time.localtime(ts))] + valores
+        if entrada.con_epoch:
+            fila.append(int(ts * 1000))
+        entrada.writer.writerow(fila)
+
+
+# =========================================================
+# BINARIO COLUMNAR DE ANCHO FIJO
+# =========================================================
+class AlmacenBinario(_RegistroDiario):
+    """
+    Escribe /home/log/YYYY_MM_DD/YYYY_MM_DD_<variable>.bin con registros de
+    ancho fijo. `columnas` = {variable: cantidad de valores por muestra}.
+    Los valores no numéricos o faltantes se guardan como NaN.
+    """
+
+    extension = '.bin'
+
+    def __init__(self, base_dir, columnas, tam_valor=4, max_abiertos=MAX_ARCHIVOS_ABIERTOS):
+        super().__init__(base_dir, max_abiertos)
+        if tam_valor not in (4, 8):
+            raise ValueError(f"Tamaño de valor no soportado: {tam_valor}")
+        self.columnas = columnas
+        self.tam_valor = tam_valor
+
+    def _abrir_archivo(self, ruta, nombre_variable):
+        archivo = open(ruta, 'ab')
+        tamano = archivo.tell()
+
+        if tamano == 0:
+            ncols = self.columnas.get(nombre_variable, 1)
+            archivo.write(CABECERA_BINARIO.pack(MAGIA_BINARIO, ncols, self.tam_valor, 0))
+            tam_valor = self.tam_valor
+        else:
+            # Respetar el formato con que se creó el archivo
+            ncols, tam_valor = leer_cabecera(ruta)
+            formato = formato_registro(ncols, tam_valor)
+            sobrante = (tamano - CABECERA_BINARIO.size) % formato.size
+            if sobrante:
+                # Registro incompleto (corte de luz a mitad de escritura)
+                archivo.truncate(tamano - sobrante)
+                logging.warning(f"⚠️ Registro incompleto descartado al final de {ruta}")
+
+        return _Entrada(archivo, formato=formato_registro(ncols, tam_valor), columnas=ncols)
+
+    def _escribir(self, entrada, ts, valores):
+        numeros = []
+        for v in valores[:entrada.columnas]:
+            try:
+                numeros.append(float(v))
+            except (TypeError, ValueError):
+                numeros.append(math.nan)
+        numeros.extend([math.nan] * (entrada.columnas - len(numeros)))
+        entrada.archivo.write(entrada.formato.pack(int(ts * 1000), *numeros))
+
+
+# =========================================================
+# RESÚMENES INCREMENTALES (1 MIN / 15 MIN / 1 HORA)
+# =========================================================
+class _Intervalo:
+    __slots__ = ('inicio', 'cantidad', 'minimos', 'maximos', 'sumas', 'ultimos')
+
+    def __init__(self, inicio, valores):
+        self.inicio = inicio
+        self.cantidad = 1
+        self.minimos = list(valores)
+        self.maximos = list(valores)
+        self.sumas = list(valores)
+        self.ultimos = valores
+
+    def agregar(self, valores):
+        self.cantidad += 1
+        for i, v in enumerate(valores):
+            if v < self.minimos[i]:
+                self.minimos[i] = v
+            if v > self.maximos[i]:
+                self.maximos[i] = v
+            self.sumas[i] += v
+        self.ultimos = valores
+
+
+class AlmacenResumenes(_RegistroDiario):
+    """
+    Mantiene min/max/media/cantidad/último por variable y resolución y
+    escribe cada intervalo al cerrarse. `encabezados` = HEADERS.
+
+    Un intervalo se cierra cuando la variable trae una muestra posterior a
+    su fin + `margen_s` (tolera muestras de lotes levemente desordenadas)
+    o cuando la variable no recibe nada durante `inactividad_s` y el
+    intervalo ya terminó. Las muestras de intervalos ya escritos se
+    cuentan en `tardias` y no se agregan.
+    """
+
+    extension = '.csv'
+
+    def __init__(self, base_dir, encabezados, resoluciones=RESOLUCIONES_RESUMEN, margen_s=10.0,
+                 inactividad_s=120.0, max_abiertos=MAX_ARCHIVOS_ABIERTOS):
+        super().__init__(base_dir, max_abiertos)
+        self.encabezados = encabezados
+        self.resoluciones = resoluciones
+        self.margen_s = margen_s
+        self.inactividad_s = inactividad_s
+        self._intervalos = {}    # (variable, etiqueta) -> {inicio: _Intervalo}
+        self._ts_max = {}        # variable -> hora de la muestra más reciente
+        self._actividad = {}     # variable -> time.monotonic() de la última fila
+        self.tardias = 0
+
+    def escribir_filas(self, nombre_variable, filas):
+        for ts, _, valores in filas:
+            try:
+                numeros = [float(v) for v in valores]
+            except (TypeError, ValueError):
+                continue
+            self._dia_de(ts)
+            inicio_dia = self._inicio_dia
+            for etiqueta, segundos in self.resoluciones.items():
+                inicio = inicio_dia + (ts - inicio_dia) // segundos * segundos
+                abiertos = self._intervalos.setdefault((nombre_variable, etiqueta), {})
+                intervalo = abiertos.get(inicio)
+                if intervalo is None:
+                    abiertos[inicio] = _Intervalo(inicio, numeros)
+                else:
+                    intervalo.agregar(numeros)
+            if ts > self._ts_max.get(nombre_variable, 0.0):
+                self._ts_max[nombre_variable] = ts
+        self._actividad[nombre_variable] = time.monotonic()
+
+    def cerrar_lote(self):
+        ahora = time.time()
+        inactivo_desde = time.monotonic() - self.inactividad_s
+        for (nombre_variable, etiqueta), abiertos in self._intervalos.items():
+            segundos = self.resoluciones[etiqueta]
+            limite = self._ts_max.get(nombre_variable, 0.0) - self.margen_s
+            if self._actividad.get(nombre_variable, 0.0) <= inactivo_desde:
+                limite = max(limite, ahora)
+            cerrados = [i for i in abiertos if i + segundos <= limite]
+            for inicio in sorted(cerrados):
+                self._escribir_intervalo(nombre_variable, etiqueta, abiertos.pop(inicio))
+
+    def cerrar_todos(self):
+        """Escribe también los intervalos sin terminar (al detener el servicio)."""
+        for (nombre_variable, etiqueta), abiertos in self._intervalos.items():
+            for inicio in sorted(abiertos):
+                self._escribir_intervalo(nombre_variable, etiqueta, abiertos[inicio])
+            abiertos.clear()
+        super().cerrar_todos()
+
+    def reiniciar(self):
+        # Solo archivos: los intervalos en memoria siguen siendo válidos
+        super().cerrar_todos()
+        self._inicio_dia = self._fin_dia = 0.0
+
+    def _escribir_intervalo(self, nombre_variable, etiqueta, intervalo):
+        entrada = self._obtener(self._dia_de(intervalo.inicio), f"{nombre_variable}_{etiqueta}")
+        inicio_ms = int(round(intervalo.inicio * 1000))
+        if entrada.ultimo_ms is not None and inicio_ms <= entrada.ultimo_ms:
+            self.tardias += intervalo.cantidad
+            return
+        fila = [time.strftime('%H:%M:%S', time.localtime(intervalo.inicio)), inicio_ms, intervalo.cantidad]
+        for i in range(entrada.columnas):
+            fila += [f"{intervalo.minimos[i]:g}", f"{intervalo.maximos[i]:g}",
+                     f"{intervalo.sumas[i] / intervalo.cantidad:g}", f"{intervalo.ultimos[i]:g}"]
+        entrada.writer.writerow(fila)
+        entrada.ultimo_ms = inicio_ms
+
+    def _abrir_archivo(self, ruta, nombre_archivo):
+        nombre_variable = nombre_archivo.rsplit('_', 1)[0]
+        encabezado = self.encabezados.get(nombre_variable, ['Time', 'Value'])
+        columnas = nombres_columnas(encabezado)
+
+        # Último intervalo ya escrito (reinicio del servicio en el mismo día)
+        ultimo_ms = None
+        if os.path.exists(ruta):
+            with open(ruta, newline='') as f:
+                for fila in csv.reader(f):
+                    if len(fila) > 1 and fila[1].isdigit():
+                        ultimo_ms = int(fila[1])
+
+        archivo = open(ruta, 'a', newline='')
+        writer = csv.writer(archivo)
+        if archivo.tell() == 0:
+            writer.writerow(['Time', 'Epoch_ms', 'Count']
+                            + [f"{c}_{campo}" for c in columnas for campo in CAMPOS_RESUMEN])
+        return _Entrada(archivo, writer=writer, columnas=len(columnas), ultimo_ms=ultimo_ms)
+
+
+# =========================================================
+# LECTURA INCREMENTAL DE CSV
+# =========================================================
+class TablaCSV:
+    """Contenido de un CSV por columnas: `horas` ('Time') y un array('d') por columna (NaN si no es número)."""
+    __slots__ = ('encabezado', 'horas', 'columnas')
+
+    def __init__(self, encabezado, horas, columnas):
+        self.encabezado = encabezado
+        self.horas = horas
+        self.columnas = columnas
+
+    def columna(self, indice):
+        """Columna por índice del CSV (1 = primera después de 'Time')."""
+        return self.columnas[indice - 1] if 0 < indice <= len(self.columnas) else array('d')
+
+
+class _EstadoCSV:
+    __slots__ = ('inodo', 'tamano', 'offset', 'tabla')
+
+    def __init__(self, inodo):
+        self.inodo = inodo
+        self.tamano = 0
+        self.offset = 0
+        self.tabla = TablaCSV([], [], [])
+
+
+class LectorCSV:
+    """
+    Lee CSV que solo crecen (los diarios del listener) sin volver a parsear
+    lo ya leído: guarda el offset de la última línea completa y las columnas
+    parseadas; si el archivo creció, parsea solo lo nuevo. Si cambió el
+    inodo (archivo reemplazado, p. ej. por exportar_csv) o se achicó, vuelve
+    a empezar. Seguro entre hilos.
+    """
+
+    def __init__(self, max_archivos=32):
+        self.max_archivos = max_archivos
+        self._estados = OrderedDict()    # ruta -> _EstadoCSV
+        self._lock = threading.Lock()
+        self.bytes_parseados = 0
+
+    def leer(self, ruta):
+        """TablaCSV con todo el archivo (copia), o None si no existe."""
+        try:
+            info = os.stat(ruta)
+        except FileNotFoundError:
+            with self._lock:
+                self._estados.pop(ruta, None)
+            return None
+
+        with self._lock:
+            estado = self._estados.get(ruta)
+            if estado is None or estado.inodo != info.st_ino or info.st_size < estado.offset:
+                estado = _EstadoCSV(info.st_ino)
+                self._estados[ruta] = estado
+                while len(self._estados) > self.max_archivos:
+                    self._estados.popitem(last=False)
+            self._estados.move_to_end(ruta)
+
+            if info.st_size != estado.tamano:
+                self._leer_nuevo(ruta, estado)
+                estado.tamano = info.st_size
+
+            tabla = estado.tabla
+            return TablaCSV(tabla.encabezado, tabla.horas[:], [c[:] for c in tabla.columnas])
+
+    def _leer_nuevo(self, ruta, estado):
+        with open(ruta, 'rb') as f:
+            f.seek(estado.offset)
+            datos = f.read()
+        # Solo líneas completas: la última puede estar a medio escribir
+        fin = datos.rfind(b'\n') + 1
+        if not fin:
+            return
+        estado.offset += fin
+        self.bytes_parseados += fin
+
+        filas = csv.reader(datos[:fin].decode('utf-8', errors='replace').splitlines())
+        tabla = estado.tabla
+        if not tabla.encabezado:
+            tabla.encabezado = next(filas, [])
+            tabla.columnas = [array('d') for _ in tabla.encabezado[1:]]
+
+        nan = math.nan
+        columnas = tabla.columnas
+        for fila in filas:
+            if not fila:
+                continue
+            tabla.horas.append(fila[0])
+            for i, columna in enumerate(columnas, 1):
+                try:
+                    columna.append(float(fila[i]))
+                except (IndexError, ValueError):
+                    columna.append(nan)
+
+
+def ultima_fila_csv(ruta, bloque=4096):
+    """
+    (encabezado, última fila completa) de un CSV sin leerlo entero: lee la
+    primera línea y retrocede desde el final de a `bloque` bytes hasta
+    encontrar una línea terminada. None si no existe o no tiene filas.
+    """
+    try:
+        f = open(ruta, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        primera = f.readline()
+        inicio_datos = len(primera)
+        if not primera.endswith(b'\n'):
+            return None
+        fin = f.seek(0, os.SEEK_END)
+        cola = b''
+        posicion = fin
+        while posicion > inicio_datos:
+            posicion = max(inicio_datos, posicion - bloque)
+            f.seek(posicion)
+            cola = f.read(min(bloque, fin - posicion)) + cola
+            # La última línea puede estar a medio escribir: se descarta lo
+            # posterior al último '\n'
+            completo = cola[:cola.rfind(b'\n') + 1]
+            lineas = [l for l in completo.splitlines() if l.strip()]
+            # Con una sola línea hay que asegurarse de que empieza en un
+            # '\n' anterior (o en el comienzo de los datos)
+            if len(lineas) > 1 or (lineas and posicion == inicio_datos):
+                encabezado = next(csv.reader([primera.decode('utf-8', errors='replace')]), [])
+                fila = next(csv.reader([lineas[-1].decode('utf-8', errors='replace')]), [])
+                return encabezado, fila
+    return None
+
+
+# =========================================================
+# HISTORIAL EN MEMORIA
+# =========================================================
+class BufferCircular:
+    """
+    Buffer circular de capacidad fija: al llenarse, cada muestra nueva pisa
+    la más vieja. Supone muestras en orden temporal (como llegan por MQTT)
+    para buscar por tiempo con búsqueda binaria. Seguro entre hilos.
+    """
+
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self._tiempos = array('d', bytes(8 * capacidad))
+        self._valores = array('d', bytes(8 * capacidad))
+        self._inicio = 0        # Posición de la muestra más vieja
+        self._cantidad = 0
+        self.total = 0          # Muestras agregadas desde el arranque = número de la última
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._cantidad
+
+    def agregar(self, ts, valor):
+        with self._lock:
+            self._agregar(ts, valor)
+
+    def extender(self, puntos):
+        """puntos = [(ts, valor), ...] en orden."""
+        with self._lock:
+            for ts, valor in puntos:
+                self._agregar(ts, valor)
+
+    def _agregar(self, ts, valor):
+        if self._cantidad < self.capacidad:
+            i = (self._inicio + self._cantidad) % self.capacidad
+            self._cantidad += 1
+        else:
+            i = self._inicio
+            self._inicio = (self._inicio + 1) % self.capacidad
+        self.total += 1
+        self._tiempos[i] = ts
+        self._valores[i] = valor
+
+    def primero(self):
+        """(ts, valor) de la muestra más vieja o None."""
+        with self._lock:
+            if not self._cantidad:
+                return None
+            return self._tiempos[self._inicio], self._valores[self._inicio]
+
+    def ultimo(self):
+        """(ts, valor) de la muestra más reciente o None."""
+        with self._lock:
+            if not self._cantidad:
+                return None
+            i = (self._inicio + self._cantidad - 1) % self.capacidad
+            return self._tiempos[i], self._valores[i]
+
+    def desde(self, ts_min=None, ts_max=None):
+        """([tiempos], [valores]) con ts_min <= ts < ts_max, en orden."""
+        with self._lock:
+            primero = self._buscar(ts_min) if ts_min is not None else 0
+            ultimo = self._buscar(ts_max) if ts_max is not None else self._cantidad
+            return self._tramo(primero, ultimo)
+
+    def desde_secuencia(self, numero):
+        """
+        ([tiempos], [valores], total) de las muestras posteriores a la número
+        `numero`. None si ya no están todas (el buffer dio la vuelta) o si
+        `numero` es de otro arranque (mayor que el total).
+        """
+        with self._lock:
+            primero = numero - (self.total - self._cantidad)
+            if primero < 0 or numero > self.total:
+                return None
+            return self._tramo(primero, self._cantidad) + (self.total,)
+
+    def _tramo(self, primero, ultimo):
+        """Muestras de índice lógico primero..ultimo-1 (con el lock tomado)."""
+        if ultimo <= primero:
+            return [], []
+        a = (self._inicio + primero) % self.capacidad
+        b = a + (ultimo - primero)
+        if b <= self.capacidad:
+            return self._tiempos[a:b].tolist(), self._valores[a:b].tolist()
+        b -= self.capacidad
+        return ((self._tiempos[a:] + self._tiempos[:b]).tolist(),
+                (self._valores[a:] + self._valores[:b]).tolist())
+
+    def _buscar(self, ts):
+        """Índice lógico (0 = más vieja) de la primera muestra con tiempo >= ts."""
+        bajo, alto = 0, self._cantidad
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._tiempos[(self._inicio + medio) % self.capacidad] < ts:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
+
+
+# =========================================================
+# REDUCCIÓN DE PUNTOS PARA GRÁFICOS
+# =========================================================
+def reducir_lttb(tiempos, valores, n):
+    """Elige `n` de los puntos (tiempos, valores) con LTTB. Devuelve (tiempos, valores)."""
+    largo = len(tiempos)
+    if n >= largo:
+        return list(tiempos), list(valores)
+    if n < 3:
+        # Sin tramos intermedios: el primero y el último (como mucho n, nunca todo)
+        elegidos = [0, largo - 1][:max(n, 0)]
+        return [tiempos[i] for i in elegidos], [valores[i] for i in elegidos]
+
+    salida_t, salida_v = [tiempos[0]], [valores[0]]
+    tramo = (largo - 2) / (n - 2)
+    a = 0   # Último punto elegido
+    for i in range(n - 2):
+        inicio = int(i * tramo) + 1
+        fin = int((i + 1) * tramo) + 1
+
+        # Promedio del tramo siguiente (o el último punto)
+        sig_inicio, sig_fin = fin, min(int((i + 2) * tramo) + 1, largo)
+        if sig_inicio >= sig_fin:
+            media_t, media_v = tiempos[-1], valores[-1]
+        else:
+            cuenta = sig_fin - sig_inicio
+            media_t = sum(tiempos[sig_inicio:sig_fin]) / cuenta
+            media_v = sum(valores[sig_inicio:sig_fin]) / cuenta
+
+        # Punto del tramo actual que forma el triángulo de mayor área
+        ta, va = tiempos[a], valores[a]
+        mejor, mejor_area = inicio, -1.0
+        for j in range(inicio, fin):
+            area = abs((ta - media_t) * (valores[j] - va) - (ta - tiempos[j]) * (media_v - va))
+            if area > mejor_area:
+                mejor, mejor_area = j, area
+        salida_t.append(tiempos[mejor])
+        salida_v.append(valores[mejor])
+        a = mejor
+
+    salida_t.append(tiempos[-1])
+    salida_v.append(valores[-1])
+    return salida_t, salida_v
+
+
+def reducir_minmax(tiempos, valores, n):
+    """Divide en n/2 tramos y deja el mínimo y el máximo de cada uno (en orden temporal)."""
+    largo = len(tiempos)
+    if n >= largo:
+        return list(tiempos), list(valores)
+    if n < 2:
+        return list(tiempos[:max(n, 0)]), list(valores[:max(n, 0)])
+
+    tramos = n // 2
+    salida_t, salida_v = [], []
+    for i in range(tramos):
+        inicio, fin = largo * i // tramos, largo * (i + 1) // tramos
+        if inicio >= fin:
+            continue
+        tramo = valores[inicio:fin]
+        i_min = inicio + tramo.index(min(tramo))
+        i_max = inicio + tramo.index(max(tramo))
+        for j in sorted({i_min, i_max}):
+            salida_t.append(tiempos[j])
+            salida_v.append(valores[j])
+    return salida_t, salida_v
+
+
+def agrupar_resumenes(intervalos, n):
+    """Junta intervalos consecutivos de leer_resumenes() para dejar como mucho `n`."""
+    n = max(n, 1)
+    if len(intervalos) <= n:
+        return intervalos
+    tamano = -(-len(intervalos) // n)
+    agrupados = []
+    for i in range(0, len(intervalos), tamano):
+        grupo = intervalos[i:i + tamano]
+        cantidad, columnas = agregar_resumenes(grupo)
+        agrupados.append((grupo[0][0], cantidad, columnas))
+    return agrupados
+
+
+# =========================================================
+# BASE SQLITE (WAL) CON CONSULTAS POR RANGO
+# =========================================================
+class AlmacenSQLite:
+    """
+    Guarda las mediciones en una base SQLite en modo WAL. Cada lote del
+    escritor es una sola transacción. Cuando llega la primera muestra de un
+    día nuevo exporta los CSV del día anterior (si `exportar_csv_en` apunta
+    a la carpeta base), una sola vez y en un hilo aparte para no frenar al
+    escritor. Una muestra atrasada (hora del dispositivo del día anterior)
+    no cuenta como cambio de día.
+    La conexión se abre en el hilo que escribe (el hilo escritor).
+    """
+
+    def __init__(self, ruta_db, encabezados, exportar_csv_en=None):
+        self.ruta_db = ruta_db
+        self.encabezados = encabezados
+        self.exportar_csv_en = exportar_csv_en
+        self._conexion = None
+        self._inserts = {}           # variable -> SQL del INSERT
+        self._dia_actual = None      # Día más nuevo visto en las muestras
+        self._dias_a_exportar = []
+        self._dias_exportados = set()
+        self._exportador = None
+
+    def _conectar(self):
+        if self._conexion is None:
+            os.makedirs(os.path.dirname(self.ruta_db) or '.', exist_ok=True)
+            self._conexion = sqlite3.connect(self.ruta_db)
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute('PRAGMA synchronous=NORMAL')
+            self._inserts = {}
+        return self._conexion
+
+    def _insert(self, nombre_variable):
+        """Crea la tabla si hace falta y devuelve (SQL del INSERT, cantidad de columnas)."""
+        insert = self._inserts.get(nombre_variable)
+        if insert is None:
+            columnas = _columnas_sql(self.encabezados.get(nombre_variable, ['Time', 'Value']))
+            tabla = _tabla_sql(nombre_variable)
+            definicion = ', '.join(f"{c} REAL" for c in columnas)
+            conexion = self._conectar()
+            conexion.execute(f"CREATE TABLE IF NOT EXISTS {tabla} "
+                             f"(ts_ms INTEGER NOT NULL, {definicion}, rx_ms INTEGER)")
+            conexion.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_ts ON {tabla} (ts_ms)")
+            sql = (f"INSERT INTO {tabla} (ts_ms, {', '.join(columnas)}, rx_ms) "
+                   f"VALUES (?{', ?' * len(columnas)}, ?)")
+            insert = self._inserts[nombre_variable] = (sql, len(columnas))
+        return insert
+
+    def escribir_filas(self, nombre_variable, filas):
+        sql, ncols = self._insert(nombre_variable)
+        registros = []
+        for ts, rx, valores in filas:
+            numeros = []
+            for v in valores[:ncols]:
+                try:
+                    numeros.append(float(v))
+                except (TypeError, ValueError):
+                    numeros.append(None)
+            numeros.extend([None] * (ncols - len(numeros)))
+            registros.append((int(ts * 1000), *numeros, int(rx * 1000)))
+        self._conectar().executemany(sql, registros)
+
+        if self.exportar_csv_en:
+            # 'YYYY_MM_DD' ordena como fecha: solo avanza, nunca vuelve atrás
+            dia = time.strftime('%Y_%m_%d', time.localtime(max(fila[0] for fila in filas)))
+            if self._dia_actual is None or dia > self._dia_actual:
+                if self._dia_actual is not None and self._dia_actual not in self._dias_exportados:
+                    self._dias_exportados.add(self._dia_actual)
+                    self._dias_a_exportar.append(self._dia_actual)
+                self._dia_actual = dia
+
+    def cerrar_lote(self):
+        if self._conexion is not None:
+            self._conexion.commit()
+
+        # Ya confirmado el lote; la exportación lee con su propia conexión
+        if self._dias_a_exportar and (self._exportador is None or not self._exportador.is_alive()):
+            dias, self._dias_a_exportar = self._dias_a_exportar, []
+            self._exportador = threading.Thread(target=self._exportar, args=(dias,),
+                                                name="exportar-csv", daemon=True)
+            self._exportador.start()
+
+    def _exportar(self, dias):
+        for dia in dias:
+            try:
+                archivos = exportar_csv(self.ruta_db, dia, self.exportar_csv_en, self.encabezados)
+                logging.info(f"📤 Exportados {len(archivos)} CSV del día {dia} desde {self.ruta_db}")
+            except Exception as e:
+                logging.error(f"❌ Error exportando CSV del día {dia}: {e}")
+
+    def vaciar(self, fsync=False):
+        if self._conexion is not None:
+            self._conexion.commit()
+            if fsync:
+                # Pasar el WAL a la base principal (y a disco)
+                self._conexion.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def cerrar_todos(self):
+        if self._conexion is not None:
+            try:
+                self._conexion.commit()
+                self._conexion.close()
+            except sqlite3.Error as e:
+                logging.error(f"❌ Error cerrando base {self.ruta_db}: {e}")
+            self._conexion = None
+
+    def reiniciar(self):
+        if self._conexion is not None:
+            try:
+                self._conexion.rollback()
+            except sqlite3.Error:
+                pass
+        self.cerrar_todos()
+
+    def cantidad_abiertos(self):
+        return 1 if self._conexion is not None else 0
+
+
+def _tabla_sql(nombre_variable):
+    if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', nombre_variable):
+        raise ValueError(f"Nombre de variable inválido para SQLite: {nombre_variable}")
+    return nombre_variable
+
+
+def _columnas_sql(encabezado):
+    return [re.sub(r'\W', '_', n).lower() for n in nombres_columnas(encabezado)]
+
+
+def _conectar_lectura(ruta_db):
+    return sqlite3.connect(f"file:{ruta_db}?mode=ro", uri=True)
+
+
+def _select(conexion, tabla, con_recepcion=False):
+    """SELECT de ts_ms + columnas de valores (+ rx_ms al final si se pide)."""
+    columnas = [c[1] for c in conexion.execute(f"PRAGMA table_info({tabla})")]
+    if not columnas:
+        raise sqlite3.OperationalError(f"no such table: {tabla}")
+    valores = [c for c in columnas if c not in ('ts_ms', 'rx_ms')]
+    if con_recepcion:
+        valores.append('rx_ms')
+    return f"SELECT ts_ms, {', '.join(valores)} FROM {tabla}"
+
+
+def consultar_rango(ruta_db, nombre_variable, desde_ms=None, hasta_ms=None, con_recepcion=False):
+    """
+    Devuelve [(ts_ms, v1, v2, ...), ...] con desde_ms <= ts < hasta_ms, en orden.
+    Con `con_recepcion=True` cada fila termina con rx_ms (hora de recepción).
+    """
+    tabla = _tabla_sql(nombre_variable)
+    condiciones, parametros = [], []
+    if desde_ms is not None:
+        condiciones.append("ts_ms >= ?")
+        parametros.append(int(desde_ms))
+    if hasta_ms is not None:
+        condiciones.append("ts_ms < ?")
+        parametros.append(int(hasta_ms))
+    donde = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+    conexion = _conectar_lectura(ruta_db)
+    try:
+        select = _select(conexion, tabla, con_recepcion)
+        return conexion.execute(f"{select}{donde} ORDER BY ts_ms", parametros).fetchall()
+    except sqlite3.OperationalError:
+        return []   # La tabla todavía no existe (sin datos de esa variable)
+    finally:
+        conexion.close()
+
+
+def consultar_ultima(ruta_db, nombre_variable, con_recepcion=False):
+    """Última fila (ts_ms, v1, v2, ...) de la variable (por el índice de ts_ms), o None."""
+    tabla = _tabla_sql(nombre_variable)
+    conexion = _conectar_lectura(ruta_db)
+    try:
+        select = _select(conexion, tabla, con_recepcion)
+        return conexion.execute(f"{select} ORDER BY ts_ms DESC LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conexion.close()
+
+
+def consultar_franja_horaria(ruta_db, nombre_variable, dias, hora_desde, hora_hasta, hasta=None):
+    """
+    Misma franja horaria en los últimos `dias` días.
+    Ej: radiación de 10:00 a 14:00 de los últimos 30 días:
+        consultar_franja_horaria(db, 'radiation', 30, '10:00', '14:00')
+    Devuelve {'YYYY_MM_DD': [(ts_ms, v1, ...), ...]}.
+    """
+    hasta = hasta or datetime.now()
+    h0, m0 = (int(x) for x in hora_desde.split(':'))
+    h1, m1 = (int(x) for x in hora_hasta.split(':'))
+    tabla = _tabla_sql(nombre_variable)
+    resultado = {}
+
+    conexion = _conectar_lectura(ruta_db)
+    try:
+        select = _select(conexion, tabla)
+        for i in range(dias - 1, -1, -1):
+            dia = hasta - timedelta(days=i)
+            desde_ms = int(dia.replace(hour=h0, minute=m0, second=0, microsecond=0).timestamp() * 1000)
+            hasta_ms = int(dia.replace(hour=h1, minute=m1, second=0, microsecond=0).timestamp() * 1000)
+            filas = conexion.execute(
+                f"{select} WHERE ts_ms >= ? AND ts_ms < ? ORDER BY ts_ms",
+                (desde_ms, hasta_ms)).fetchall()
+            resultado[dia.strftime('%Y_%m_%d')] = filas
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        conexion.close()
+    return resultado
+
+
+def exportar_csv(ruta_db, dia, base_dir, encabezados):
+    """
+    Genera /base/YYYY_MM_DD/YYYY_MM_DD_<variable>.csv (mismo formato que el
+    listener en modo CSV) a partir de la base. Devuelve las rutas escritas.
+    """
+    inicio = datetime.strptime(dia, '%Y_%m_%d')
+    desde_ms = int(inicio.timestamp() * 1000)
+    hasta_ms = int((inicio + timedelta(days=1)).timestamp() * 1000)
+    carpeta = os.path.join(base_dir, dia)
+    escritos = []
+
+    for nombre_variable, encabezado in encabezados.items():
+        filas = consultar_rango(ruta_db, nombre_variable, desde_ms, hasta_ms)
+        if not filas:
+            continue
+        os.makedirs(carpeta, exist_ok=True)
+        ruta = os.path.join(carpeta, f"{dia}_{nombre_variable}.csv")
+        tmp = ruta + '.tmp'
+        with open(tmp, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(encabezado + ['Epoch_ms'])
+            for ts_ms, *valores in filas:
+                hora = time.strftime('%H:%M:%S', time.localtime(ts_ms / 1000))
+                writer.writerow([hora] + ['' if v is None else f"{v:g}" for v in valores] + [ts_ms])
+        os.replace(tmp, ruta)
+        escritos.append(ruta)
+    return escritos
+
+
+def formato_registro(ncols, tam_valor):
+    return struct.Struct('<q' + ('f' if tam_valor == 4 else 'd') * ncols)
+
+
+def leer_cabecera(ruta):
+    """Devuelve (columnas, bytes_por_valor) de un archivo .bin."""
+    with open(ruta, 'rb') as f:
+        datos = f.read(CABECERA_BINARIO.size)
+    if len(datos) < CABECERA_BINARIO.size:
+        raise ValueError(f"Archivo binario incompleto: {ruta}")
+    magia, ncols, tam_valor, _ = CABECERA_BINARIO.unpack(datos)
+    if magia != MAGIA_BINARIO:
+        raise ValueError(f"No es un archivo binario ANII: {ruta}")
+    return ncols, tam_valor
+
+
+def nombres_columnas(encabezado):
+    """['Time', 'Amb_Temp(°C)', ...] -> ['Amb_Temp', ...] (nombres válidos para numpy)."""
+    return [col.split('(')[0].strip() or f"c{i}" for i, col in enumerate(encabezado[1:], 1)]
+
+
+def abrir_memmap(ruta, nombres=None):
+    """
+    Abre un .bin como numpy.memmap de solo lectura, sin parsear nada.
+    Campos: 't' (epoch ms) + `nombres` (o c1..cN). Requiere numpy.
+    """
+    import numpy as np
+
+    ncols, tam_valor = leer_cabecera(ruta)
+    nombres = list(nombres) if nombres else [f"c{i}" for i in range(1, ncols + 1)]
+    tipo = '<f4' if tam_valor == 4 else '<f8'
+    dtype = np.dtype([('t', '<i8')] + [(n, tipo) for n in nombres[:ncols]])
+
+    cantidad = (os.path.getsize(ruta) - CABECERA_BINARIO.size) // dtype.itemsize
+    if cantidad <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(ruta, dtype=dtype, mode='r', offset=CABECERA_BINARIO.size, shape=(cantidad,))
+
+
+def buscar_indice(ruta, ts_ms):
+    """
+    Índice del primer registro con timestamp >= ts_ms (búsqueda binaria
+    leyendo solo 8 bytes por paso). Supone registros en orden temporal.
+    """
+    ncols, tam_valor = leer_cabecera(ruta)
+    tam_registro = formato_registro(ncols, tam_valor).size
+    with open(ruta, 'rb') as f:
+        fd = f.fileno()
+        cantidad = (os.fstat(fd).st_size - CABECERA_BINARIO.size) // tam_registro
+        bajo, alto = 0, cantidad
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            ts, = struct.unpack('<q', os.pread(fd, 8, CABECERA_BINARIO.size + medio * tam_registro))
+            if ts < ts_ms:
+                bajo = medio + 1
+            else:
+                alto = medio
+    return bajo
+
+
+def leer_rango_binario(ruta, desde_ms=None, hasta_ms=None):
+    """Devuelve [(ts_ms, (valores...)), ...] con desde_ms <= ts < hasta_ms."""
+    ncols, tam_valor = leer_cabecera(ruta)
+    formato = formato_registro(ncols, tam_valor)
+    inicio = buscar_indice(ruta, desde_ms) if desde_ms is not None else 0
+
+    with open(ruta, 'rb') as f:
+        cantidad = (os.fstat(f.fileno()).st_size - CABECERA_BINARIO.size) // formato.size
+        fin = buscar_indice(ruta, hasta_ms) if hasta_ms is not None else cantidad
+        if fin <= inicio:
+            return []
+        f.seek(CABECERA_BINARIO.size + inicio * formato.size)
+        datos = f.read((fin - inicio) * formato.size)
+
+    return [(r[0], r[1:]) for r in formato.iter_unpack(datos)]
+
+
+def leer_resumenes(base_dir, nombre_variable, etiqueta='1m', desde_ms=None, hasta_ms=None):
+    """
+    Intervalos de `nombre_variable` con desde_ms <= inicio < hasta_ms
+    (por defecto: hoy), recorriendo las carpetas diarias del rango.
+    Devuelve [(inicio_ms, cantidad, [(min, max, media, último) por columna]), ...].
+    """
+    if etiqueta not in RESOLUCIONES_RESUMEN:
+        raise ValueError(f"Resolución desconocida: {etiqueta}")
+    ahora = datetime.now()
+    desde = datetime.fromtimestamp(desde_ms / 1000) if desde_ms is not None else \
+        ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    hasta = datetime.fromtimestamp(hasta_ms / 1000) if hasta_ms is not None else ahora
+    desde_ms = int(desde.timestamp() * 1000)
+    hasta_ms = int(hasta.timestamp() * 1000)
+
+    resultado = []
+    dia = desde.replace(hour=0, minute=0, second=0, microsecond=0)
+    while dia <= hasta:
+        nombre = dia.strftime('%Y_%m_%d')
+        ruta = os.path.join(base_dir, nombre, f"{nombre}_{nombre_variable}_{etiqueta}.csv")
+        dia += timedelta(days=1)
+        if not os.path.exists(ruta):
+            continue
+        with open(ruta, newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for fila in reader:
+                try:
+                    inicio_ms = int(fila[1])
+                    if not desde_ms <= inicio_ms < hasta_ms:
+                        continue
+                    numeros = [float(v) for v in fila[3:]]
+                    columnas = [tuple(numeros[i:i + 4]) for i in range(0, len(numeros) - 3, 4)]
+                    resultado.append((inicio_ms, int(fila[2]), columnas))
+                except (IndexError, ValueError):
+                    continue
+    return resultado
+
+
+def agregar_resumenes(intervalos):
+    """
+    Combina intervalos de leer_resumenes() en uno solo:
+    (cantidad, [(min, max, media, último) por columna]) o None si no hay datos.
+    """
+    if not intervalos:
+        return None
+    cantidad = sum(c for _, c, _ in intervalos)
+    columnas = []
+    for i in range(len(intervalos[0][2])):
+        columnas.append((
+            min(cols[i][0] for _, _, cols in intervalos),
+            max(cols[i][1] for _, _, cols in intervalos),
+            sum(cols[i][2] * c for _, c, cols in intervalos) / cantidad,
+            intervalos[-1][2][i][3],
+        ))
+    return cantidad, columnas
+
+
+def recalcular_resumenes(datos_dir, resumenes_dir, dia, encabezados):
+    """
+    Rehace los resúmenes del día 'YYYY_MM_DD' desde los CSV crudos de
+    /datos_dir/YYYY_MM_DD/ (reemplaza los existentes). Devuelve las variables procesadas.
+    """
+    carpeta = os.path.join(resumenes_dir, dia)
+    if os.path.isdir(carpeta):
+        for nombre in os.listdir(carpeta):
+            if nombre.startswith(f"{dia}_") and nombre.endswith('.csv'):
+                os.remove(os.path.join(carpeta, nombre))
+
+    # Sin cerrar_lote(): todos los intervalos quedan abiertos hasta el final,
+    # así que las filas desordenadas se agregan igual
+    almacen = AlmacenResumenes(resumenes_dir, encabezados)
+    procesadas = []
+    inicio_dia = datetime.strptime(dia, '%Y_%m_%d')
+    for nombre_variable, encabezado in encabezados.items():
+        ruta = os.path.join(datos_dir, dia, f"{dia}_{nombre_variable}.csv")
+        if not os.path.exists(ruta):
+            continue
+        ncols = len(encabezado) - 1
+        filas = []
+        with open(ruta, newline='') as f:
+            reader = csv.reader(f)
+            con_epoch = next(reader, [])[-1:] == ['Epoch_ms']
+            for fila in reader:
+                try:
+                    if con_epoch:
+                        ts = int(fila[ncols + 1]) / 1000.0
+                    else:
+                        h, m, sg = (int(x) for x in fila[0].split(':'))
+                        ts = (inicio_dia + timedelta(hours=h, minutes=m, seconds=sg)).timestamp()
+                    filas.append((ts, ts, [float(v) for v in fila[1:ncols + 1]]))
+                except (IndexError, ValueError):
+                    continue
+        if filas:
+            almacen.escribir_filas(nombre_variable, filas)
+            procesadas.append(nombre_variable)
+    almacen.cerrar_todos()
+    return procesadas
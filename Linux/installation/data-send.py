@@ -3,6 +3,7 @@ import time
 import logging
 from ftplib import FTP
 from datetime import datetime, timedelta
+from anii_logging import configurar_logging
 
 #########################################################
 ################ Configuracion de datos #################
@@ -18,32 +19,8 @@ FTP_DIR = "/d_so/log"       # <- IMPORTANTE: Cambiar Directorio según región
 ################ Configuración de Logging ###############
 #########################################################
 
-# 1. Obtenemos el mes actual: "2025_12"
-current_month_str = datetime.now().strftime('%Y_%m')
-
-# 2. Definimos la carpeta del mes para LOGS DE SISTEMA
-LOG_MONTH_DIR = os.path.join(CARPETA_BASE, current_month_str)
-
-# 3. Definimos el archivo final: "/home/log/2025_12/data-send.log"
-LOG_FILE = os.path.join(LOG_MONTH_DIR, 'data-send.log')
-
-# 4. Crear estructura de carpetas si no existe
-if not os.path.exists(LOG_MONTH_DIR):
-    try:
-        os.makedirs(LOG_MONTH_DIR)
-        print(f"📁 Carpeta de logs mensuales creada: {LOG_MONTH_DIR}")
-    except OSError as e:
-        print(f"CRITICAL ERROR: No se pudo crear directorio de logs {LOG_MONTH_DIR}: {e}")
-
-# Configuración del Logger (Archivo + Consola)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# "/home/log/2025_12/data-send.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE = configurar_logging('data-send.log', CARPETA_BASE)
 
 #########################################################
 ####################### Funciones #######################
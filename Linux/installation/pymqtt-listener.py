@@ -1,9 +1,20 @@
-import csv
+import re
+import sys
 import time
 import os
+import queue
+import signal
+import asyncio
 import logging
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import paho.mqtt.client as mqtt
-from datetime import datetime
+from anii_logging import configurar_logging
+from anii_protocol import TOPICS, HEADERS, RegistroEsquemas
+from anii_metrics import RegistroMetricas, servir_metricas, archivos_abiertos_proceso
+from anii_storage import (RegistroCSV, AlmacenBinario, AlmacenSQLite, AlmacenResumenes, exportar_csv,
+                          recalcular_resumenes)
 
 # =========================================================
 # CONFIGURACIÓN GENERAL
@@ -12,114 +23,793 @@ BROKER = "localhost"
 PORT = 1883
 LOG_DIR_BASE = '/home/log'
 
+# --- MULTI-SITIO (varias regiones/equipos en un mismo broker) ---
+# Además de los tópicos locales (measure/..., control/...) se reciben los
+# equipos puenteados desde sus brokers locales con el prefijo
+#   site/<region>/<equipo>/measure/environment   (region: SO, CS, E, ...)
+# Cada equipo tiene su propio escritor (cola + hilo + archivos) y guarda en
+#   /home/log/sites/<region>/<equipo>/YYYY_MM_DD/...
+MULTI_SITIO = False
+PREFIJO_SITIO = "site"
+LOG_DIR_SITIOS = os.path.join(LOG_DIR_BASE, 'sites')
+MAX_EQUIPOS = 32             # Límite de escritores (hilos) por equipo remoto
+
+# --- MARCA DE TIEMPO DEL DISPOSITIVO ---
+# Si el payload trae hora propia ("25.50,60.00,1013.20@1765432100123" o un
+# lote JSON/binario, ver anii_protocol.py) esa marca se usa como hora de la
+# muestra, salvo que difiera más de
+# MAX_DESFASE_TS_S de la hora de recepción (reloj del equipo sin sincronizar).
+# La hora de recepción se guarda igual (columna rx_ms en SQLite).
+# Los archivos (búsqueda binaria en .bin, cursores del SCADA) asumen orden
+# temporal: una fila con hora anterior a la última ya escrita de esa
+# variable (equipo atrasado o que vacía su buffer) se guarda con la hora de
+# recepción, o con la última escrita si aun así quedaría antes. Se cuentan
+# en 'ts_atrasados'.
+ACEPTAR_TS_DISPOSITIVO = True
+MAX_DESFASE_TS_S = 3600
+
+# Máximo de CSV abiertos simultáneamente (se cierran los menos usados)
+CSV_MAX_ARCHIVOS_ABIERTOS = 16
+
+# --- BACKEND PRINCIPAL DE ALMACENAMIENTO ---
+#   "csv"    -> CSV diarios en /home/log/YYYY_MM_DD/ (formato histórico)
+#   "sqlite" -> base SQLite (WAL) en SQLITE_DB con índice por tiempo; los CSV
+#               del día se exportan desde la base al empezar el día siguiente
+#               (o a mano: pymqtt-listener.py --exportar YYYY_MM_DD)
+STORAGE_BACKEND = "csv"
+#STORAGE_BACKEND = "sqlite"
+SQLITE_DB = '/home/log/db/anii.db'
+
+# --- ALMACÉN BINARIO (además del backend principal) ---
+# /home/log/YYYY_MM_DD/YYYY_MM_DD_<variable>.bin: epoch ms + floats de ancho fijo,
+# legible como numpy.memmap sin parsear (ver anii_storage.py)
+ALMACEN_BINARIO = True
+BINARIO_TAM_VALOR = 4        # 4 = float32, 8 = float64
+
+# --- RESÚMENES (1 min / 15 min / 1 h) ---
+# min/max/media/cantidad/último por variable, calculados al recibir cada
+# muestra, en /home/log/rollups/YYYY_MM_DD/YYYY_MM_DD_<variable>_<1m|15m|1h>.csv.
+# El SCADA y los reportes los usan para rangos largos sin leer las muestras.
+# Rehacer un día desde los CSV: pymqtt-listener.py --resumenes YYYY_MM_DD
+RESUMENES = True
+CARPETA_RESUMENES = 'rollups'
+
+# --- ESCRITURA EN SEGUNDO PLANO ---
+# on_message solo encola; un hilo escritor agrupa y escribe en disco.
+COLA_MAX_MENSAJES = 10000    # Mensajes en memoria antes de empezar a descartar
+LOTE_MAX_FILAS = 200         # Vaciar a disco al juntar esta cantidad de filas...
+LOTE_MAX_ESPERA_S = 1.0      # ...o al pasar este tiempo desde el último vaciado
+
+# Durabilidad de cada lote:
+#   "none"  -> se deja el buffer a Python/SO (máximo rendimiento)
+#   "flush" -> flush() al final de cada lote (datos en caché del SO)
+#   "fsync" -> flush() por lote + os.fsync() cada FSYNC_CADA_MS
+DURABILIDAD = "flush"
+#DURABILIDAD = "none"
+#DURABILIDAD = "fsync"
+FSYNC_CADA_MS = 5000
+
+# --- MOTOR DE INGESTA ---
+#   "hilos"   -> loop_forever() de paho + EscritorEnSegundoPlano (un hilo escribe
+#                todos los destinos en serie; si la cola se llena se descarta)
+#   "asyncio" -> el socket de paho corre en un bucle asyncio; cada destino
+#                (CSV, binario, SQLite, estadísticas) tiene su propia cola y su
+#                hilo, y si se atrasan se deja de leer el socket (contrapresión
+#                hacia el broker en lugar de descartar)
+MOTOR = "hilos"
+#MOTOR = "asyncio"
+ASYNC_MARCA_ALTA = 5000      # Mensajes sin procesar: se pausa la lectura del socket...
+ASYNC_MARCA_BAJA = 1000      # ...y se reanuda al bajar de esta cantidad
+ASYNC_LOTES_POR_DESTINO = 8  # Lotes en espera por destino antes de frenar al resto
+
+# Cada cuánto se registran en el log los contadores de la cola
+ESTADISTICAS_CADA_S = 300
+
+# --- MÉTRICAS (Prometheus) ---
+# Exportador HTTP local: curl http://127.0.0.1:9101/metrics
+# Con None no se abre el puerto (los contadores se llevan igual, cuestan casi nada)
+METRICAS_PUERTO = None
+#METRICAS_PUERTO = 9101
+METRICAS_HOST = '127.0.0.1'
+
 # --- CONFIGURACIÓN DE LOGGING MENSUAL ---
-# 1. Obtenemos el mes actual: "2025_12"
-current_month_str = datetime.now().strftime('%Y_%m')
+# "/home/log/2025_12/pymqtt-listener.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE = configurar_logging('pymqtt-listener.log', LOG_DIR_BASE)
 
-# 2. Definimos la carpeta del mes para LOGS DE SISTEMA
-LOG_MONTH_DIR = os.path.join(LOG_DIR_BASE, current_month_str)
+# Registrar solo 1 de cada N filas guardadas (el resto queda en el CSV)
+MUESTREO_LOG_GUARDADO = 100
 
-# 3. Definimos el archivo final: "/home/log/2025_12/pymqtt-listener.log"
-LOG_FILE = os.path.join(LOG_MONTH_DIR, 'pymqtt-listener.log')
+# Los tópicos (TOPICS) y encabezados (HEADERS) están en anii_protocol.py,
+# compartidos con el SCADA. Los payloads que no respetan el esquema de su
+# tópico van a /home/log/YYYY_MM_DD/YYYY_MM_DD_quarantine.csv
+ENCABEZADO_CUARENTENA = {'quarantine': ['Time', 'Topic', 'Error', 'Payload']}
 
-# 4. Crear estructura de carpetas si no existe
-if not os.path.exists(LOG_MONTH_DIR):
-    try:
-        os.makedirs(LOG_MONTH_DIR)
-        print(f"📁 Carpeta de logs mensuales creada: {LOG_MONTH_DIR}")
-    except OSError as e:
-        print(f"CRITICAL ERROR: No se pudo crear directorio de logs {LOG_MONTH_DIR}: {e}")
-
-# CONFIGURACIÓN DEL LOGGER
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE), # Guardar en carpeta del mes
-        logging.StreamHandler()        # Mostrar en consola (systemd)
-    ]
-)
-
-# Lista de tópicos a escuchar
-TOPICS = {
-    # Sensores
-    "measure/environment":   "environment",
-    "measure/radiation":     "radiation",
-    "measure/temperature":   "temperature",
-    "measure/level_in":      "level_in",
-    "measure/level_out":     "level_out",
-    "measure/chamber_level": "chamber_level", # Agregado para evitar warnings
-    
-    # Control (Eventos)
-    "control/in_valve":      "control_in",
-    "control/out_valve":     "control_out",
-    "control/process":       "control_process"
-}
-
-# Definición de Encabezados CSV
-HEADERS = {
-    'environment':   ['Time', 'Amb_Temp(°C)', 'Humidity(%)', 'Pressure(hPa)'],
-    'radiation':     ['Time', 'Radiation(W/m^2)'],
-    'temperature':   ['Time', 'Internal_Temp(°C)'],
-    'level_in':      ['Time', 'Weight(kg)', 'Distance(cm)', 'Volume(ml)'],
-    'level_out':     ['Time', 'Weight(kg)', 'Distance(cm)', 'Volume(ml)'],
-    'chamber_level': ['Time', 'Volume(ml)'],
-    
-    'control_in':      ['Time', 'State(1=OPEN/0=CLOSE)'],
-    'control_out':     ['Time', 'State(1=OPEN/0=CLOSE)'],
-    'control_process': ['Time', 'State(1=START/0=STOP)']
-}
+# =========================================================
+# MÉTRICAS
+# =========================================================
+metricas = RegistroMetricas()
+metrica_mensajes = metricas.contador(
+    'anii_listener_mensajes_total', 'Mensajes MQTT recibidos por tópico', ['topic'])
+metrica_parseo = metricas.histograma(
+    'anii_listener_parseo_segundos', 'Latencia de parseo de un payload', ['topic'])
+metrica_escritura = metricas.histograma(
+    'anii_listener_escritura_segundos', 'Duración de escribir un lote en un destino', ['destino'])
 
 # =========================================================
-# LÓGICA DE ALMACENAMIENTO (DATOS CSV)
+# LÓGICA DE ALMACENAMIENTO (CSV + BINARIO)
 # =========================================================
-def escribir_log(nombre_variable, payload_str):
+class ProcesadorMensajes:
     """
-    Gestiona la creación de carpetas DIARIAS y escritura en CSV.
-    Nota: Los datos siguen en carpetas diarias para granularidad.
+    Parseo de mensajes a filas, común a los dos motores de ingesta: valida
+    cada payload contra su esquema, aplica la hora del dispositivo y junta
+    los inválidos para la cuarentena.
     """
-    now = datetime.now()
-    
-    # Nombres basados en fecha
-    date_str_folder = now.strftime('%Y_%m_%d') 
-    time_log = now.strftime('%H:%M:%S')        
-
-    # Verificar/Crear Directorio del DÍA (dentro de la base)
-    # Ej: /home/log/2025_12_11/
-    daily_dir = os.path.join(LOG_DIR_BASE, date_str_folder)
-    
-    if not os.path.exists(daily_dir):
+
+    def __init__(self, esquemas):
+        self.esquemas = esquemas
+        self.ts_dispositivo = 0
+        self.ts_rechazados = 0
+        self.ts_atrasados = 0
+        self._ultimo_ts = {}   # variable -> hora de la última fila entregada al escritor
+
+    def preparar(self, pendientes):
+        """
+        pendientes = {topic: [(recepcion, payload), ...]} ->
+        ([(variable, filas), ...], filas_rechazadas)
+        """
+        lotes = []
+        rechazadas = []
+        for topic, mensajes in pendientes.items():
+            filas = []
+            for rx, payload in mensajes:
+                filas.extend(self._filas(topic, rx, payload, rechazadas))
+            if not filas:
+                continue
+            variable = TOPICS[topic]
+            if ACEPTAR_TS_DISPOSITIVO:
+                # Con marcas del dispositivo el orden de llegada puede no ser el
+                # temporal; los lectores (búsqueda binaria) asumen orden
+                filas.sort(key=lambda fila: fila[0])
+                filas = self._en_orden(variable, filas)
+            lotes.append((variable, filas))
+        return lotes, rechazadas
+
+    def _en_orden(self, variable, filas):
+        """Ninguna fila antes de la última ya escrita de la variable (también entre lotes)."""
+        ultimo = self._ultimo_ts.get(variable)
+        if ultimo is not None and filas[0][0] < ultimo:
+            corregidas = []
+            for ts, rx, valores in filas:
+                if ts < ultimo:
+                    ts = max(rx, ultimo)
+                    self.ts_atrasados += 1
+                corregidas.append((ts, rx, valores))
+            # Movidas a rx pueden quedar después de filas posteriores del lote
+            filas = sorted(corregidas, key=lambda fila: fila[0])
+        self._ultimo_ts[variable] = filas[-1][0]
+        return filas
+
+    def _filas(self, topic, rx, payload, rechazadas):
+        """
+        [(hora_muestra, hora_recepcion, [valores]), ...] a partir del payload
+        (1 o más muestras). Si no respeta el esquema, agrega una fila a `rechazadas`.
+        """
+        try:
+            muestras = self.esquemas.parsear(topic, payload)
+        except Exception as e:
+            # parsear() solo lanza ErrorPayload; cualquier otra cosa también va a
+            # cuarentena en lugar de cortar el lote (y el hilo escritor)
+            texto = payload.decode(errors='replace') if isinstance(payload, bytes) else str(payload)
+            rechazadas.append((rx, rx, [topic, str(e), texto[:500]]))
+            logging.warning(f"⚠️ Payload inválido en {topic} (a cuarentena): {e}")
+            return []
+
+        filas = []
+        for ts_ms, valores in muestras:
+            ts = rx
+            if ts_ms is not None:
+                if ACEPTAR_TS_DISPOSITIVO and abs(ts_ms / 1000.0 - rx) <= MAX_DESFASE_TS_S:
+                    ts = ts_ms / 1000.0
+                    self.ts_dispositivo += 1
+                else:
+                    self.ts_rechazados += 1
+            filas.append((ts, rx, valores))
+        return filas
+
+
+class EscritorEnSegundoPlano(threading.Thread):
+    """
+    Hilo que saca mensajes de una cola acotada y los escribe por lotes,
+    para que el callback de paho nunca espere al disco (la SD de la Raspberry
+    puede tardar cientos de ms y eso frena la recepción y los keepalives).
+    """
+
+    _FIN = object()
+
+    def __init__(self, destinos, esquemas, cuarentena, nombre="escritor", max_cola=COLA_MAX_MENSAJES,
+                 max_filas=LOTE_MAX_FILAS, max_espera_s=LOTE_MAX_ESPERA_S, durabilidad=DURABILIDAD,
+                 fsync_cada_ms=FSYNC_CADA_MS):
+        super().__init__(name=nombre, daemon=True)
+        if durabilidad not in ("none", "flush", "fsync"):
+            raise ValueError(f"Durabilidad desconocida: {durabilidad}")
+
+        self.destinos = destinos
+        self.esquemas = esquemas
+        self.procesador = ProcesadorMensajes(esquemas)
+        self.cuarentena = cuarentena
+        self.cola = queue.Queue(maxsize=max_cola)
+        self.max_filas = max_filas
+        self.max_espera_s = max_espera_s
+        self.durabilidad = durabilidad
+        self.fsync_cada_s = fsync_cada_ms / 1000.0
+
+        # Contadores (solo los modifica un hilo cada uno; lectura sin lock)
+        self.recibidos = 0
+        self.descartados = 0
+        self.escritos = 0
+        self.errores = 0
+        self.lotes = 0
+        self.fsyncs = 0
+        self.max_profundidad = 0
+
+    # --- Lado productor (hilo de paho) ---
+    def encolar(self, topic, payload):
+        """`payload` son los bytes tal cual llegaron: se parsean en el hilo escritor."""
+        self.recibidos += 1
         try:
-            os.makedirs(daily_dir)
-            logging.info(f"📂 Carpeta de datos diaria creada: {daily_dir}")
-        except OSError as e:
-            logging.error(f"❌ Error creando directorio diario: {e}")
+            self.cola.put_nowait((time.time(), topic, payload))
+        except queue.Full:
+            self.descartados += 1
+            # Avisar solo en potencias de 2 para no inundar el log
+            if self.descartados & (self.descartados - 1) == 0:
+                logging.warning(f"⚠️ Cola de escritura llena ({self.name}): {self.descartados} mensajes descartados")
+
+    def detener(self, timeout=10):
+        """Vacía lo pendiente y cierra los archivos."""
+        self.cola.put(self._FIN)
+        self.join(timeout)
+
+    def estadisticas(self):
+        return {
+            'profundidad': self.cola.qsize(),
+            'max_profundidad': self.max_profundidad,
+            'recibidos': self.recibidos,
+            'descartados': self.descartados,
+            'escritos': self.escritos,
+            'errores': self.errores,
+            'lotes': self.lotes,
+            'fsyncs': self.fsyncs,
+            'ts_dispositivo': self.procesador.ts_dispositivo,
+            'ts_rechazados': self.procesador.ts_rechazados,
+            'ts_atrasados': self.procesador.ts_atrasados,
+            'rechazados': sum(e.rechazados for e in self.esquemas.esquemas.values()),
+            'archivos_abiertos': sum(d.cantidad_abiertos() for d in self.destinos),
+        }
+
+    # --- Lado consumidor (este hilo) ---
+    def run(self):
+        pendientes = {}   # topic -> [(recepcion, payload), ...]
+        cantidad = 0
+        ahora = time.monotonic()
+        proximo_vaciado = ahora + self.max_espera_s
+        proximo_fsync = ahora + self.fsync_cada_s
+        proximas_estadisticas = ahora + ESTADISTICAS_CADA_S
+        terminar = False
+
+        while not terminar:
+            try:
+                item = self.cola.get(timeout=max(0.0, proximo_vaciado - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is self._FIN:
+                terminar = True
+            elif item is not None:
+                rx, topic, payload = item
+                pendientes.setdefault(topic, []).append((rx, payload))
+                cantidad += 1
+                profundidad = self.cola.qsize()
+                if profundidad > self.max_profundidad:
+                    self.max_profundidad = profundidad
+
+            ahora = time.monotonic()
+            if cantidad >= self.max_filas or ahora >= proximo_vaciado or terminar:
+                if cantidad:
+                    self._escribir_lote(pendientes)
+                    pendientes = {}
+                    cantidad = 0
+                proximo_vaciado = ahora + self.max_espera_s
+
+                if self.durabilidad == "fsync" and (ahora >= proximo_fsync or terminar):
+                    self._vaciar(fsync=True)
+                    proximo_fsync = ahora + self.fsync_cada_s
+
+                if ahora >= proximas_estadisticas:
+                    logging.info(f"📊 Escritor {self.name}: {self.estadisticas()}")
+                    logging.info(f"📊 Tópicos: {self.esquemas.estadisticas()}")
+                    proximas_estadisticas = ahora + ESTADISTICAS_CADA_S
+
+        for destino in self.destinos + [self.cuarentena]:
+            destino.cerrar_todos()
+        logging.info(f"📊 Escritor {self.name} detenido: {self.estadisticas()}")
+
+    def _escribir_lote(self, pendientes):
+        try:
+            lotes, rechazadas = self.procesador.preparar(pendientes)
+        except Exception as e:
+            # No debería pasar (los payloads inválidos van a cuarentena), pero
+            # un error acá no puede cortar el hilo/tarea que escribe
+            self.errores += 1
+            logging.error(f"❌ Error preparando lote de {len(pendientes)} tópicos: {e}")
             return
+        duraciones = [0.0] * len(self.destinos)
+        for nombre_variable, filas in lotes:
+            for i, destino in enumerate(self.destinos):
+                inicio = time.perf_counter()
+                try:
+                    destino.escribir_filas(nombre_variable, filas)
+                    duraciones[i] += time.perf_counter() - inicio
+                except Exception as e:
+                    self.errores += 1
+                    logging.error(f"❌ Error escribiendo {nombre_variable} ({type(destino).__name__}): {e}")
+                    # Forzar reapertura (y verificación de carpeta) en el próximo lote
+                    destino.reiniciar()
+            self.escritos += len(filas)
+            logging.info(f"💾 Guardado en {nombre_variable}: {filas[-1][2]}",
+                         extra={'muestreo': MUESTREO_LOG_GUARDADO})
 
-    # Ruta del Archivo CSV
-    filename = os.path.join(daily_dir, f"{date_str_folder}_{nombre_variable}.csv")
-    archivo_existe = os.path.isfile(filename)
+        if rechazadas:
+            try:
+                self.cuarentena.escribir_filas('quarantine', rechazadas)
+            except Exception as e:
+                self.errores += 1
+                logging.error(f"❌ Error escribiendo cuarentena: {e}")
+                self.cuarentena.reiniciar()
 
-    # Procesar los datos
-    datos_recibidos = payload_str.split(',')
-    fila_a_escribir = [time_log] + datos_recibidos
+        for i, destino in enumerate(self.destinos):
+            inicio = time.perf_counter()
+            try:
+                destino.cerrar_lote()
+            except Exception as e:
+                self.errores += 1
+                logging.error(f"❌ Error cerrando lote ({type(destino).__name__}): {e}")
+                destino.reiniciar()
+            metrica_escritura.observar(duraciones[i] + time.perf_counter() - inicio, type(destino).__name__)
 
-    # Escribir en CSV
-    try:
-        with open(filename, 'a', newline='') as f:
-            writer = csv.writer(f)
-            
-            # Escribir cabecera solo si el archivo es nuevo
-            if not archivo_existe:
-                header = HEADERS.get(nombre_variable, ['Time', 'Value'])
-                writer.writerow(header)
-            
-            # Escribir datos
-            writer.writerow(fila_a_escribir)
-            logging.info(f"💾 Guardado en {nombre_variable}: {fila_a_escribir}")
-            
-    except Exception as e:
-        logging.error(f"❌ Error escribiendo archivo {filename}: {e}")
+        self.lotes += 1
+        if self.durabilidad != "none":
+            self._vaciar(fsync=False)
+
+    def _vaciar(self, fsync):
+        for destino in self.destinos + [self.cuarentena]:
+            try:
+                destino.vaciar(fsync=fsync)
+            except OSError as e:
+                self.errores += 1
+                logging.error(f"❌ Error vaciando archivos a disco: {e}")
+                destino.reiniciar()
+        if fsync:
+            self.fsyncs += 1
+
+# =========================================================
+# MOTOR ASYNCIO
+# =========================================================
+class EstadisticasMuestras:
+    """
+    Destino que no guarda nada: cuenta filas por variable y recuerda el último
+    valor. Mismo interfaz que los almacenes de anii_storage.py.
+    """
+
+    def __init__(self):
+        self.filas = {}
+        self.ultimo = {}
+
+    def escribir_filas(self, nombre_variable, filas):
+        self.filas[nombre_variable] = self.filas.get(nombre_variable, 0) + len(filas)
+        self.ultimo[nombre_variable] = filas[-1]
+
+    def cerrar_lote(self):
+        pass
+
+    def vaciar(self, fsync=False):
+        pass
+
+    def cerrar_todos(self):
+        pass
+
+    def reiniciar(self):
+        pass
+
+    def cantidad_abiertos(self):
+        return 0
+
+
+class DestinoAsync:
+    """
+    Un destino síncrono con su cola de lotes (asyncio) y su propio hilo, de
+    modo que un destino lento no frena a los demás mientras tenga lugar en
+    su cola. Los lotes se escriben en orden.
+    """
+
+    def __init__(self, destino, max_lotes=ASYNC_LOTES_POR_DESTINO, durabilidad=DURABILIDAD,
+                 fsync_cada_ms=FSYNC_CADA_MS):
+        self.destino = destino
+        self.nombre = type(destino).__name__
+        self.max_lotes = max_lotes
+        self.durabilidad = durabilidad
+        self.fsync_cada_s = fsync_cada_ms / 1000.0
+        self.cola = None     # asyncio.Queue, se crea dentro del bucle
+        self._hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"destino-{self.nombre}")
+        self._proximo_fsync = time.monotonic() + self.fsync_cada_s
+
+        self.lotes = 0
+        self.filas = 0
+        self.errores = 0
+        self.fsyncs = 0
+        self.max_profundidad = 0
+
+    async def correr(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = await self.cola.get()
+            if lote is None:
+                break
+            await loop.run_in_executor(self._hilo, self._escribir, lote)
+        await loop.run_in_executor(self._hilo, self._cerrar)
+        self._hilo.shutdown(wait=True)
+
+    async def encolar(self, lote):
+        """Espera si la cola del destino está llena (contrapresión)."""
+        await self.cola.put(lote)
+        profundidad = self.cola.qsize()
+        if profundidad > self.max_profundidad:
+            self.max_profundidad = profundidad
+
+    # --- En el hilo del destino ---
+    def _escribir(self, lote):
+        inicio = time.perf_counter()
+        for nombre_variable, filas in lote:
+            try:
+                self.destino.escribir_filas(nombre_variable, filas)
+                self.filas += len(filas)
+            except Exception as e:
+                self.errores += 1
+                logging.error(f"❌ Error escribiendo {nombre_variable} ({self.nombre}): {e}")
+                self.destino.reiniciar()
+        try:
+            self.destino.cerrar_lote()
+            if self.durabilidad != "none":
+                fsync = self.durabilidad == "fsync" and time.monotonic() >= self._proximo_fsync
+                self.destino.vaciar(fsync=fsync)
+                if fsync:
+                    self.fsyncs += 1
+                    self._proximo_fsync = time.monotonic() + self.fsync_cada_s
+        except Exception as e:
+            self.errores += 1
+            logging.error(f"❌ Error cerrando lote ({self.nombre}): {e}")
+            self.destino.reiniciar()
+        self.lotes += 1
+        metrica_escritura.observar(time.perf_counter() - inicio, self.nombre)
+
+    def _cerrar(self):
+        try:
+            if self.durabilidad == "fsync":
+                self.destino.vaciar(fsync=True)
+            self.destino.cerrar_todos()
+        except Exception as e:
+            logging.error(f"❌ Error cerrando {self.nombre}: {e}")
+
+    def estadisticas(self):
+        return {
+            'profundidad': self.cola.qsize() if self.cola else 0,
+            'max_profundidad': self.max_profundidad,
+            'lotes': self.lotes,
+            'filas': self.filas,
+            'errores': self.errores,
+            'fsyncs': self.fsyncs,
+        }
+
+
+class IngestaAsync:
+    """
+    Motor de ingesta para MOTOR = "asyncio". Mismo interfaz de productor que
+    EscritorEnSegundoPlano (`encolar`, `estadisticas`), pero corre como tarea
+    del bucle: agrupa, parsea y reparte cada lote a todos los destinos.
+
+    Contrapresión: al superar `marca_alta` mensajes sin procesar llama a
+    `al_pausar()` (el PuenteAsyncio deja de leer el socket, y el broker
+    retiene los mensajes) y a `al_reanudar()` al bajar de `marca_baja`.
+    `max_cola` queda como tope duro por si el productor no se puede pausar.
+    """
+
+    def __init__(self, destinos, esquemas, cuarentena, nombre="ingesta", max_cola=COLA_MAX_MENSAJES,
+                 marca_alta=ASYNC_MARCA_ALTA, marca_baja=ASYNC_MARCA_BAJA, max_filas=LOTE_MAX_FILAS,
+                 max_espera_s=LOTE_MAX_ESPERA_S, durabilidad=DURABILIDAD, fsync_cada_ms=FSYNC_CADA_MS,
+                 max_lotes=ASYNC_LOTES_POR_DESTINO):
+        if durabilidad not in ("none", "flush", "fsync"):
+            raise ValueError(f"Durabilidad desconocida: {durabilidad}")
+
+        self.name = nombre
+        self.destinos = destinos
+        self.esquemas = esquemas
+        self.procesador = ProcesadorMensajes(esquemas)
+        self.salidas = [DestinoAsync(d, max_lotes, durabilidad, fsync_cada_ms) for d in destinos]
+        self.cuarentena = DestinoAsync(cuarentena, max_lotes, durabilidad, fsync_cada_ms)
+        self.max_cola = max_cola
+        self.marca_alta = marca_alta
+        self.marca_baja = marca_baja
+        self.max_filas = max_filas
+        self.max_espera_s = max_espera_s
+
+        self.al_pausar = lambda: None
+        self.al_reanudar = lambda: None
+        self.pausado = False
+
+        self.cola = collections.deque()
+        self._hay_datos = None   # asyncio.Event, se crea dentro del bucle
+        self._fin = False
+
+        self.recibidos = 0
+        self.descartados = 0
+        self.escritos = 0
+        self.lotes = 0
+        self.errores = 0
+        self.pausas = 0
+        self.max_profundidad = 0
+
+    # --- Productor (callbacks de paho, en el hilo del bucle) ---
+    def encolar(self, topic, payload):
+        self.recibidos += 1
+        if len(self.cola) >= self.max_cola:
+            self.descartados += 1
+            if self.descartados & (self.descartados - 1) == 0:
+                logging.warning(f"⚠️ Cola de ingesta llena ({self.name}): {self.descartados} mensajes descartados")
+            return
+        self.cola.append((time.time(), topic, payload))
+
+        profundidad = len(self.cola)
+        if profundidad > self.max_profundidad:
+            self.max_profundidad = profundidad
+        if profundidad >= self.marca_alta and not self.pausado:
+            self.pausado = True
+            self.pausas += 1
+            self.al_pausar()
+        if self._hay_datos is not None:
+            self._hay_datos.set()
+
+    def detener(self):
+        """Termina `correr()` después de escribir lo pendiente."""
+        self._fin = True
+        if self._hay_datos is not None:
+            self._hay_datos.set()
+
+    def estadisticas(self):
+        return {
+            'profundidad': len(self.cola),
+            'max_profundidad': self.max_profundidad,
+            'recibidos': self.recibidos,
+            'descartados': self.descartados,
+            'escritos': self.escritos,
+            'lotes': self.lotes,
+            'errores': self.errores,
+            'pausas': self.pausas,
+            'ts_dispositivo': self.procesador.ts_dispositivo,
+            'ts_rechazados': self.procesador.ts_rechazados,
+            'ts_atrasados': self.procesador.ts_atrasados,
+            'rechazados': sum(e.rechazados for e in self.esquemas.esquemas.values()),
+            'archivos_abiertos': sum(d.cantidad_abiertos() for d in self.destinos),
+            'destinos': {s.nombre: s.estadisticas() for s in self.salidas},
+        }
+
+    # --- Consumidor ---
+    async def correr(self):
+        loop = asyncio.get_running_loop()
+        self._hay_datos = asyncio.Event()
+        for salida in self.salidas + [self.cuarentena]:
+            salida.cola = asyncio.Queue(maxsize=salida.max_lotes)
+        tareas = [loop.create_task(s.correr()) for s in self.salidas + [self.cuarentena]]
+        estadisticas = loop.create_task(self._estadisticas_periodicas())
+
+        pendientes = {}
+        cantidad = 0
+        limite = None
+        while True:
+            while self.cola and cantidad < self.max_filas:
+                rx, topic, payload = self.cola.popleft()
+                pendientes.setdefault(topic, []).append((rx, payload))
+                cantidad += 1
+            if self.pausado and len(self.cola) <= self.marca_baja:
+                self.pausado = False
+                self.al_reanudar()
+
+            ahora = loop.time()
+            if cantidad and limite is None:
+                limite = ahora + self.max_espera_s
+            if cantidad and (cantidad >= self.max_filas or ahora >= limite or self._fin):
+                await self._repartir(pendientes)
+                pendientes = {}
+                cantidad = 0
+                limite = None
+                # Dejar correr a los callbacks del socket entre lote y lote
+                await asyncio.sleep(0)
+                continue
+
+            if self._fin and not self.cola:
+                break
+            self._hay_datos.clear()
+            try:
+                await asyncio.wait_for(self._hay_datos.wait(), limite - ahora if limite else None)
+            except asyncio.TimeoutError:
+                pass
+
+        for salida in self.salidas + [self.cuarentena]:
+            await salida.cola.put(None)
+        await asyncio.gather(*tareas)
+        estadisticas.cancel()
+        logging.info(f"📊 Ingesta {self.name} detenida: {self.estadisticas()}")
+
+    async def _repartir(self, pendientes):
+        try:
+            lotes, rechazadas = self.procesador.preparar(pendientes)
+        except Exception as e:
+            # No debería pasar (los payloads inválidos van a cuarentena), pero
+            # un error acá no puede cortar el hilo/tarea que escribe
+            self.errores += 1
+            logging.error(f"❌ Error preparando lote de {len(pendientes)} tópicos: {e}")
+            return
+        if lotes:
+            # Todos los destinos reciben la misma lista (solo lectura)
+            for salida in self.salidas:
+                await salida.encolar(lotes)
+            for nombre_variable, filas in lotes:
+                self.escritos += len(filas)
+                logging.info(f"💾 Guardado en {nombre_variable}: {filas[-1][2]}",
+                             extra={'muestreo': MUESTREO_LOG_GUARDADO})
+        if rechazadas:
+            await self.cuarentena.encolar([('quarantine', rechazadas)])
+        self.lotes += 1
+
+    async def _estadisticas_periodicas(self):
+        while True:
+            await asyncio.sleep(ESTADISTICAS_CADA_S)
+            logging.info(f"📊 Ingesta {self.name}: {self.estadisticas()}")
+            logging.info(f"📊 Tópicos: {self.esquemas.estadisticas()}")
+
+
+class PuenteAsyncio:
+    """
+    Conecta el socket de un mqtt.Client (paho 1.x) al bucle asyncio en lugar
+    de loop_forever(): lectura/escritura con add_reader/add_writer y
+    loop_misc() (keepalive, reintentos QoS) cada segundo.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.sock = None
+        self.pausado = False
+        client.on_socket_open = self._abierto
+        client.on_socket_close = self._cerrado
+        client.on_socket_register_write = self._registrar_escritura
+        client.on_socket_unregister_write = self._quitar_escritura
+
+    def _abierto(self, client, userdata, sock):
+        self.sock = sock
+        if not self.pausado:
+            self.loop.add_reader(sock, client.loop_read)
+
+    def _cerrado(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        self.sock = None
+
+    def _registrar_escritura(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _quitar_escritura(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    def pausar(self):
+        self.pausado = True
+        if self.sock is not None:
+            self.loop.remove_reader(self.sock)
+
+    def reanudar(self):
+        self.pausado = False
+        if self.sock is not None:
+            self.loop.add_reader(self.sock, self.client.loop_read)
+
+    async def mantener(self, detener, reintento_s=5):
+        """Conecta, atiende loop_misc() y reconecta hasta que se active `detener`."""
+        conectado = False
+        while not detener.is_set():
+            if not conectado:
+                try:
+                    conectado = self.client.connect(BROKER, PORT, 60) == mqtt.MQTT_ERR_SUCCESS
+                except OSError as e:
+                    logging.error(f"❌ No se pudo conectar a {BROKER}:{PORT}: {e}")
+            elif self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                logging.warning("⚠️ Conexión MQTT perdida, reintentando...")
+                conectado = False
+            try:
+                await asyncio.wait_for(detener.wait(), 1 if conectado else reintento_s)
+            except asyncio.TimeoutError:
+                pass
+
+
+def crear_escritor(base_dir, nombre="escritor", motor="hilos"):
+    """
+    Escritor con sus propios destinos bajo `base_dir` (uno local + uno por
+    equipo remoto): EscritorEnSegundoPlano, o IngestaAsync si motor="asyncio".
+    """
+    if STORAGE_BACKEND == "sqlite":
+        destinos = [AlmacenSQLite(os.path.join(base_dir, 'db', os.path.basename(SQLITE_DB)),
+                                  HEADERS, exportar_csv_en=base_dir)]
+    else:
+        destinos = [RegistroCSV(base_dir, HEADERS, CSV_MAX_ARCHIVOS_ABIERTOS)]
+    if ALMACEN_BINARIO:
+        columnas = {variable: len(encabezado) - 1 for variable, encabezado in HEADERS.items()}
+        destinos.append(AlmacenBinario(base_dir, columnas, BINARIO_TAM_VALOR, CSV_MAX_ARCHIVOS_ABIERTOS))
+    if RESUMENES:
+        destinos.append(AlmacenResumenes(os.path.join(base_dir, CARPETA_RESUMENES), HEADERS))
+
+    cuarentena = RegistroCSV(base_dir, ENCABEZADO_CUARENTENA, max_abiertos=1)
+    if motor == "asyncio":
+        destinos.append(EstadisticasMuestras())
+        return IngestaAsync(destinos, esquemas, cuarentena, nombre=nombre)
+    return EscritorEnSegundoPlano(destinos, esquemas, cuarentena, nombre=nombre)
+
+esquemas = RegistroEsquemas(TOPICS, HEADERS, histograma=metrica_parseo)
+escritor = crear_escritor(LOG_DIR_BASE, motor=MOTOR)
+
+# Escritores de equipos remotos: (region, equipo) -> EscritorEnSegundoPlano
+# Se crean al llegar el primer mensaje de cada equipo y corren en paralelo
+escritores_sitio = {}
+NOMBRE_VALIDO = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def escritor_de_sitio(region, equipo):
+    clave = (region, equipo)
+    esc = escritores_sitio.get(clave)
+    if esc is not None:
+        return esc
+
+    # Los nombres terminan en rutas de disco: no aceptar "..", "/", etc.
+    if not (NOMBRE_VALIDO.match(region) and NOMBRE_VALIDO.match(equipo)):
+        logging.warning(f"⚠️ Región/equipo inválido en tópico: {region}/{equipo}")
+        return None
+    if len(escritores_sitio) >= MAX_EQUIPOS:
+        logging.warning(f"⚠️ Límite de {MAX_EQUIPOS} equipos alcanzado, se ignora {region}/{equipo}")
+        return None
+
+    esc = crear_escritor(os.path.join(LOG_DIR_SITIOS, region, equipo), nombre=f"escritor-{region}-{equipo}")
+    esc.start()
+    escritores_sitio[clave] = esc
+    logging.info(f"🛰️ Nuevo equipo remoto: {region}/{equipo}")
+    return esc
+
+def _por_escritor(campo):
+    """Para las métricas: {(nombre del escritor,): estadisticas()[campo]} de todos los escritores."""
+    todos = [escritor] + list(escritores_sitio.values())
+    return {(e.name,): e.estadisticas().get(campo, 0) for e in todos}
+
+for _campo, _tipo, _ayuda in [
+        ('profundidad', 'medidor', 'Mensajes en cola sin escribir'),
+        ('max_profundidad', 'medidor', 'Máxima profundidad de cola observada'),
+        ('archivos_abiertos', 'medidor', 'Archivos de datos abiertos'),
+        ('recibidos', 'contador', 'Mensajes encolados'),
+        ('descartados', 'contador', 'Mensajes descartados por cola llena'),
+        ('escritos', 'contador', 'Filas escritas'),
+        ('errores', 'contador', 'Errores de escritura'),
+        ('lotes', 'contador', 'Lotes procesados'),
+        ('ts_atrasados', 'contador', 'Filas con hora anterior a la ya escrita (guardadas con la de recepción)'),
+        ('pausas', 'contador', 'Pausas de lectura por contrapresión (motor asyncio)')]:
+    _nombre = f"anii_listener_{_campo}" + ('_total' if _tipo == 'contador' else '')
+    getattr(metricas, _tipo)(_nombre, _ayuda, ['escritor'], funcion=lambda c=_campo: _por_escritor(c))
+
+metricas.contador('anii_listener_rechazados_total', 'Payloads rechazados (a cuarentena) por tópico', ['topic'],
+                  funcion=lambda: {(t,): e.rechazados for t, e in esquemas.esquemas.items()})
+metricas.medidor('anii_listener_descriptores_abiertos', 'Descriptores de archivo abiertos por el proceso',
+                 funcion=archivos_abiertos_proceso)
 
 # =========================================================
 # LÓGICA MQTT
@@ -129,7 +819,10 @@ def on_connect(client, userdata, flags, rc):
     if rc == 0:
         logging.info(f"✅ Conectado al Broker MQTT local (Código: {rc})")
         # Suscribirse a todos los tópicos
-        for topic in TOPICS.keys():
+        topics = list(TOPICS.keys())
+        if MULTI_SITIO:
+            topics += [f"{PREFIJO_SITIO}/+/+/measure/#", f"{PREFIJO_SITIO}/+/+/control/#"]
+        for topic in topics:
             client.subscribe(topic)
             logging.info(f"   Suscrito a: {topic}")
     else:
@@ -138,30 +831,99 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     try:
         topic = msg.topic
-        payload = msg.payload.decode()
-        
+
         if topic in TOPICS:
-            nombre_variable = TOPICS[topic]
-            escribir_log(nombre_variable, payload)
+            metrica_mensajes.inc(topic)
+            escritor.encolar(topic, msg.payload)
+        elif MULTI_SITIO and topic.startswith(PREFIJO_SITIO + "/"):
+            # site/<region>/<equipo>/<tópico local>
+            partes = topic.split('/', 3)
+            if len(partes) == 4 and partes[3] in TOPICS:
+                esc = escritor_de_sitio(partes[1], partes[2])
+                if esc is not None:
+                    metrica_mensajes.inc(topic)
+                    esc.encolar(partes[3], msg.payload)
+            else:
+                metrica_mensajes.inc('desconocido')
+                logging.warning(f"⚠️ Tópico desconocido recibido: {topic}")
         else:
+            metrica_mensajes.inc('desconocido')
             logging.warning(f"⚠️ Tópico desconocido recibido: {topic}")
-            
+
     except Exception as e:
         logging.error(f"❌ Error procesando mensaje MQTT: {e}")
 
+async def principal_asyncio(client):
+    """MOTOR = "asyncio": socket MQTT e ingesta en el mismo bucle, hasta SIGTERM/SIGINT."""
+    loop = asyncio.get_running_loop()
+    puente = PuenteAsyncio(loop, client)
+    escritor.al_pausar = puente.pausar
+    escritor.al_reanudar = puente.reanudar
+
+    detener = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, detener.set)
+
+    ingesta = loop.create_task(escritor.correr())
+    logging.info(f"Intentando conectar a {BROKER}:{PORT}...")
+    await puente.mantener(detener)
+
+    logging.info("Deteniendo Logger (vaciando destinos)...")
+    client.disconnect()
+    escritor.detener()
+    await ingesta
+
 # =========================================================
 # BUCLE PRINCIPAL
 # =========================================================
 
 if __name__ == "__main__":
+    # Exportación manual de CSV desde la base: pymqtt-listener.py --exportar 2025_12_11
+    if len(sys.argv) == 3 and sys.argv[1] == "--exportar":
+        archivos = exportar_csv(SQLITE_DB, sys.argv[2], LOG_DIR_BASE, HEADERS)
+        logging.info(f"📤 Exportados {len(archivos)} CSV del día {sys.argv[2]}")
+        sys.exit(0)
+
+    # Resúmenes de un día desde sus CSV: pymqtt-listener.py --resumenes 2025_12_11
+    if len(sys.argv) == 3 and sys.argv[1] == "--resumenes":
+        variables = recalcular_resumenes(LOG_DIR_BASE, os.path.join(LOG_DIR_BASE, CARPETA_RESUMENES),
+                                         sys.argv[2], HEADERS)
+        logging.info(f"📈 Resúmenes del día {sys.argv[2]} recalculados: {', '.join(variables) or 'sin datos'}")
+        sys.exit(0)
+
     logging.info("--- 📝 INICIANDO LOGGER MQTT ---")
     logging.info(f"    Directorio base: {LOG_DIR_BASE}")
     logging.info(f"    Log de sistema:  {LOG_FILE}")
 
+    logging.info(f"    Backend:         {STORAGE_BACKEND}")
+    logging.info(f"    Almacenes:       {', '.join(type(d).__name__ for d in escritor.destinos)}")
+    if MULTI_SITIO:
+        logging.info(f"    Multi-sitio:     {PREFIJO_SITIO}/<region>/<equipo>/... -> {LOG_DIR_SITIOS}")
+    logging.info(f"    Durabilidad:     {DURABILIDAD} (lote {LOTE_MAX_FILAS} filas / {LOTE_MAX_ESPERA_S}s)")
+    logging.info(f"    Motor:           {MOTOR}")
+    if METRICAS_PUERTO:
+        servir_metricas(metricas, METRICAS_PUERTO, METRICAS_HOST)
+        logging.info(f"    Métricas:        http://{METRICAS_HOST}:{METRICAS_PUERTO}/metrics")
+
     client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
 
+    if MOTOR == "asyncio":
+        try:
+            asyncio.run(principal_asyncio(client))
+        except Exception as e:
+            logging.critical(f"❌ Error fatal en el motor asyncio: {e}")
+        finally:
+            for esc in list(escritores_sitio.values()):
+                esc.detener()
+        sys.exit(0)
+
+    # systemd detiene con SIGTERM: desconectar para salir de loop_forever
+    # y vaciar la cola antes de terminar
+    signal.signal(signal.SIGTERM, lambda signum, frame: client.disconnect())
+    escritor.start()
+
     try:
         logging.info(f"Intentando conectar a {BROKER}:{PORT}...")
         client.connect(BROKER, PORT, 60)
@@ -169,4 +931,8 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logging.info("Deteniendo Logger por solicitud del usuario.")
     except Exception as e:
-        logging.critical(f"❌ Error fatal de conexión: {e}")
\ No newline at end of file
+        logging.critical(f"❌ Error fatal de conexión: {e}")
+    finally:
+        escritor.detener()
+        for esc in list(escritores_sitio.values()):
+            esc.detener()
@@ -5,6 +5,7 @@ import requests
 import logging
 import urllib3
 from datetime import datetime, timedelta
+from anii_logging import configurar_logging
 
 # =========================================================
 # CONFIGURACIÓN ESPECÍFICA DEL DISPOSITIVO
@@ -36,26 +37,8 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 # =========================================================
 # CONFIGURACIÓN DE LOGGING (MENSUAL)
 # =========================================================
-# 1. Obtenemos el mes actual para guardar el log de ESTE script
-current_month_str = datetime.now().strftime('%Y_%m')
-LOG_MONTH_DIR = os.path.join(LOG_DIR_BASE, current_month_str)
-LOG_FILE = os.path.join(LOG_MONTH_DIR, 'uploader.log')
-
-# Crear carpeta de logs si no existe
-if not os.path.exists(LOG_MONTH_DIR):
-    try:
-        os.makedirs(LOG_MONTH_DIR)
-    except:
-        pass
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# "/home/log/2025_12/uploader.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE = configurar_logging('uploader.log', LOG_DIR_BASE)
 
 def log(msg):
     # Wrapper para logging
@@ -4,6 +4,7 @@ import os
 import requests
 import logging
 from datetime import datetime
+from anii_logging import configurar_logging
 
 #########################################################
 ################ Configuracion OpenWeather ##############
@@ -25,32 +26,8 @@ SAMPLE_TIME = 900  # 15 minutos (Ajustado para coincidir con la logica general)
 
 LOG_DIR_BASE = '/home/log'
 
-# 1. Obtenemos el mes actual: "2025_12"
-current_month_str = datetime.now().strftime('%Y_%m')
-
-# 2. Definimos la carpeta del mes para LOGS DE SISTEMA
-LOG_MONTH_DIR = os.path.join(LOG_DIR_BASE, current_month_str)
-
-# 3. Definimos el archivo final: "/home/log/2025_12/weather-logger.log"
-LOG_FILE = os.path.join(LOG_MONTH_DIR, 'weather-logger.log')
-
-# 4. Crear estructura de carpetas si no existe
-if not os.path.exists(LOG_MONTH_DIR):
-    try:
-        os.makedirs(LOG_MONTH_DIR)
-        print(f"Carpeta de logs mensuales creada: {LOG_MONTH_DIR}")
-    except OSError as e:
-        print(f"CRITICAL ERROR: No se pudo crear directorio de logs {LOG_MONTH_DIR}: {e}")
-
-# Configuracion del Logger
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# "/home/log/2025_12/weather-logger.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE = configurar_logging('weather-logger.log', LOG_DIR_BASE)
 
 # Cabecera del CSV de DATOS
 HEADER_WEATHER = ['Time', 'Condition', 'Description', 'Temp(°C)', 'Humidity(%)', 'Clouds(%)', 'Pressure(hPa)']
@@ -10,11 +10,15 @@
 #### - cloudflare.service                                 ####
 #### - index.html                                         ####
 #### - meca.png                                           ####
+#### - mqtt-bridge.py                                     ####
+#### - mqtt-bridge.service                                ####
 #### - notifier.py                                        ####
 #### - notifier.service                                   ####
 #### - scada.service                                      ####
+#### - scada@.service                                     ####
 #### - utec.png                                           ####
 #### deben estar en la carpeta Linux/scada.               ####
+#### Además se usan los módulos installation/anii_*.py    ####
 ##############################################################
 
 mkdir /home/scada
@@ -36,6 +40,20 @@ else
     echo "⚠️  No se encontró app.py en el directorio"
 fi
 
+##############################################################
+####      Módulos comunes (importados por app.py)         ####
+##############################################################
+
+#Los módulos anii_*.py van junto a app.py en /home/scada
+
+for modulo in installation/anii_*.py; do
+    if [ -f "$modulo" ]; then
+        sudo cp "$modulo" /home/scada
+    else
+        echo "⚠️  No se encontraron módulos anii_*.py en el directorio"
+    fi
+done
+
 ##############################################################
 ####               Ubicación de index.html                ####
 ##############################################################
@@ -49,6 +67,32 @@ else
     echo "⚠️  No se encontró index.html en el directorio"
 fi
 
+##############################################################
+####               Ubicación de mqtt-bridge               ####
+##############################################################
+
+#El puente MQTT (mqtt-bridge.py) va en /home/scada. Es opcional: queda instalado
+#pero deshabilitado. Para usarlo (varios workers web): MQTT_PUENTE en app.py y
+#sudo systemctl enable --now mqtt-bridge
+
+if [ -f "scada/mqtt-bridge.py" ]; then
+    sudo mv scada/mqtt-bridge.py /home/scada
+    sudo chmod +x /home/scada/mqtt-bridge.py
+else
+    echo "⚠️  No se encontró mqtt-bridge.py en el directorio"
+fi
+
+if [ -f "scada/mqtt-bridge.service" ]; then
+    sudo mv scada/mqtt-bridge.service /etc/systemd/system/
+    sudo chmod 777 /etc/systemd/system/mqtt-bridge.service
+    sudo systemctl daemon-reload
+    #sudo systemctl enable mqtt-bridge.service
+    #sudo systemctl start mqtt-bridge.service
+	#sudo systemctl status mqtt-bridge.service
+else
+    echo "⚠️  No se encontró mqtt-bridge.service en el directorio"
+fi
+
 ##############################################################
 ####             Ubicación de scada.service               ####
 ##############################################################
@@ -67,6 +111,17 @@ else
     echo "⚠️  No se encontró scada.service en el directorio"
 fi
 
+#Workers web adicionales (comparten el puerto 5000 y el puente MQTT, que hay que habilitar antes).
+#La plantilla queda instalada; para sumar uno: sudo systemctl enable --now scada@2
+
+if [ -f "scada/scada@.service" ]; then
+    sudo mv scada/scada@.service /etc/systemd/system/
+    sudo chmod 777 /etc/systemd/system/scada@.service
+    sudo systemctl daemon-reload
+else
+    echo "⚠️  No se encontró scada@.service en el directorio"
+fi
+
 sudo mv scada/utec.png /home/scada/static
 sudo mv scada/anii.png /home/scada/static
 sudo mv scada/meca.png /home/scada/static
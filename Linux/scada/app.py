@@ -1,31 +1,37 @@
 import eventlet
 eventlet.monkey_patch()
+import eventlet.wsgi
+from eventlet import tpool
 
-from flask import Flask, render_template, jsonify, request, send_from_directory
-from flask_socketio import SocketIO
+from flask import Flask, render_template, jsonify, request, send_from_directory, Response, g
+from flask_socketio import SocketIO, join_room, leave_room
 import paho.mqtt.client as mqtt
 import os
-import csv
+import re
+import gzip
+import json
+import time
+import shutil
+import struct
+import zipfile
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from anii_logging import configurar_logging
+from anii_protocol import TOPICS, RegistroEsquemas, ErrorPayload
+from anii_metrics import RegistroMetricas, TIPO_CONTENIDO, archivos_abiertos_proceso, arranque_proceso
+from anii_catalogo import CatalogoArchivos
+from anii_puente import ClientePuente
+from anii_storage import (consultar_rango, consultar_ultima, ultima_fila_csv, leer_resumenes, leer_rango_binario, RESOLUCIONES_RESUMEN,
+                          BufferCircular, LectorCSV, reducir_lttb, reducir_minmax, agrupar_resumenes)
 
 # =========================================================
 # CONFIGURACIÓN DE LOGGING
 # =========================================================
 LOG_DIR_BASE = '/home/log'
-current_month_str = datetime.now().strftime('%Y_%m')
-LOG_MONTH_DIR = os.path.join(LOG_DIR_BASE, current_month_str)
-LOG_FILE = os.path.join(LOG_MONTH_DIR, 'scada.log')
 
-if not os.path.exists(LOG_MONTH_DIR):
-    try: os.makedirs(LOG_MONTH_DIR)
-    except: pass
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()]
-)
+# "/home/log/2025_12/scada.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE = configurar_logging('scada.log', LOG_DIR_BASE)
 
 def log(msg):
     logging.info(msg)
@@ -37,14 +43,223 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secreto_monitor_v3'
 socketio = SocketIO(app, cors_allowed_origins='*', async_mode='eventlet')
 
+# Descargas (/download): send_from_directory ya responde Range/If-Range/HEAD
+# (206, Accept-Ranges) y entrega el archivo con el wsgi.file_wrapper del
+# servidor, que con sendfile no pasa por Python. eventlet.wsgi no trae uno:
+# en ese caso se usa ArchivoEnBloques (bloques de DESCARGA_BLOQUE, cediendo
+# el loop entre bloque y bloque para no frenar Socket.IO).
+DESCARGA_BLOQUE = 256 * 1024
+
+class ArchivoEnBloques:
+    """wsgi.file_wrapper cooperativo; seek/tell para que los Range no lean desde el principio."""
+    def __init__(self, archivo, tamano_bloque=DESCARGA_BLOQUE):
+        self.archivo = archivo
+        self.tamano_bloque = max(tamano_bloque, DESCARGA_BLOQUE)
+
+    def seekable(self):
+        return hasattr(self.archivo, 'seekable') and self.archivo.seekable()
+
+    def seek(self, *args):
+        self.archivo.seek(*args)
+
+    def tell(self):
+        return self.archivo.tell()
+
+    def close(self):
+        self.archivo.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        socketio.sleep(0)
+        datos = self.archivo.read(self.tamano_bloque)
+        if datos:
+            return datos
+        raise StopIteration
+
+class _ConArchivoEnBloques:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        environ.setdefault('wsgi.file_wrapper', ArchivoEnBloques)
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = _ConArchivoEnBloques(app.wsgi_app)
+
 BROKER = "localhost"
 PORT = 1883
 
-TOPICS = [
-    "measure/environment", "measure/radiation", "measure/temperature", 
-    "measure/level_in", "measure/level_out", "measure/chamber_level",
-    "control/in_valve", "control/out_valve", "control/process"
-]
+# MQTT por el puente (mqtt-bridge.py): una sola conexión al broker para
+# todos los workers web. Con el puente se pueden levantar más workers
+# (scada@2.service, ...) que comparten el puerto (SO_REUSEPORT) y el
+# kernel reparte las conexiones. None = cliente paho en este proceso (por
+# defecto); para usar el puente: habilitar mqtt-bridge.service y poner la ruta.
+MQTT_PUENTE = None
+#MQTT_PUENTE = '/run/anii-mqtt.sock'
+PUERTO_WEB = 5000
+
+# Debe coincidir con STORAGE_BACKEND / SQLITE_DB de pymqtt-listener.py
+STORAGE_BACKEND = "csv"
+#STORAGE_BACKEND = "sqlite"
+SQLITE_DB = '/home/log/db/anii.db'
+
+# Historial del día desde los resúmenes del listener (RESUMENES = True):
+# un punto (media) por intervalo + las muestras crudas del intervalo en curso
+# (desde el .bin). None = todas las muestras del día (crudas, por defecto).
+HISTORIAL_RESOLUCION = None
+#HISTORIAL_RESOLUCION = '1m'
+LOG_DIR_RESUMENES = os.path.join(LOG_DIR_BASE, 'rollups')
+
+# /api/history se sirve desde memoria: un buffer circular por variable que
+# se carga una vez al arrancar (archivos del día) y después lo alimenta
+# on_message. Con muestras cada 1-5 s, 20000 puntos cubren el día.
+VARIABLES_HISTORIAL = ['env_temp', 'env_hum', 'radiation', 'int_temp', 'lvl_in', 'chamber_level', 'lvl_out']
+HISTORIAL_MAX_PUNTOS = 20000
+MAX_DESFASE_TS_S = 3600      # Igual que el listener: hora del dispositivo si no difiere más que esto
+
+# /api/history?since=env_temp:1234,radiation:987&id=...: solo lo posterior al
+# cursor (número de la última muestra vista de cada variable), para que un
+# panel que se reconecta no vuelva a bajar el día entero. Los números
+# empiezan de nuevo en cada arranque; el id lo detecta.
+HISTORIAL_ID = str(int(time.time() * 1000))
+
+# /api/history?var=radiation&from=2025-12-01&to=2025-12-08&points=500[&method=minmax]
+
+# Codificación binaria opcional (&format=bin en /api/history, 'formato': 'bin'
+# al suscribirse por Socket.IO): arreglos little-endian con la hora como
+# diferencias en ms en lugar de un {'time', 'value'} JSON por punto. Si
+# alguna diferencia no entra en un i32 (huecos de más de ~24 días) esa
+# serie va con la hora de cada punto en f64 (bandera HORAS_F64).
+# Ver codificar_series() / codificar_datos() y leerSeries() en index.html.
+TIPO_BINARIO = 'application/octet-stream'
+HORAS_F64 = 4
+
+# Caché HTTP y compresión: las respuestas de la API llevan ETag (304 si no
+# cambiaron) y van con gzip si el cliente lo acepta. Los archivos de días
+# cerrados casi no cambian: caché por CACHE_DIA_CERRADO y después el
+# navegador revalida con ETag/Last-Modified (304 si sigue igual; un día se
+# puede reescribir, p.ej. la exportación de SQLite o filas que llegan tarde).
+# Los CSV se sirven ya comprimidos (se regeneran en LOG_DIR_COMPRIMIDOS si
+# cambia el original; carpeta oculta en /api/files).
+COMPRIMIR_MIN_BYTES = 1024
+COMPRIMIR_NIVEL = 6
+TIPOS_COMPRIMIBLES = ('application/json', 'text/', 'application/javascript', TIPO_BINARIO)
+LOG_DIR_COMPRIMIDOS = os.path.join(LOG_DIR_BASE, '.comprimidos')
+CACHE_DIA_CERRADO = 'public, max-age=3600'
+# /api/files?path=2025_12&limit=200&cursor=...&sort=name|size|mtime&order=asc|desc
+# desde un catálogo en memoria (anii_catalogo.py) que invalida inotify
+ARCHIVOS_LIMITE_DEFECTO = 200
+ARCHIVOS_LIMITE_MAX = 1000
+
+# /download-folder/<carpeta>: zip armado al vuelo, de a ZIP_BLOQUE bytes
+# (sin archivo temporal; la memoria no depende del tamaño de la carpeta)
+ZIP_BLOQUE = 64 * 1024
+ZIP_SIN_COMPRIMIR = ('.gz', '.zip', '.bin')   # Ya comprimidos o binarios: se guardan tal cual
+
+PATRON_DIA = re.compile(r'^\d{4}_\d{2}_\d{2}$')
+HISTORIAL_PUNTOS_DEFECTO = 500
+HISTORIAL_PUNTOS_MAX = 5000
+HISTORIAL_PUNTOS_MIN = 2   # Primer y último punto
+HISTORIAL_MAX_DIAS = 400
+HISTORIAL_RESUMENES_DESDE_S = 2 * 86400   # Rangos más cortos: muestras crudas, no resúmenes
+
+# Variable web -> (variable del listener, columna del CSV)
+MAPA_HISTORIAL = {
+    'env_temp': ('environment', 1), 'env_hum': ('environment', 2), 'env_pres': ('environment', 3),
+    'radiation': ('radiation', 1), 'int_temp': ('temperature', 1),
+    'chamber_level': ('chamber_level', 1),
+    'lvl_in': ('level_in', 3), 'lvl_out': ('level_out', 3)
+}
+
+# Tópico -> [(clave web, índice del valor en la muestra)]
+VARIABLES_WEB = {
+    "measure/environment":   [('env_temp', 0), ('env_hum', 1), ('env_pres', 2)],
+    "measure/level_in":      [('lvl_in', 2)],
+    "measure/level_out":     [('lvl_out', 2)],
+    "measure/chamber_level": [('chamber_level', 0)],
+    "measure/radiation":     [('radiation', 0)],
+    "measure/temperature":   [('int_temp', 0)],
+    "control/in_valve":      [('in_valve', 0)],
+    "control/out_valve":     [('out_valve', 0)],
+    "control/process":       [('process', 0)],
+}
+VARIABLES_EN_VIVO = [key for claves in VARIABLES_WEB.values() for key, _ in claves]
+
+# Datos en vivo: en lugar de un evento por variable, los cambios se juntan y
+# cada EMISION_TICK_S sale un evento 'datos' por sala con el último valor de
+# lo que cambió. Sala = variables que muestra el cliente + su intervalo
+# (uno de EMISION_INTERVALOS_S, p.ej. más lento con la pestaña oculta).
+EMISION_TICK_S = 0.25
+EMISION_INTERVALOS_S = (0.25, 1, 5)
+
+# Arranque en frío (p.ej. después de un corte de luz): los últimos valores
+# se guardan cada INSTANTANEA_INTERVALO_S y se cargan al arrancar, para que
+# la primera página no muestre "--" hasta que cada sensor vuelva a publicar.
+# Sin instantánea (o para lo que falte) se usa la última fila de los
+# archivos, leída desde el final. No se muestran valores más viejos que
+# INSTANTANEA_MAX_EDAD_S. Los controles no se restauran: su estado es el
+# del equipo, no el que tenía el SCADA antes del corte.
+INSTANTANEA_ARCHIVO = os.path.join(LOG_DIR_BASE, '.scada_ultimos.json')
+INSTANTANEA_INTERVALO_S = 30
+INSTANTANEA_MAX_EDAD_S = 6 * 3600
+VARIABLES_INSTANTANEA = [key for topic, claves in VARIABLES_WEB.items() if topic.startswith('measure/')
+                         for key, _ in claves]
+
+# Comandos web (control/*): se publican con QoS 1 y quedan esperando el
+# acuse del broker (PUBACK, on_publish de paho) hasta COMANDO_TIMEOUT_S.
+# El acuse solo dice que el broker aceptó el comando, no que la unidad de
+# control lo aplicó (no publica su estado). Por el puente (MQTT_PUENTE) no
+# hay acuse: el comando queda como entregado al puente.
+COMANDO_QOS = 1
+COMANDO_TIMEOUT_S = 5
+TOPICOS_COMANDO = [topic for topic in VARIABLES_WEB if topic.startswith('control/')]
+
+# =========================================================
+# MÉTRICAS (GET /metrics, formato Prometheus)
+# =========================================================
+metricas = RegistroMetricas()
+metrica_mensajes = metricas.contador('anii_scada_mensajes_total', 'Mensajes MQTT recibidos por tópico', ['topic'])
+metrica_parseo = metricas.histograma('anii_scada_parseo_segundos', 'Latencia de parseo de un payload', ['topic'])
+metrica_emisiones = metricas.contador('anii_scada_emisiones_total', 'Valores enviados por Socket.IO por variable', ['sensor'])
+metrica_tramas = metricas.contador('anii_scada_tramas_total', 'Eventos Socket.IO emitidos (uno por sala y tick)')
+metrica_clientes = metricas.medidor('anii_scada_clientes_websocket', 'Clientes Socket.IO conectados')
+metrica_http = metricas.histograma('anii_scada_http_segundos', 'Duración de las respuestas HTTP por ruta', ['ruta'])
+metrica_comando = metricas.histograma('anii_scada_comando_ack_broker_segundos',
+                                     'Desde que se publica un comando web hasta el acuse (PUBACK) del broker', ['topic'])
+metrica_comandos = metricas.contador('anii_scada_comandos_total',
+                                     'Comandos web por resultado (ack_broker, sin_ack_broker, puente, error)',
+                                     ['topic', 'resultado'])
+metricas.medidor('anii_scada_comandos_sin_ack_broker', 'Comandos web publicados que esperan el PUBACK del broker',
+                 funcion=lambda: len(comandos_en_vuelo))
+metricas.medidor('anii_scada_descriptores_abiertos', 'Descriptores de archivo abiertos por el proceso',
+                 funcion=archivos_abiertos_proceso)
+metricas.medidor('anii_scada_salas', 'Salas de datos en vivo activas', funcion=lambda: len(salas))
+metrica_clientes.fijar(0)
+
+# Tiempos de arranque (desde que arrancó el proceso, imports incluidos)
+arranque = {}   # fase -> segundos
+segundos_booteo, _ = arranque_proceso()
+metricas.medidor('anii_scada_arranque_segundos', 'Segundos desde que arrancó el proceso hasta cada fase del arranque',
+                 ['fase'], funcion=lambda: {(fase,): s for fase, s in arranque.items()})
+metricas.medidor('anii_scada_arranque_booteo_segundos', 'Segundos desde el booteo del sistema hasta que arrancó el proceso',
+                 funcion=lambda: segundos_booteo)
+
+def marcar_arranque(fase):
+    """Registra la primera vez que se llega a `fase` (las siguientes no cuestan más que un lookup)."""
+    if fase in arranque:
+        return
+    arranque[fase] = segundos = round(arranque_proceso()[1], 3)
+    log(f"⏱️ Arranque: {fase} a los {segundos:.2f} s")
+
+# Catálogo de /home/log para el explorador de archivos
+catalogo = CatalogoArchivos(LOG_DIR_BASE, ceder=lambda: socketio.sleep(0))
+metricas.contador('anii_scada_catalogo_escaneos_total', 'Carpetas leídas del disco por el catálogo de archivos',
+                  funcion=lambda: catalogo.escaneos)
+
+# Mismos parsers que el listener (anii_protocol.py)
+esquemas = RegistroEsquemas(histograma=metrica_parseo)
 
 last_data = {
     "lvl_in_dist": "--", "lvl_in_weight": "--", "int_temp": "--", "lvl_out_dist": "--",
@@ -52,6 +267,7 @@ last_data = {
     "chamber_amount": "--", "lvl_in": "--", "lvl_out": "--",
     "in_valve": "0", "out_valve": "0", "process": "0"
 }
+hora_datos = {}   # key -> epoch del valor en last_data (para la instantánea)
 
 # =========================================================
 # HISTORIAL
@@ -62,39 +278,379 @@ def get_today_history(variable_web):
         now = datetime.now()
         date_str = now.strftime('%Y_%m_%d')
         daily_dir = os.path.join(LOG_DIR_BASE, date_str)
-        
-        map_config = {
-            'env_temp': ('environment', 1), 'env_hum': ('environment', 2), 'env_pres': ('environment', 3),
-            'radiation': ('radiation', 1), 'int_temp': ('temperature', 1),
-            'chamber_level': ('chamber_level', 1),
-            'lvl_in': ('level_in', 3), 'lvl_out': ('level_out', 3)
-        }
-        
-        if variable_web not in map_config: return []
-        file_suffix, col_idx = map_config[variable_web]
+
+        if variable_web not in MAPA_HISTORIAL: return []
+        file_suffix, col_idx = MAPA_HISTORIAL[variable_web]
+
+        if HISTORIAL_RESOLUCION:
+            desde_resumenes = historial_desde_resumenes(daily_dir, date_str, file_suffix, col_idx)
+            if desde_resumenes is not None:
+                return desde_resumenes
+
+        if STORAGE_BACKEND == "sqlite":
+            # Consulta indexada desde la medianoche (filas: ts_ms, v1, v2, ...)
+            inicio_ms = int(now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+            for row in consultar_rango(SQLITE_DB, file_suffix, inicio_ms):
+                if len(row) > col_idx and row[col_idx] is not None:
+                    hora = datetime.fromtimestamp(row[0] / 1000).strftime('%H:%M:%S')
+                    data_points.append({'time': hora, 'value': row[col_idx]})
+            return data_points
+
         filename = f"{date_str}_{file_suffix}.csv"
         file_path = os.path.join(daily_dir, filename)
-        
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                reader = csv.reader(f)
-                next(reader, None) 
-                for row in reader:
-                    if len(row) > col_idx:
-                        try:
-                            val = float(row[col_idx])
-                            data_points.append({'time': row[0], 'value': val})
-                        except ValueError: pass
+
+        # Todas las columnas en una pasada; después solo lo agregado al archivo
+        tabla = lector_csv.leer(file_path)
+        if tabla is not None:
+            for hora, val in zip(tabla.horas, tabla.columna(col_idx)):
+                if val == val:   # no NaN
+                    data_points.append({'time': hora, 'value': val})
     except Exception as e:
         logging.error(f"Error historial {variable_web}: {e}")
     return data_points
 
+def historial_desde_resumenes(daily_dir, date_str, file_suffix, col_idx):
+    """Puntos del día desde los resúmenes (O(intervalos)); None si no hay resúmenes de la variable."""
+    intervalos = leer_resumenes(LOG_DIR_RESUMENES, file_suffix, HISTORIAL_RESOLUCION)
+    if not intervalos:
+        return None
+
+    data_points = []
+    for inicio_ms, _, columnas in intervalos:
+        if len(columnas) >= col_idx:
+            hora = datetime.fromtimestamp(inicio_ms / 1000).strftime('%H:%M:%S')
+            data_points.append({'time': hora, 'value': columnas[col_idx - 1][2]})
+
+    # Muestras posteriores al último intervalo cerrado (búsqueda binaria en el .bin)
+    ruta_bin = os.path.join(daily_dir, f"{date_str}_{file_suffix}.bin")
+    if os.path.exists(ruta_bin):
+        desde_ms = intervalos[-1][0] + 1000 * RESOLUCIONES_RESUMEN[HISTORIAL_RESOLUCION]
+        for ts_ms, valores in leer_rango_binario(ruta_bin, desde_ms):
+            if len(valores) >= col_idx and valores[col_idx - 1] == valores[col_idx - 1]:   # no NaN
+                hora = datetime.fromtimestamp(ts_ms / 1000).strftime('%H:%M:%S')
+                data_points.append({'time': hora, 'value': round(valores[col_idx - 1], 3)})
+    return data_points
+
+historial = {key: BufferCircular(HISTORIAL_MAX_PUNTOS) for key in VARIABLES_HISTORIAL}
+historial_cubre_desde = None   # Medianoche del día cargado en sembrar_historial()
+
+# CSV del día parseados una vez por archivo (environment sirve a 3 variables)
+lector_csv = LectorCSV()
+
+def _medianoche():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+def sembrar_historial():
+    """Carga lo que ya hay del día en los archivos (una sola vez, antes de conectar MQTT)."""
+    global historial_cubre_desde
+    medianoche = _medianoche()
+    for key, buffer in historial.items():
+        puntos = []
+        for p in get_today_history(key):
+            h, m, sg = (int(x) for x in p['time'].split(':'))
+            puntos.append((medianoche + h * 3600 + m * 60 + sg, p['value']))
+        buffer.extender(puntos)
+        socketio.sleep(0)   # Corre en segundo plano: las páginas se atienden entre variable y variable
+    # Recién ahora historial_rango() puede usar los buffers
+    historial_cubre_desde = medianoche
+    log(f"📚 Historial en memoria cargado: { {k: len(b) for k, b in historial.items()} }")
+
+def historial_de_hoy(key, puntos=None):
+    """[{'time': 'HH:MM:SS', 'value': v}, ...] del día desde el buffer en memoria (reducido a `puntos` con LTTB)."""
+    medianoche = _medianoche()
+    tiempos, valores = historial[key].desde(medianoche)
+    if puntos:
+        tiempos, valores = reducir_lttb(tiempos, valores, puntos)
+    return _puntos_web(tiempos, valores, medianoche)
+
+def historial_delta(cursores, id_cliente, puntos=None):
+    """
+    {'id', 'cursor', 'data', 'reset'}: lo agregado a cada variable después del
+    cursor del cliente ({'env_temp': 1234, ...}), data[key] = ([tiempos s], [valores]). Las variables sin cursor
+    válido (primera carga, otro arranque del SCADA, hueco mayor que el buffer)
+    vuelven con el día completo y se listan en 'reset' para que el cliente
+    reemplace la serie en lugar de agregarla.
+    """
+    respuesta = {'id': HISTORIAL_ID, 'cursor': {}, 'data': {}, 'reset': []}
+    medianoche = _medianoche()
+    for key, buffer in historial.items():
+        delta = None
+        if id_cliente == HISTORIAL_ID and key in cursores:
+            delta = buffer.desde_secuencia(cursores[key])
+        if delta is None:
+            total = buffer.total
+            tiempos, valores = buffer.desde(medianoche)
+            respuesta['reset'].append(key)
+        else:
+            tiempos, valores, total = delta
+        if puntos:
+            tiempos, valores = reducir_lttb(tiempos, valores, puntos)
+        respuesta['cursor'][key] = total
+        respuesta['data'][key] = (tiempos, valores)
+    return respuesta
+
+def _puntos_web(tiempos, valores, medianoche):
+    """[{'time': 'HH:MM:SS', 'value': v}, ...] (hora local; un delta puede cruzar la medianoche)."""
+    puntos = []
+    for t, v in zip(tiempos, valores):
+        sg = int(t - medianoche) % 86400
+        puntos.append({'time': f"{sg // 3600:02d}:{sg // 60 % 60:02d}:{sg % 60:02d}", 'value': v})
+    return puntos
+
+def _puntos_param(texto):
+    """'points' entre HISTORIAL_PUNTOS_MIN y HISTORIAL_PUNTOS_MAX (más arriba se recorta); ValueError si es menor."""
+    puntos = int(texto)
+    if puntos < HISTORIAL_PUNTOS_MIN:
+        raise ValueError(f"points debe ser al menos {HISTORIAL_PUNTOS_MIN}")
+    return min(puntos, HISTORIAL_PUNTOS_MAX)
+
+def _cursores_param(texto):
+    """'env_temp:1234,radiation:987' -> {'env_temp': 1234, 'radiation': 987}."""
+    cursores = {}
+    for parte in filter(None, texto.split(',')):
+        key, _, numero = parte.partition(':')
+        cursores[key] = int(numero)
+    return cursores
+
+# =========================================================
+# CODIFICACIÓN BINARIA (&format=bin)
+# =========================================================
+# Series ('ANS1'): u8+id | u16 cantidad | por serie: u8+nombre, u8 banderas
+# (1 = reset, 2 = trae min/max), u32 cursor, u32 n, f64 ms del primer punto,
+# n × i32 ms desde el punto anterior, n × f32 valores [, n × f32 min, n × f32 max].
+# Datos en vivo ('AND1'): u8 cantidad | por dato: u8+nombre, u32 seq (0 = sin
+# cursor), f64 valor (NaN = sin dato). Todo little-endian; u8+texto = largo y UTF-8.
+def _texto_bin(texto):
+    crudo = texto.encode()[:255]
+    return struct.pack('<B', len(crudo)) + crudo
+
+def _flotantes(valores):
+    return struct.pack(f'<{len(valores)}f', *(float('nan') if v is None else v for v in valores))
+
+def codificar_series(series, id_historial=''):
+    """series = [{'var', 't' (epoch ms), 'v'[, 'cursor', 'reset', 'min', 'max']}] -> bytes."""
+    partes = [b'ANS1', _texto_bin(id_historial), struct.pack('<H', len(series))]
+    for serie in series:
+        ms = [int(round(t)) for t in serie['t']]
+        minmax = 'min' in serie
+        deltas = [b - a for a, b in zip(ms[:1] + ms, ms)]
+        horas_f64 = any(not -2**31 <= d < 2**31 for d in deltas)
+        banderas = (1 if serie.get('reset') else 0) | (2 if minmax else 0) | (HORAS_F64 if horas_f64 else 0)
+        partes.append(_texto_bin(serie['var']))
+        partes.append(struct.pack('<BIId', banderas, serie.get('cursor', 0), len(ms), ms[0] if ms else 0))
+        if horas_f64:
+            partes.append(struct.pack(f'<{len(ms)}d', *ms))
+        else:
+            partes.append(struct.pack(f'<{len(ms)}i', *deltas))
+        partes.append(_flotantes(serie['v']))
+        if minmax:
+            partes.append(_flotantes(serie['min']))
+            partes.append(_flotantes(serie['max']))
+    return b''.join(partes)
+
+def codificar_datos(datos):
+    """[{'sensor', 'valor'[, 'seq']}] -> bytes (trama 'datos' binaria)."""
+    partes = [b'AND1', struct.pack('<B', len(datos))]
+    for dato in datos:
+        try:
+            valor = float(dato['valor'])
+        except (TypeError, ValueError):
+            valor = float('nan')   # '--' hasta el primer mensaje
+        partes.append(_texto_bin(dato['sensor']))
+        partes.append(struct.pack('<Id', dato.get('seq', 0), valor))
+    return b''.join(partes)
+
+# =========================================================
+# HISTORIAL POR RANGO (/api/history?var=...)
+# =========================================================
+def leer_muestras(variable_web, desde_s, hasta_s):
+    """Muestras crudas ([tiempos s], [valores]) del rango, recorriendo las carpetas diarias."""
+    file_suffix, col_idx = MAPA_HISTORIAL[variable_web]
+    desde_ms, hasta_ms = int(desde_s * 1000), int(hasta_s * 1000)
+    tiempos, valores = [], []
+
+    if STORAGE_BACKEND == "sqlite":
+        for row in consultar_rango(SQLITE_DB, file_suffix, desde_ms, hasta_ms):
+            if len(row) > col_idx and row[col_idx] is not None:
+                tiempos.append(row[0] / 1000)
+                valores.append(row[col_idx])
+        return tiempos, valores
+
+    dia = datetime.fromtimestamp(desde_s).replace(hour=0, minute=0, second=0, microsecond=0)
+    while dia.timestamp() < hasta_s:
+        nombre = dia.strftime('%Y_%m_%d')
+        ruta = os.path.join(LOG_DIR_BASE, nombre, f"{nombre}_{file_suffix}")
+        medianoche = dia.timestamp()
+        dia += timedelta(days=1)
+
+        if os.path.exists(ruta + '.bin'):
+            # Búsqueda binaria: solo se leen los registros del rango
+            for ts_ms, fila in leer_rango_binario(ruta + '.bin', desde_ms, hasta_ms):
+                if len(fila) >= col_idx and fila[col_idx - 1] == fila[col_idx - 1]:
+                    tiempos.append(ts_ms / 1000)
+                    valores.append(fila[col_idx - 1])
+            continue
+
+        tabla = lector_csv.leer(ruta + '.csv')
+        if tabla is None:
+            continue
+        epoch = tabla.columnas[-1] if tabla.encabezado[-1:] == ['Epoch_ms'] else None
+        for i, (hora, val) in enumerate(zip(tabla.horas, tabla.columna(col_idx))):
+            if val != val:
+                continue
+            if epoch is not None and epoch[i] == epoch[i]:
+                ts = epoch[i] / 1000
+            else:
+                try:
+                    h, m, sg = (int(x) for x in hora.split(':'))
+                except ValueError:
+                    continue
+                ts = medianoche + h * 3600 + m * 60 + sg
+            if desde_s <= ts < hasta_s:
+                tiempos.append(ts)
+                valores.append(val)
+    return tiempos, valores
+
+def historial_rango(variable_web, desde_s, hasta_s, puntos, metodo):
+    """
+    Como mucho `puntos` puntos del rango. Fuentes, de la más barata a la más cara:
+    buffer en memoria (si cubre el rango), resúmenes (rangos de varios días,
+    min/max exactos por tramo) y muestras crudas de los archivos diarios.
+    """
+    file_suffix, col_idx = MAPA_HISTORIAL[variable_web]
+    resultado = {'var': variable_web, 'from': int(desde_s * 1000), 'to': int(hasta_s * 1000)}
+    reducir = reducir_minmax if metodo == 'minmax' else reducir_lttb
+
+    # El buffer tiene todo desde la carga inicial mientras no haya dado la vuelta
+    buffer = historial.get(variable_web)
+    cubre_desde = None
+    if buffer is not None and historial_cubre_desde is not None:
+        primero = buffer.primero()
+        cubre_desde = historial_cubre_desde if len(buffer) < buffer.capacidad or primero is None else primero[0]
+    if cubre_desde is not None and desde_s >= cubre_desde:
+        tiempos, valores = buffer.desde(desde_s, hasta_s)
+        fuente = 'memoria'
+    else:
+        # Resolución más fina que no pase de 4 intervalos por punto pedido
+        duracion = hasta_s - desde_s
+        etiquetas = sorted(RESOLUCIONES_RESUMEN, key=RESOLUCIONES_RESUMEN.get)
+        etiqueta = next((e for e in etiquetas if duracion / RESOLUCIONES_RESUMEN[e] <= 4 * puntos), etiquetas[-1])
+        intervalos = []
+        if duracion >= HISTORIAL_RESUMENES_DESDE_S:
+            intervalos = leer_resumenes(LOG_DIR_RESUMENES, file_suffix, etiqueta,
+                                        resultado['from'], resultado['to'])
+        if intervalos and duracion > RESOLUCIONES_RESUMEN[etiqueta] * 2:
+            intervalos = [i for i in agrupar_resumenes(intervalos, puntos) if len(i[2]) >= col_idx]
+            resultado.update(source=f"rollup_{etiqueta}",
+                             t=[i[0] for i in intervalos],
+                             v=[i[2][col_idx - 1][2] for i in intervalos],
+                             min=[i[2][col_idx - 1][0] for i in intervalos],
+                             max=[i[2][col_idx - 1][1] for i in intervalos])
+            return resultado
+        tiempos, valores = leer_muestras(variable_web, desde_s, hasta_s)
+        fuente = 'crudo'
+
+    tiempos, valores = reducir(tiempos, valores, puntos)
+    resultado.update(source=fuente, t=[int(t * 1000) for t in tiempos], v=valores)
+    return resultado
+
+def _fecha_param(texto, defecto):
+    """'1765432100000' (epoch ms), '2025-12-11' o '2025-12-11T10:30' -> epoch s."""
+    if not texto:
+        return defecto
+    if texto.isdigit():
+        return int(texto) / 1000
+    return datetime.fromisoformat(texto).timestamp()
+
+# =========================================================
+# ÚLTIMOS VALORES (ARRANQUE EN FRÍO)
+# =========================================================
+def ultimo_valor_archivos(variable_web):
+    """(epoch s, valor) de la última muestra guardada hoy o ayer, sin leer el día entero; None si no hay."""
+    file_suffix, col_idx = MAPA_HISTORIAL[variable_web]
+    if STORAGE_BACKEND == "sqlite":
+        fila = consultar_ultima(SQLITE_DB, file_suffix)
+        if fila and len(fila) > col_idx and fila[col_idx] is not None:
+            return fila[0] / 1000, fila[col_idx]
+        return None
+
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for dia in (hoy, hoy - timedelta(days=1)):
+        nombre = dia.strftime('%Y_%m_%d')
+        leido = ultima_fila_csv(os.path.join(LOG_DIR_BASE, nombre, f"{nombre}_{file_suffix}.csv"))
+        if leido is None:
+            continue
+        encabezado, fila = leido
+        try:
+            valor = float(fila[col_idx])
+            if encabezado[-1:] == ['Epoch_ms']:
+                ts = float(fila[-1]) / 1000
+            else:
+                h, m, sg = (int(x) for x in fila[0].split(':'))
+                ts = dia.timestamp() + h * 3600 + m * 60 + sg
+        except (IndexError, ValueError):
+            continue
+        if valor == valor:   # no NaN
+            return ts, valor
+    return None
+
+def cargar_ultimos_valores():
+    """Llena last_data desde la instantánea y, para lo que falte, desde los archivos. Devuelve {key: fuente}."""
+    limite = time.time() - INSTANTANEA_MAX_EDAD_S
+    fuentes = {}
+    try:
+        with open(INSTANTANEA_ARCHIVO) as f:
+            for key, (valor, hora) in json.load(f)['datos'].items():
+                if key in VARIABLES_INSTANTANEA and hora >= limite:
+                    last_data[key], hora_datos[key] = valor, hora
+                    fuentes[key] = 'instantanea'
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"⚠️ Instantánea inválida ({INSTANTANEA_ARCHIVO}): {e}")
+
+    for key in VARIABLES_INSTANTANEA:
+        if key in fuentes or key not in MAPA_HISTORIAL:
+            continue
+        try:
+            ultimo = ultimo_valor_archivos(key)
+        except Exception as e:
+            logging.error(f"Error último valor {key}: {e}")
+            continue
+        if ultimo is not None and ultimo[0] >= limite:
+            hora_datos[key], last_data[key] = ultimo
+            fuentes[key] = 'archivos'
+    return fuentes
+
+def guardar_instantanea():
+    datos = {key: [last_data[key], hora_datos[key]] for key in VARIABLES_INSTANTANEA if key in hora_datos}
+    temporal = f"{INSTANTANEA_ARCHIVO}.{os.getpid()}.tmp"   # Con varios workers cada uno escribe la suya
+    with open(temporal, 'w') as f:
+        json.dump({'guardado': time.time(), 'datos': datos}, f)
+    os.replace(temporal, INSTANTANEA_ARCHIVO)
+
+def bucle_instantanea():
+    guardada = version_datos
+    while True:
+        socketio.sleep(INSTANTANEA_INTERVALO_S)
+        if version_datos == guardada:
+            continue   # Nada nuevo (p.ej. broker caído): no se reescribe
+        guardada = version_datos
+        try:
+            guardar_instantanea()
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"⚠️ No se pudo guardar la instantánea: {e}")
+
 # =========================================================
 # MQTT
 # =========================================================
-def update_and_emit(key, value):
+def actualizar_dato(key, value, hora=None):
+    """Guarda el valor; sale en la próxima trama de las salas que lo muestran."""
+    global version_datos
     last_data[key] = value
-    socketio.emit('nuevo_dato', {'sensor': key, 'valor': value})
+    hora_datos[key] = hora or time.time()
+    version_datos += 1
+    cambios[key] = version_datos
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
@@ -104,36 +660,253 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     try:
         topic = msg.topic
-        payload = msg.payload.decode()
-        
-        if topic == "measure/environment":
-            parts = payload.split(',')
-            if len(parts) >= 3:
-                update_and_emit('env_temp', parts[0])
-                update_and_emit('env_hum', parts[1])
-                update_and_emit('env_pres', parts[2])
-        elif topic == "measure/level_in":
-            parts = payload.split(',')
-            if len(parts) >= 3: update_and_emit('lvl_in', parts[2])
-        elif topic == "measure/level_out":
-            parts = payload.split(',')
-            if len(parts) >= 3: update_and_emit('lvl_out', parts[2])
-        elif topic == "measure/chamber_level": update_and_emit('chamber_level', payload)
-        elif topic == "measure/radiation": update_and_emit('radiation', payload)
-        elif topic == "measure/temperature": update_and_emit('int_temp', payload)
-        elif topic == "control/in_valve": update_and_emit('in_valve', payload)
-        elif topic == "control/out_valve": update_and_emit('out_valve', payload)
-        elif topic == "control/process": update_and_emit('process', payload)
-            
+        if topic not in VARIABLES_WEB: return
+        metrica_mensajes.inc(topic)
+        # Una muestra o un lote (ver anii_protocol.py): en vivo solo se
+        # muestra la última muestra del lote
+        muestras = esquemas.parsear(topic, msg.payload)
+        # Por el puente llega la hora en que lo recibió (importa en las repeticiones)
+        ahora = getattr(msg, 'recibido', None) or time.time()
+        repeticion = getattr(msg, 'repeticion', False)
+        for ts_ms, valores in muestras:
+            ts = ts_ms / 1000 if ts_ms is not None and abs(ts_ms / 1000 - ahora) <= MAX_DESFASE_TS_S else ahora
+            for key, idx in VARIABLES_WEB[topic]:
+                if key in historial:
+                    if repeticion:
+                        # Lo repetido por el puente puede estar ya en los archivos del día
+                        ultimo = historial[key].ultimo()
+                        if ultimo is not None and ts <= ultimo[0]:
+                            continue
+                    historial[key].agregar(ts, valores[idx])
+        _, valores = muestras[-1]
+        for key, idx in VARIABLES_WEB[topic]:
+            actualizar_dato(key, valores[idx], ts)
+        if not repeticion:
+            marcar_arranque('primer_mensaje')
+    except ErrorPayload as e: logging.warning(f"Payload inválido en {msg.topic}: {e}")
     except Exception as e: logging.error(f"Error MQTT: {e}")
 
-client = mqtt.Client()
-client.on_connect = on_connect
+# =========================================================
+# COMANDOS WEB (acuse del broker)
+# =========================================================
+class ComandoEnVuelo:
+    __slots__ = ('id', 'topic', 'payload', 'sid', 'enviado')
+
+    def __init__(self, id_comando, topic, payload, sid):
+        self.id = id_comando
+        self.topic = topic
+        self.payload = payload
+        self.sid = sid
+        self.enviado = time.perf_counter()
+
+comandos_en_vuelo = {}   # mid de paho -> ComandoEnVuelo, del más viejo al más nuevo
+acks_adelantados = set() # PUBACK que llegó antes de que publish() devolviera el mid
+lock_comandos = threading.Lock()
+
+def avisar_comando(comando, estado, latencia=None):
+    """Evento 'comando' al cliente que lo mandó: 'enviado', 'ack_broker', 'sin_ack_broker', 'puente' o 'error'."""
+    aviso = {'id': comando.id, 'topic': comando.topic, 'estado': estado}
+    if latencia is not None:
+        aviso['latencia_ms'] = round(latencia * 1000, 1)
+    socketio.emit('comando', aviso, to=comando.sid)
+
+def publicar_comando(id_comando, topic, payload, sid):
+    comando = ComandoEnVuelo(id_comando, topic, payload, sid)
+    info = client.publish(topic, payload, qos=COMANDO_QOS)
+    if not hasattr(info, 'mid'):
+        # ClientePuente: True si se entregó al puente, que no reenvía el PUBACK
+        metrica_comandos.inc(topic, 'puente' if info else 'error')
+        avisar_comando(comando, 'puente' if info else 'error')
+        return bool(info)
+    if info.rc != mqtt.MQTT_ERR_SUCCESS:
+        metrica_comandos.inc(topic, 'error')
+        avisar_comando(comando, 'error')
+        return False
+    # No se toma lock_comandos durante publish(): on_publish corre con un lock interno de paho tomado
+    with lock_comandos:
+        adelantado = info.mid in acks_adelantados
+        if adelantado:
+            acks_adelantados.discard(info.mid)
+        else:
+            comandos_en_vuelo[info.mid] = comando
+    if adelantado:
+        acuse_broker(comando)
+    else:
+        avisar_comando(comando, 'enviado')
+    return True
+
+def on_publish(client, userdata, mid):
+    """PUBACK del broker (QoS 1) para el mensaje `mid`."""
+    with lock_comandos:
+        comando = comandos_en_vuelo.pop(mid, None)
+        if comando is None:
+            acks_adelantados.add(mid)
+            return
+    acuse_broker(comando)
+
+def acuse_broker(comando):
+    latencia = time.perf_counter() - comando.enviado
+    metrica_comando.observar(latencia, comando.topic)
+    metrica_comandos.inc(comando.topic, 'ack_broker')
+    avisar_comando(comando, 'ack_broker', latencia)
+    log(f"🎮 Comando {comando.id} aceptado por el broker: [{comando.topic}] = {comando.payload} "
+        f"en {latencia * 1000:.0f} ms")
+
+def bucle_comandos():
+    while True:
+        socketio.sleep(0.5)
+        limite = time.perf_counter() - COMANDO_TIMEOUT_S
+        with lock_comandos:
+            vencidos = [(mid, c) for mid, c in comandos_en_vuelo.items() if c.enviado < limite]
+            for mid, _ in vencidos:
+                del comandos_en_vuelo[mid]
+        for _, comando in vencidos:
+            metrica_comandos.inc(comando.topic, 'sin_ack_broker')
+            avisar_comando(comando, 'sin_ack_broker')
+            logging.warning(f"⚠️ Comando {comando.id} sin acuse del broker en {COMANDO_TIMEOUT_S} s: "
+                            f"[{comando.topic}] = {comando.payload}")
+
+# =========================================================
+# EMISIÓN EN VIVO (salas y tramas)
+# =========================================================
+version_datos = 0     # Crece con cada valor nuevo
+cambios = {}          # key -> version_datos de su último valor
+salas = {}            # nombre -> SalaEnVivo
+sala_de_cliente = {}  # sid -> nombre de la sala
+
+class SalaEnVivo:
+    def __init__(self, variables, pasos, formato):
+        self.variables = variables
+        self.pasos = pasos           # Ticks entre tramas
+        self.formato = formato       # 'json' o 'bin'
+        self.clientes = 0
+        self.version = version_datos # Último cambio ya enviado
+
+def dato_web(key):
+    dato = {'sensor': key, 'valor': last_data.get(key)}
+    if key in historial:
+        dato['seq'] = historial[key].total   # Cursor para /api/history?since=
+    return dato
+
+def trama(variables, formato='json'):
+    """Evento 'datos' ya serializado: se codifica una vez para todos los clientes de la sala."""
+    for key in variables:
+        metrica_emisiones.inc(key)
+    metrica_tramas.inc()
+    datos = [dato_web(key) for key in variables]
+    return codificar_datos(datos) if formato == 'bin' else json.dumps(datos)
+
+def bucle_emision():
+    tick = 0
+    while True:
+        socketio.sleep(EMISION_TICK_S)
+        tick += 1
+        tope = version_datos
+        for nombre, sala in list(salas.items()):
+            if tick % sala.pasos:
+                continue
+            nuevas = [key for key in sala.variables if sala.version < cambios.get(key, 0) <= tope]
+            sala.version = tope
+            if nuevas:
+                socketio.emit('datos', trama(nuevas, sala.formato), to=nombre)
+
+def cambiar_sala(sid, variables, intervalo, formato='json'):
+    """Mueve al cliente a la sala (variables, intervalo, formato); la crea si hace falta."""
+    pasos = max(1, round(intervalo / EMISION_TICK_S))
+    nombre = f"vivo:{formato}:{pasos}:{','.join(sorted(variables))}"
+    anterior = sala_de_cliente.get(sid)
+    if anterior == nombre:
+        return
+    salir_de_sala(sid)
+    if not variables:
+        return   # P.ej. la vista de reportes: no recibe datos en vivo
+    if nombre not in salas:
+        salas[nombre] = SalaEnVivo(sorted(variables), pasos, formato)
+    salas[nombre].clientes += 1
+    sala_de_cliente[sid] = nombre
+    join_room(nombre)
+
+def salir_de_sala(sid):
+    nombre = sala_de_cliente.pop(sid, None)
+    if nombre is None:
+        return
+    leave_room(nombre)
+    sala = salas.get(nombre)
+    if sala is not None:
+        sala.clientes -= 1
+        if sala.clientes <= 0:
+            del salas[nombre]
+
+marcar_arranque('modulos')
+fuentes = cargar_ultimos_valores()
+log(f"📌 Últimos valores: {len(fuentes)} de {len(VARIABLES_INSTANTANEA)} "
+    f"({sum(1 for f in fuentes.values() if f == 'archivos')} desde los archivos)")
+marcar_arranque('ultimos_valores')
+
+if MQTT_PUENTE:
+    client = ClientePuente(MQTT_PUENTE)
+else:
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_publish = on_publish
 client.on_message = on_message
-try:
-    client.connect(BROKER, PORT, 60)
-    client.loop_start()
-except Exception as e: logging.critical(f"❌ Error fatal MQTT: {e}")
+
+historial_listo = threading.Event()
+
+def arrancar_historial_y_mqtt():
+    """El historial del día y después MQTT, en segundo plano: la primera página sale con los últimos valores."""
+    inicio = time.time()
+    try:
+        sembrar_historial()
+    finally:
+        historial_listo.set()
+    marcar_arranque('historial')
+    if MQTT_PUENTE:
+        # Pide al puente lo recibido desde un poco antes de leer los archivos
+        # (lo que el listener todavía no había escrito); lo repetido se descarta
+        client.desde = inicio - 60
+        client.loop_forever()
+    else:
+        try:
+            client.connect(BROKER, PORT, 60)
+            client.loop_start()
+        except Exception as e: logging.critical(f"❌ Error fatal MQTT: {e}")
+
+socketio.start_background_task(arrancar_historial_y_mqtt)
+socketio.start_background_task(bucle_instantanea)
+socketio.start_background_task(bucle_comandos)
+socketio.start_background_task(bucle_emision)
+socketio.start_background_task(catalogo.precargar)
+socketio.start_background_task(catalogo.vigilar)
+
+@socketio.on('connect')
+def handle_connect():
+    metrica_clientes.inc()
+    # Hasta que pida otra cosa ('suscribir'): todas las variables al ritmo del tick
+    cambiar_sala(request.sid, VARIABLES_EN_VIVO, EMISION_TICK_S)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    metrica_clientes.dec()
+    salir_de_sala(request.sid)
+
+@socketio.on('suscribir')
+def handle_suscribir(json_data):
+    """
+    {'variables': [...], 'intervalo': s[, 'formato': 'bin']}: solo esas
+    variables, como mucho una trama por intervalo (JSON o binaria).
+    """
+    try:
+        variables = {key for key in json_data.get('variables', []) if key in VARIABLES_EN_VIVO}
+        pedido = float(json_data.get('intervalo', EMISION_TICK_S))
+        intervalo = next((i for i in EMISION_INTERVALOS_S if i >= pedido), EMISION_INTERVALOS_S[-1])
+        formato = 'bin' if json_data.get('formato') == 'bin' else 'json'
+        cambiar_sala(request.sid, variables, intervalo, formato)
+        # Los valores actuales, solo a este cliente (la sala recibe lo que cambie después)
+        actuales = sorted(key for key in variables if key in last_data)
+        if actuales:
+            socketio.emit('datos', trama(actuales, formato), to=request.sid)
+    except Exception as e: logging.error(f"Error suscripción web: {e}")
 
 @socketio.on('control_cmd')
 def handle_control_command(json_data):
@@ -141,77 +914,271 @@ def handle_control_command(json_data):
         topic = json_data.get('topic')
         payload = json_data.get('payload')
         if topic and payload is not None:
-            client.publish(topic, str(payload))
-            log(f"🎮 Comando Web: [{topic}] = {payload}")
+            # El id lo pone la página; sin id (clientes viejos) se genera uno
+            id_comando = str(json_data.get('id') or f"s{time.time_ns()}")
+            if topic in TOPICOS_COMANDO:
+                publicar_comando(id_comando, topic, str(payload), request.sid)
+            else:
+                client.publish(topic, str(payload))
+            log(f"🎮 Comando Web {id_comando}: [{topic}] = {payload}")
     except Exception as e: logging.error(f"Error comando web: {e}")
 
 # =========================================================
 # RUTAS WEB (NUEVAS FUNCIONES DE ARCHIVOS)
 # =========================================================
+@app.before_request
+def iniciar_cronometro():
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def registrar_duracion(response):
+    inicio = getattr(g, 'inicio', None)
+    if inicio is not None:
+        # La regla ('/download/<path:filename>'), no la URL: cantidad de series acotada
+        ruta = request.url_rule.rule if request.url_rule else 'otra'
+        metrica_http.observar(time.perf_counter() - inicio, ruta)
+        if ruta == '/' and response.status_code == 200:
+            marcar_arranque('primera_pagina')
+    return response
+
+@app.after_request
+def cache_y_compresion(response):
+    """ETag/304 y gzip para las respuestas generadas (no los archivos, que van por send_from_directory)."""
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed):
+        return response
+    if 'ETag' not in response.headers:
+        response.add_etag()
+    response.make_conditional(request)
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    if ('gzip' not in request.headers.get('Accept-Encoding', '')
+            or not (response.mimetype or '').startswith(TIPOS_COMPRIMIBLES)
+            or (response.content_length or 0) < COMPRIMIR_MIN_BYTES):
+        return response
+    response.set_data(gzip.compress(response.get_data(), COMPRIMIR_NIVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # El ETag es del contenido sin comprimir: débil, como hace nginx
+    etag, _ = response.get_etag()
+    response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(metricas.exponer(), content_type=TIPO_CONTENIDO)
+
 @app.route('/')
 def index():
     return render_template('index.html', datos=last_data)
 
 @app.route('/api/history')
 def history():
-    return jsonify({
-        'env_temp': get_today_history('env_temp'),
-        'env_hum': get_today_history('env_hum'),
-        'radiation': get_today_history('radiation'),
-        'int_temp': get_today_history('int_temp'),
-        'lvl_in': get_today_history('lvl_in'),
-        'chamber_level': get_today_history('chamber_level'),
-        'lvl_out': get_today_history('lvl_out')
-    })
+    variable_web = request.args.get('var')
+    if not variable_web:
+        historial_listo.wait()   # Solo en el arranque, mientras se leen los archivos del día
+        # Sin 'var': el día de hoy de todas las variables (carga inicial del
+        # panel) o, con 'since', solo lo posterior al cursor (reconexión)
+        try:
+            puntos = _puntos_param(request.args['points']) if 'points' in request.args else None
+            cursores = _cursores_param(request.args['since']) if 'since' in request.args else None
+        except ValueError as e:
+            return jsonify({'error': f'Parámetro inválido: {e}'}), 400
+        if request.args.get('format') == 'bin':
+            # Siempre con cursores (sin 'since' = todo el día, todas con reset)
+            delta = historial_delta(cursores or {}, request.args.get('id'), puntos)
+            series = [{'var': key, 't': [t * 1000 for t in tiempos], 'v': valores,
+                       'cursor': delta['cursor'][key], 'reset': key in delta['reset']}
+                      for key, (tiempos, valores) in delta['data'].items()]
+            return Response(codificar_series(series, delta['id']), content_type=TIPO_BINARIO)
+        if cursores is not None:
+            delta = historial_delta(cursores, request.args.get('id'), puntos)
+            medianoche = _medianoche()
+            delta['data'] = {key: _puntos_web(tiempos, valores, medianoche)
+                             for key, (tiempos, valores) in delta['data'].items()}
+            return jsonify(delta)
+        return jsonify({key: historial_de_hoy(key, puntos) for key in VARIABLES_HISTORIAL})
+
+    if variable_web not in MAPA_HISTORIAL:
+        return jsonify({'error': f'Variable desconocida: {variable_web}'}), 400
+    try:
+        hasta_s = _fecha_param(request.args.get('to'), time.time())
+        desde_s = _fecha_param(request.args.get('from'), _medianoche())
+        puntos = _puntos_param(request.args.get('points', HISTORIAL_PUNTOS_DEFECTO))
+    except ValueError as e:
+        return jsonify({'error': f'Parámetro inválido: {e}'}), 400
+    metodo = request.args.get('method', 'lttb')
+    if metodo not in ('lttb', 'minmax'):
+        return jsonify({'error': f'Método desconocido: {metodo}'}), 400
+    if not 0 <= hasta_s - desde_s <= HISTORIAL_MAX_DIAS * 86400:
+        return jsonify({'error': f'Rango inválido (máximo {HISTORIAL_MAX_DIAS} días)'}), 400
+
+    resultado = historial_rango(variable_web, desde_s, hasta_s, puntos, metodo)
+    if request.args.get('format') == 'bin':
+        respuesta = Response(codificar_series([resultado]), content_type=TIPO_BINARIO)
+        respuesta.headers['X-Historial-Fuente'] = resultado['source']
+        return respuesta
+    return jsonify(resultado)
 
 # --- NUEVO: LISTAR ARCHIVOS ---
 @app.route('/api/files')
 def list_files():
-    """Devuelve la lista de archivos y carpetas en la ruta solicitada"""
+    """Devuelve una página de archivos y carpetas en la ruta solicitada (carpetas con tamaño y cantidad acumulados)"""
     # Obtener subcarpeta solicitada (ej: "2025_12")
     req_path = request.args.get('path', '')
     
     # Construir ruta absoluta segura
-    abs_path = os.path.join(LOG_DIR_BASE, req_path)
+    base = os.path.abspath(LOG_DIR_BASE)
+    abs_path = os.path.abspath(os.path.join(base, req_path))
     
-    # Seguridad básica para no salir de /home/log
-    if not os.path.abspath(abs_path).startswith(os.path.abspath(LOG_DIR_BASE)):
+    # Seguridad básica para no salir de /home/log (ni a /home/log_otra)
+    if abs_path != base and not abs_path.startswith(base + os.sep):
         return jsonify({'error': 'Acceso denegado'}), 403
 
-    if not os.path.exists(abs_path):
-        return jsonify({'error': 'Ruta no encontrada'}), 404
-
-    files_list = []
     try:
-        # Escanear directorio
-        with os.scandir(abs_path) as entries:
-            for entry in entries:
-                if entry.name.startswith('.'): continue # Ignorar ocultos
-                
-                info = {
-                    'name': entry.name,
-                    'is_dir': entry.is_dir(),
-                    'size': entry.stat().st_size if entry.is_file() else 0,
-                    # Ruta relativa para el frontend
-                    'path': os.path.join(req_path, entry.name).replace('\\', '/')
-                }
-                files_list.append(info)
-                
-        # Ordenar: Carpetas primero, luego archivos (alfabéticamente)
-        files_list.sort(key=lambda x: (not x['is_dir'], x['name']))
-        
+        limite = min(int(request.args.get('limit', ARCHIVOS_LIMITE_DEFECTO)), ARCHIVOS_LIMITE_MAX)
+        pagina = catalogo.listar(req_path, campo=request.args.get('sort', 'name'),
+                                 desc=request.args.get('order') == 'desc',
+                                 limite=max(limite, 1), cursor=request.args.get('cursor'))
+    except FileNotFoundError:
+        return jsonify({'error': 'Ruta no encontrada'}), 404
+    except ValueError as e:
+        return jsonify({'error': f'Parámetro inválido: {e}'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
         
-    return jsonify(files_list)
+    return jsonify(pagina)
 
 # --- NUEVO: DESCARGAR ARCHIVO ---
-@app.route('/download/<path:filename>')
+@app.route('/download/<path:filename>', methods=['GET', 'HEAD'])
 def download_file(filename):
     """Descarga un archivo específico"""
-    # send_from_directory maneja la seguridad básica de rutas
-    return send_from_directory(LOG_DIR_BASE, filename, as_attachment=True)
+    cerrado = dia_cerrado(filename)
+    respuesta = None
+    # Con Range (reanudar una descarga) se sirve el archivo tal cual: los
+    # bytes pedidos son los del CSV, no los del .gz
+    if (cerrado and filename.endswith('.csv') and 'Range' not in request.headers
+            and 'gzip' in request.headers.get('Accept-Encoding', '')):
+        comprimido = precomprimido(filename)
+        if comprimido:
+            respuesta = send_from_directory(LOG_DIR_COMPRIMIDOS, comprimido, as_attachment=True,
+                                            download_name=os.path.basename(filename), mimetype='text/csv')
+            respuesta.headers['Content-Encoding'] = 'gzip'
+    if respuesta is None:
+        # send_from_directory maneja la seguridad básica de rutas (y ETag/Last-Modified/304)
+        respuesta = send_from_directory(LOG_DIR_BASE, filename, as_attachment=True)
+    respuesta.vary.add('Accept-Encoding')
+    if cerrado:
+        respuesta.headers['Cache-Control'] = CACHE_DIA_CERRADO
+    return respuesta
+
+# --- DESCARGAR CARPETA COMPLETA (ZIP) ---
+@app.route('/download-folder/', defaults={'folder': ''})
+@app.route('/download-folder/<path:folder>')
+def download_folder(folder):
+    """Zip de una carpeta (p.ej. un día o un mes) generado mientras se envía"""
+    base = os.path.abspath(LOG_DIR_BASE)
+    ruta = os.path.abspath(os.path.join(base, folder))
+    if ruta != base and not ruta.startswith(base + os.sep):
+        return jsonify({'error': 'Acceso denegado'}), 403
+    if not os.path.isdir(ruta):
+        return jsonify({'error': 'Ruta no encontrada'}), 404
+
+    nombre = os.path.basename(ruta)
+    respuesta = Response(zip_en_streaming(ruta), mimetype='application/zip')
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="{nombre}.zip"'
+    return respuesta
+
+class _SalidaZip:
+    """Destino de zipfile sin seek: junta lo escrito hasta que el generador lo entrega."""
+    def __init__(self):
+        self.partes = []
+        self.pendiente = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.pendiente += len(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        self.pendiente = 0
+        return datos
+
+def zip_en_streaming(ruta_carpeta):
+    """
+    Generador de bytes del zip de `ruta_carpeta` (las rutas internas empiezan
+    con el nombre de la carpeta, como comprimir_carpeta del uploader). Cede
+    el loop después de cada bloque para que los datos en vivo sigan saliendo.
+    """
+    salida = _SalidaZip()
+    base = os.path.dirname(ruta_carpeta)
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for raiz, carpetas, archivos in os.walk(ruta_carpeta):
+            carpetas[:] = sorted(c for c in carpetas if not c.startswith('.'))
+            for nombre in sorted(archivos):
+                if nombre.startswith('.') or nombre.endswith('.lock'):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    info = zipfile.ZipInfo.from_file(ruta, os.path.relpath(ruta, base))
+                    origen = open(ruta, 'rb')
+                except OSError:
+                    continue   # Borrado mientras se armaba el zip
+                info.compress_type = zipfile.ZIP_STORED if nombre.endswith(ZIP_SIN_COMPRIMIR) else zipfile.ZIP_DEFLATED
+                # force_zip64: el tamaño final no se sabe (el archivo del día puede seguir creciendo)
+                with origen, zf.open(info, 'w', force_zip64=True) as destino:
+                    while True:
+                        datos = origen.read(ZIP_BLOQUE)
+                        if not datos:
+                            break
+                        destino.write(datos)
+                        if salida.pendiente:
+                            yield salida.vaciar()
+                        socketio.sleep(0)
+                if salida.pendiente:
+                    yield salida.vaciar()
+    # Directorio central (lo escribe ZipFile al cerrarse)
+    yield salida.vaciar()
+
+def dia_cerrado(ruta_relativa):
+    """True si el archivo está en una carpeta diaria (YYYY_MM_DD) anterior a hoy. Los resúmenes no cuentan: se pueden recalcular."""
+    partes = ruta_relativa.replace('\\', '/').split('/')
+    if partes[0] == os.path.basename(LOG_DIR_RESUMENES):
+        return False
+    hoy = datetime.now().strftime('%Y_%m_%d')
+    return any(PATRON_DIA.match(p) and p < hoy for p in partes[:-1])
+
+def precomprimido(ruta_relativa):
+    """Ruta (relativa a LOG_DIR_COMPRIMIDOS) del .gz del archivo; lo genera la primera vez. None si no se puede."""
+    origen = os.path.abspath(os.path.join(LOG_DIR_BASE, ruta_relativa))
+    if not origen.startswith(os.path.abspath(LOG_DIR_BASE) + os.sep) or not os.path.isfile(origen):
+        return None
+    relativa = os.path.relpath(origen, LOG_DIR_BASE) + '.gz'
+    destino = os.path.join(LOG_DIR_COMPRIMIDOS, relativa)
+    try:
+        if not os.path.exists(destino) or os.path.getmtime(destino) < os.path.getmtime(origen):
+            # En un hilo del pool: comprimir un CSV grande no frena los datos en vivo
+            tpool.execute(_comprimir_archivo, origen, destino)
+    except OSError as e:
+        logging.error(f"❌ Error comprimiendo {ruta_relativa}: {e}")
+        return None
+    return relativa
+
+def _comprimir_archivo(origen, destino):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f"{destino}.{os.getpid()}.tmp"   # Otro worker puede estar comprimiendo lo mismo
+    with open(origen, 'rb') as entrada, gzip.open(temporal, 'wb', compresslevel=9) as salida:
+        shutil.copyfileobj(entrada, salida)
+    os.replace(temporal, destino)
 
 if __name__ == '__main__':
-    log("🚀 Servidor Web SCADA Iniciado")
-    socketio.run(app, host='0.0.0.0', port=5000)
\ No newline at end of file
+    log(f"🚀 Servidor Web SCADA Iniciado (pid {os.getpid()}, MQTT {'por ' + MQTT_PUENTE if MQTT_PUENTE else 'directo'})")
+    # reuse_port: otros workers (scada@N.service) escuchan en el mismo puerto
+    servidor = eventlet.listen(('0.0.0.0', PUERTO_WEB), reuse_port=True)
+    marcar_arranque('servidor')
+    eventlet.wsgi.server(servidor, app)
\ No newline at end of file
@@ -0,0 +1,168 @@
+import os
+import time
+import queue
+import signal
+import socket
+import logging
+import threading
+from collections import deque
+import paho.mqtt.client as mqtt
+from anii_logging import configurar_logging
+from anii_protocol import TOPICS
+from anii_puente import trama, leer_trama, REPETICION, QOS_MASCARA, TOPICO_DESDE
+
+# =========================================================
+# CONFIGURACIÓN
+# =========================================================
+# Único cliente MQTT del SCADA: reenvía los mensajes a los workers web
+# (app.py con MQTT_PUENTE) por un socket Unix y publica sus comandos.
+# Ver anii_puente.py para el protocolo.
+BROKER = "localhost"
+PORT = 1883
+
+SOCKET_PUENTE = '/run/anii-mqtt.sock'   # Igual que MQTT_PUENTE en app.py
+
+# Mensajes recientes que se reenvían a un worker que (re)conecta: con
+# ~10 mensajes/s alcanza para unos 30 minutos de corte
+PUENTE_RECIENTES = 20000
+# Tramas pendientes por worker; si no lee (colgado) se lo desconecta y
+# al volver pide lo que le falta
+PUENTE_COLA_MAX = 50000
+
+LOG_DIR_BASE = '/home/log'
+
+# "/home/log/2025_12/mqtt-bridge.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE = configurar_logging('mqtt-bridge.log', LOG_DIR_BASE)
+
+# =========================================================
+# WORKERS CONECTADOS
+# =========================================================
+lock = threading.Lock()
+recientes = deque(maxlen=PUENTE_RECIENTES)   # (recibido, tópico, payload)
+ultimos = {}                                 # tópico -> (recibido, tópico, payload)
+workers = set()                              # Colas de los workers suscritos
+
+class Worker:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.cola = queue.Queue(PUENTE_COLA_MAX)
+
+    def enviar(self, datos):
+        """False si la cola está llena (el worker no lee)."""
+        try:
+            self.cola.put_nowait(datos)
+            return True
+        except queue.Full:
+            return False
+
+    def escribir(self):
+        """Hilo escritor: vacía la cola en el socket (None = terminar)."""
+        try:
+            while True:
+                datos = self.cola.get()
+                if datos is None:
+                    return
+                self.conexion.sendall(datos)
+        except OSError:
+            pass
+        finally:
+            self.cerrar()
+
+    def cerrar(self):
+        with lock:
+            workers.discard(self)
+        try:
+            self.conexion.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def suscribir(worker, desde):
+    """Lo que el worker no tiene (último de cada tópico + recientes posteriores a `desde`) y después lo nuevo."""
+    with lock:
+        pendientes = [m for m in recientes if m[0] > desde]
+        en_recientes = {m[1] for m in pendientes}
+        viejos = sorted((m for t, m in ultimos.items() if t not in en_recientes), key=lambda m: m[0])
+        for recibido, topico, payload in viejos + pendientes:
+            worker.enviar(trama(topico, payload, recibido, REPETICION))
+        workers.add(worker)
+    logging.info(f"🔌 Worker suscrito: {len(viejos) + len(pendientes)} mensajes repetidos, {len(workers)} worker(s)")
+
+def atender_worker(conexion):
+    worker = Worker(conexion)
+    threading.Thread(target=worker.escribir, daemon=True).start()
+    try:
+        lector = conexion.makefile('rb')
+        while True:
+            leido = leer_trama(lector)
+            if leido is None:
+                break
+            _, banderas, topico, payload = leido
+            if topico == TOPICO_DESDE:
+                suscribir(worker, float(payload))
+            else:
+                # Comando de un worker (p.ej. control/in_valve desde la web)
+                client.publish(topico, payload, qos=banderas & QOS_MASCARA)
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️ Error con un worker: {e}")
+    finally:
+        worker.cerrar()
+        try:
+            worker.cola.put_nowait(None)
+        except queue.Full:
+            pass
+        conexion.close()
+        logging.info(f"🔌 Worker desconectado, quedan {len(workers)}")
+
+def servir():
+    if os.path.exists(SOCKET_PUENTE):
+        os.remove(SOCKET_PUENTE)   # De una ejecución anterior
+    servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    servidor.bind(SOCKET_PUENTE)
+    servidor.listen(16)
+    while True:
+        conexion, _ = servidor.accept()
+        threading.Thread(target=atender_worker, args=(conexion,), daemon=True).start()
+
+# =========================================================
+# MQTT
+# =========================================================
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        logging.info("✅ Puente conectado al Broker MQTT.")
+        for t in TOPICS: client.subscribe(t)
+    else:
+        logging.error(f"❌ Falló conexión al Broker. Código: {rc}")
+
+def on_message(client, userdata, msg):
+    mensaje = (time.time(), msg.topic, bytes(msg.payload))
+    datos = trama(msg.topic, mensaje[2], mensaje[0])
+    with lock:
+        recientes.append(mensaje)
+        ultimos[msg.topic] = mensaje
+        lentos = [w for w in workers if not w.enviar(datos)]
+    for worker in lentos:
+        logging.warning("⚠️ Worker sin leer (cola llena): se lo desconecta")
+        worker.cerrar()
+
+client = mqtt.Client()
+client.on_connect = on_connect
+client.on_message = on_message
+
+if __name__ == '__main__':
+    logging.info("--- 🌉 INICIANDO PUENTE MQTT ---")
+    logging.info(f"    Socket:          {SOCKET_PUENTE}")
+    logging.info(f"    Log de sistema:  {LOG_FILE}")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: client.disconnect())
+    threading.Thread(target=servir, name="puente", daemon=True).start()
+
+    while True:
+        try:
+            client.connect(BROKER, PORT, 60)
+            client.loop_forever()
+            break   # disconnect() por SIGTERM
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            logging.critical(f"❌ Error de conexión MQTT: {e}")
+            time.sleep(5)
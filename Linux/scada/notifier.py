@@ -4,7 +4,7 @@ import requests
 import os
 import urllib3
 import logging
-from datetime import datetime
+from anii_logging import configurar_logging
 
 # =========================================================
 # CONFIGURACIÓN ESPECÍFICA DEL DISPOSITIVO
@@ -39,31 +39,8 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 # =========================================================
 LOG_DIR_BASE = '/home/log'
 
-# 1. Obtenemos el mes actual: "2025_12"
-current_month_str = datetime.now().strftime('%Y_%m')
-
-# 2. Definimos la carpeta del mes
-LOG_MONTH_DIR = os.path.join(LOG_DIR_BASE, current_month_str)
-
-# 3. Definimos el archivo final: "notifier.log"
-LOG_FILE_OUTPUT = os.path.join(LOG_MONTH_DIR, 'notifier.log')
-
-# 4. Crear estructura si no existe
-if not os.path.exists(LOG_MONTH_DIR):
-    try:
-        os.makedirs(LOG_MONTH_DIR)
-    except OSError as e:
-        print(f"CRITICAL ERROR: No se pudo crear directorio {LOG_MONTH_DIR}: {e}")
-
-# Configuración del Logger
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE_OUTPUT),
-        logging.StreamHandler()
-    ]
-)
+# "/home/log/2025_12/notifier.log" (la carpeta rota sola al cambiar de mes)
+LOG_FILE_OUTPUT = configurar_logging('notifier.log', LOG_DIR_BASE)
 
 # =========================================================
 # FUNCIONES
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import math
+import tempfile
+import unittest
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_storage import (AlmacenBinario, CABECERA_BINARIO, buscar_indice, leer_rango_binario,
+                          leer_cabecera, abrir_memmap)
+
+
+class AlmacenBinarioTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # Mediodía de hoy: ninguna muestra cruza la medianoche
+        self.inicio = int(time.mktime(time.localtime()[:3] + (12, 0, 0, 0, 0, -1))) * 1000
+        self.dia = time.strftime('%Y_%m_%d', time.localtime(self.inicio / 1000))
+        self.ruta = os.path.join(self.tmp.name, self.dia, f"{self.dia}_environment.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _escribir(self, cantidad, paso_ms=1000, tam_valor=4, desde=0):
+        almacen = AlmacenBinario(self.tmp.name, {'environment': 3}, tam_valor=tam_valor)
+        filas = [((self.inicio + i * paso_ms) / 1000, None, [i, i + 0.5, 'x'])
+                 for i in range(desde, desde + cantidad)]
+        almacen.escribir_filas('environment', filas)
+        almacen.cerrar_todos()
+
+    def test_cabecera_y_registros(self):
+        self._escribir(10)
+        self.assertEqual(leer_cabecera(self.ruta), (3, 4))
+        registros = leer_rango_binario(self.ruta)
+        self.assertEqual(len(registros), 10)
+        ts, (a, b, c) = registros[3]
+        self.assertEqual((ts, a, b), (self.inicio + 3000, 3.0, 3.5))
+        self.assertTrue(math.isnan(c))
+
+    def test_busqueda_binaria(self):
+        self._escribir(100, paso_ms=250)
+        self.assertEqual(buscar_indice(self.ruta, 0), 0)
+        self.assertEqual(buscar_indice(self.ruta, self.inicio + 250 * 40), 40)
+        self.assertEqual(buscar_indice(self.ruta, self.inicio + 250 * 40 + 1), 41)
+        self.assertEqual(buscar_indice(self.ruta, self.inicio + 10 ** 9), 100)
+
+    def test_rango(self):
+        self._escribir(100, paso_ms=250)
+        registros = leer_rango_binario(self.ruta, self.inicio + 250 * 10, self.inicio + 250 * 20)
+        self.assertEqual([ts for ts, _ in registros], [self.inicio + 250 * i for i in range(10, 20)])
+        self.assertEqual(leer_rango_binario(self.ruta, self.inicio + 250 * 20, self.inicio + 250 * 10), [])
+
+    def test_registro_incompleto_se_descarta_al_reabrir(self):
+        self._escribir(5)
+        with open(self.ruta, 'ab') as f:
+            f.write(b'\x01\x02\x03')
+        self._escribir(5, desde=5)
+        self.assertEqual((os.path.getsize(self.ruta) - CABECERA_BINARIO.size) % (8 + 3 * 4), 0)
+        self.assertEqual([v[0] for _, v in leer_rango_binario(self.ruta)], [float(i) for i in range(10)])
+
+    def test_float64_respeta_el_formato_del_archivo(self):
+        self._escribir(3, tam_valor=8)
+        self._escribir(3, tam_valor=4, desde=3)
+        self.assertEqual(leer_cabecera(self.ruta), (3, 8))
+        self.assertEqual(len(leer_rango_binario(self.ruta)), 6)
+
+    @unittest.skipUnless(importlib.util.find_spec('numpy'), "requiere numpy")
+    def test_memmap(self):
+        self._escribir(10)
+        datos = abrir_memmap(self.ruta, ['Amb_Temp', 'Humidity', 'Pressure'])
+        self.assertEqual(len(datos), 10)
+        self.assertEqual(int(datos['t'][2]), self.inicio + 2000)
+        self.assertEqual(float(datos['Humidity'][2]), 2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
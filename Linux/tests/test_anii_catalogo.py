@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_catalogo import CatalogoArchivos
+
+
+def escribir(ruta, tamano):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(b'x' * tamano)
+
+
+class CatalogoTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.tmp.name, 'log')
+        for i in range(7):
+            escribir(os.path.join(self.base, f"archivo_{i}.csv"), 10 * (i + 1))
+        escribir(os.path.join(self.base, '2026_01_01', 'a.csv'), 100)
+        escribir(os.path.join(self.base, '2026_01_01', 'sub', 'b.csv'), 50)
+        escribir(os.path.join(self.base, '2026_01_02', 'c.csv'), 5)
+        escribir(os.path.join(self.base, '.comprimidos', 'oculto.gz'), 1000)
+        escribir(os.path.join(self.tmp.name, 'log2', 'hermana.csv'), 1)
+        self.catalogo = CatalogoArchivos(self.base, usar_inotify=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _todas(self, **kwargs):
+        nombres, cursor = [], None
+        while True:
+            pagina = self.catalogo.listar('', limite=3, cursor=cursor, **kwargs)
+            self.assertLessEqual(len(pagina['entries']), 3)
+            nombres += [e['name'] for e in pagina['entries']]
+            cursor = pagina['next']
+            if cursor is None:
+                return nombres
+
+    def test_paginas_completas_y_carpetas_primero(self):
+        nombres = self._todas()
+        self.assertEqual(nombres, ['2026_01_01', '2026_01_02'] + [f"archivo_{i}.csv" for i in range(7)])
+        por_tamano = self._todas(campo='size', desc=True)
+        self.assertEqual(por_tamano[2:], [f"archivo_{i}.csv" for i in reversed(range(7))])
+
+    def test_cambios_entre_paginas_no_repiten_ni_saltean(self):
+        primera = self.catalogo.listar('', limite=4)
+        escribir(os.path.join(self.base, 'archivo_0a.csv'), 1)   # Antes del cursor
+        os.remove(os.path.join(self.base, 'archivo_3.csv'))       # Después del cursor
+        self.catalogo.invalidar(self.base)
+        segunda = self.catalogo.listar('', limite=10, cursor=primera['next'])
+        self.assertEqual([e['name'] for e in primera['entries']][-1], 'archivo_1.csv')
+        self.assertEqual([e['name'] for e in segunda['entries']],
+                         ['archivo_2.csv', 'archivo_4.csv', 'archivo_5.csv', 'archivo_6.csv'])
+
+    def test_totales_recursivos_sin_ocultos(self):
+        pagina = self.catalogo.listar('')
+        self.assertEqual((pagina['size'], pagina['files']), (sum(10 * (i + 1) for i in range(7)) + 155, 10))
+        dia = next(e for e in pagina['entries'] if e['name'] == '2026_01_01')
+        self.assertEqual((dia['size'], dia['files'], dia['path']), (150, 2, '2026_01_01'))
+        self.assertNotIn('.comprimidos', [e['name'] for e in pagina['entries']])
+
+    def test_invalidar_actualiza_totales_de_los_ancestros(self):
+        self.catalogo.listar('2026_01_01/sub')
+        escribir(os.path.join(self.base, '2026_01_01', 'sub', 'd.csv'), 7)
+        self.catalogo.invalidar(os.path.join(self.base, '2026_01_01', 'sub'))
+        dia = next(e for e in self.catalogo.listar('')['entries'] if e['name'] == '2026_01_01')
+        self.assertEqual((dia['size'], dia['files']), (157, 3))
+
+    def test_fuera_de_la_base(self):
+        for relativa in ('..', '../log2', os.path.join(self.tmp.name, 'log2'), '2026_01_01/../../log2',
+                         'no_existe', 'archivo_0.csv'):
+            with self.assertRaises(FileNotFoundError, msg=relativa):
+                self.catalogo.listar(relativa)
+        self.assertEqual(self.catalogo.listar('2026_01_01/..')['total'], 9)
+
+    def test_parametros_invalidos(self):
+        with self.assertRaises(ValueError):
+            self.catalogo.listar('', campo='tipo')
+        with self.assertRaises(ValueError):
+            self.catalogo.listar('', cursor='no-es-un-cursor')
+
+
+if __name__ == '__main__':
+    unittest.main()
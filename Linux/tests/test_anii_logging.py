@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_logging import _inicio_mes_siguiente
+
+
+class InicioMesSiguienteTest(unittest.TestCase):
+    def test_fin_de_mes_largo_a_mes_corto(self):
+        for dia in (datetime(2026, 1, 29, 23, 59), datetime(2026, 1, 31, 12, 0), datetime(2026, 3, 31)):
+            esperado = datetime(dia.year, dia.month + 1, 1).timestamp()
+            self.assertEqual(_inicio_mes_siguiente(dia), esperado)
+
+    def test_diciembre_pasa_a_enero(self):
+        self.assertEqual(_inicio_mes_siguiente(datetime(2026, 12, 31, 23, 59, 59)),
+                         datetime(2027, 1, 1).timestamp())
+
+    def test_primer_dia_del_mes(self):
+        self.assertEqual(_inicio_mes_siguiente(datetime(2026, 2, 1)), datetime(2026, 3, 1).timestamp())
+
+
+if __name__ == '__main__':
+    unittest.main()
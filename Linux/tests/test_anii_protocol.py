@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_protocol import (RegistroEsquemas, ErrorPayload, decodificar_payload,
+                           codificar_lote_json, codificar_lote_binario)
+
+
+class DecodificarPayloadTest(unittest.TestCase):
+    def test_texto_con_y_sin_hora(self):
+        self.assertEqual(decodificar_payload(b'25.50,60.00'), [(None, ['25.50', '60.00'])])
+        self.assertEqual(decodificar_payload(b'7.1@1765432100123'), [(1765432100123, ['7.1'])])
+
+    def test_lote_json_con_t0(self):
+        muestras = [(1765432100000, [1.5]), (1765432100250, [2.5])]
+        self.assertEqual(decodificar_payload(codificar_lote_json(muestras, t0=1765432100000)), muestras)
+
+    def test_lote_binario(self):
+        muestras = [(1765432100000, [1.5, 2.0]), (1765432100250, [2.5, 3.0])]
+        self.assertEqual(decodificar_payload(codificar_lote_binario(muestras)), muestras)
+
+
+class EsquemasRechazosTest(unittest.TestCase):
+    def setUp(self):
+        self.esquemas = RegistroEsquemas()
+
+    def assertRechaza(self, topic, payload):
+        with self.assertRaises(ErrorPayload):
+            self.esquemas.parsear(topic, payload)
+
+    def test_hora_infinita_o_nan(self):
+        self.assertRechaza('measure/radiation', b'{"v":1,"s":[[Infinity,1]]}')
+        self.assertRechaza('measure/radiation', b'{"v":1,"s":[[NaN,1]]}')
+        self.assertRechaza('measure/radiation', b'{"v":1,"t0":Infinity,"s":[[0,1]]}')
+        self.assertRechaza('measure/radiation', b'{"v":1,"s":[["x",1]]}')
+
+    def test_valores_no_finitos(self):
+        self.assertRechaza('control/process', b'inf')
+        self.assertRechaza('control/process', b'nan')
+        self.assertRechaza('measure/radiation', b'nan')
+        self.assertRechaza('measure/radiation', b'{"v":1,"s":[[1765432100000,Infinity]]}')
+
+    def test_columnas_y_formato(self):
+        self.assertRechaza('measure/environment', b'1,2')
+        self.assertRechaza('measure/radiation', b'abc')
+        self.assertRechaza('measure/radiation', b'{"v":2,"s":[]}')
+        self.assertRechaza('measure/radiation', b'{"v":1,')
+        self.assertRechaza('measure/radiation', b'\xb1\x01')
+        self.assertRechaza('measure/radiation', b'\xff\xfe')
+
+    def test_validos_tipados(self):
+        [(ts, valores)] = self.esquemas.parsear('measure/environment', b'25.50,60.00,1013.20@1765432100123')
+        self.assertEqual(ts, 1765432100123)
+        self.assertEqual([str(v) for v in valores], ['25.50', '60.00', '1013.20'])
+        [(_, estado)] = self.esquemas.parsear('control/process', b'1')
+        self.assertEqual(estado, [1])
+
+    def test_contadores(self):
+        self.esquemas.parsear('measure/radiation', b'1')
+        self.assertRechaza('measure/radiation', b'{"v":1,"s":[[Infinity,1]]}')
+        estadisticas = self.esquemas.estadisticas()['measure/radiation']
+        self.assertEqual((estadisticas['aceptados'], estadisticas['rechazados']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import types
+import queue
+import tempfile
+import threading
+import unittest
+import importlib.util
+
+INSTALACION = os.path.join(os.path.dirname(__file__), '..', 'installation')
+SCADA = os.path.join(os.path.dirname(__file__), '..', 'scada')
+sys.path.insert(0, INSTALACION)
+
+from anii_puente import ClientePuente
+
+
+def cargar_puente(base_dir, ruta_socket):
+    """mqtt-bridge.py con el log y el socket en una carpeta temporal (sin conectar al broker)."""
+    ruta = os.path.join(SCADA, 'mqtt-bridge.py')
+    with open(ruta, encoding='utf-8') as f:
+        fuente = (f.read()
+                  .replace("LOG_DIR_BASE = '/home/log'", f"LOG_DIR_BASE = {base_dir!r}", 1)
+                  .replace("SOCKET_PUENTE = '/run/anii-mqtt.sock'", f"SOCKET_PUENTE = {ruta_socket!r}", 1))
+    modulo = types.ModuleType('mqtt_bridge')
+    modulo.__file__ = ruta
+    exec(compile(fuente, ruta, 'exec'), modulo.__dict__)
+    modulo.client = BrokerFalso()
+    threading.Thread(target=modulo.servir, daemon=True).start()
+    return modulo
+
+
+class BrokerFalso:
+    """Registra lo que el puente publica en el broker."""
+
+    def __init__(self):
+        self.publicados = queue.Queue()
+
+    def publish(self, topic, payload, qos=0):
+        self.publicados.put((topic, payload, qos))
+
+
+class MensajeMQTT:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+@unittest.skipUnless(importlib.util.find_spec('paho'), "requiere paho-mqtt")
+class PuenteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.tmp.name, 'puente.sock')
+        self.puente = cargar_puente(self.tmp.name, self.ruta)
+        self.recibidos = queue.Queue()
+
+    def tearDown(self):
+        for puente in [self.puente] + getattr(self, 'otros', []):
+            for worker in list(puente.workers):
+                worker.cerrar()
+        self.tmp.cleanup()
+
+    def _cliente(self, desde):
+        self._esperar(lambda: os.path.exists(self.ruta))
+        cliente = ClientePuente(self.ruta, desde=desde, reintento_s=0.05)
+        cliente.on_message = lambda c, userdata, msg: self.recibidos.put(msg)
+        threading.Thread(target=cliente.loop_forever, daemon=True).start()
+        return cliente
+
+    def _mensajes(self, cantidad):
+        return [self.recibidos.get(timeout=2) for _ in range(cantidad)]
+
+    def _esperar(self, condicion):
+        limite = time.monotonic() + 2
+        while not condicion():
+            self.assertLess(time.monotonic(), limite, "tiempo de espera agotado")
+            time.sleep(0.01)
+
+    def test_suscripcion_repite_lo_reciente_y_despues_sigue_en_vivo(self):
+        self.puente.on_message(None, None, MensajeMQTT('measure/radiation', b'500'))
+        self.puente.on_message(None, None, MensajeMQTT('measure/temperature', b'20'))
+        self._cliente(desde=0)
+
+        repetidos = self._mensajes(2)
+        self.assertEqual([(m.topic, m.payload) for m in repetidos],
+                         [('measure/radiation', b'500'), ('measure/temperature', b'20')])
+        self.assertTrue(all(m.repeticion for m in repetidos))
+
+        self._esperar(lambda: len(self.puente.workers) == 1)
+        self.puente.on_message(None, None, MensajeMQTT('measure/radiation', b'510'))
+        [nuevo] = self._mensajes(1)
+        self.assertEqual((nuevo.topic, nuevo.payload, nuevo.repeticion), ('measure/radiation', b'510', False))
+
+    def test_desde_solo_repite_lo_posterior_y_el_ultimo_de_cada_topico(self):
+        self.puente.on_message(None, None, MensajeMQTT('measure/radiation', b'1'))
+        self.puente.on_message(None, None, MensajeMQTT('measure/temperature', b'20'))
+        corte = time.time()
+        time.sleep(0.01)
+        self.puente.on_message(None, None, MensajeMQTT('measure/radiation', b'2'))
+        self._cliente(desde=corte)
+
+        repetidos = self._mensajes(2)
+        self.assertEqual([(m.topic, m.payload) for m in repetidos],
+                         [('measure/temperature', b'20'), ('measure/radiation', b'2')])
+        self.assertTrue(self.recibidos.empty())
+
+    def test_publicar_pasa_el_qos(self):
+        cliente = self._cliente(desde=time.time())
+        self._esperar(lambda: cliente.conectado)
+        self.assertTrue(cliente.publish('control/process', '1', qos=1))
+        self.assertEqual(self.puente.client.publicados.get(timeout=2), ('control/process', b'1', 1))
+
+    def test_reinicio_del_puente(self):
+        self.puente.on_message(None, None, MensajeMQTT('measure/radiation', b'1'))
+        cliente = self._cliente(desde=0)
+        [primero] = self._mensajes(1)
+        self._esperar(lambda: len(self.puente.workers) == 1)
+
+        # Otro puente toma el socket (con su propio buffer) y el viejo se cae
+        nuevo = cargar_puente(self.tmp.name, self.ruta)
+        self.otros = [nuevo]
+        nuevo.recientes.append((primero.recibido, 'measure/radiation', b'1'))
+        nuevo.recientes.append((primero.recibido + 1, 'measure/radiation', b'3'))
+        for worker in list(self.puente.workers):
+            worker.cerrar()
+
+        # El cliente reconecta solo y pide desde el último mensaje que procesó
+        [despues] = self._mensajes(1)
+        self.assertEqual((despues.payload, despues.repeticion), (b'3', True))
+        self.assertEqual(cliente.desde, primero.recibido + 1)
+        self._esperar(lambda: len(nuevo.workers) == 1)
+        nuevo.on_message(None, None, MensajeMQTT('measure/radiation', b'4'))
+        self.assertEqual(self._mensajes(1)[0].payload, b'4')
+
+
+if __name__ == '__main__':
+    unittest.main()
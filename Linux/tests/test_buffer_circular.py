@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_storage import BufferCircular
+
+
+class BufferCircularTest(unittest.TestCase):
+    def _buffer(self, capacidad, cantidad):
+        buffer = BufferCircular(capacidad)
+        buffer.extender([(float(i), i * 10.0) for i in range(cantidad)])
+        return buffer
+
+    def test_vacio(self):
+        buffer = BufferCircular(4)
+        self.assertEqual(len(buffer), 0)
+        self.assertIsNone(buffer.primero())
+        self.assertIsNone(buffer.ultimo())
+        self.assertEqual(buffer.desde(), ([], []))
+
+    def test_sin_dar_la_vuelta(self):
+        buffer = self._buffer(10, 4)
+        self.assertEqual(buffer.desde(), ([0.0, 1.0, 2.0, 3.0], [0.0, 10.0, 20.0, 30.0]))
+        self.assertEqual((buffer.primero(), buffer.ultimo()), ((0.0, 0.0), (3.0, 30.0)))
+
+    def test_al_llenarse_pisa_lo_mas_viejo(self):
+        buffer = self._buffer(5, 12)
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer.total, 12)
+        self.assertEqual(buffer.desde()[0], [7.0, 8.0, 9.0, 10.0, 11.0])
+        self.assertEqual(buffer.primero(), (7.0, 70.0))
+
+    def test_rango_por_tiempo_a_traves_de_la_vuelta(self):
+        buffer = self._buffer(5, 12)
+        self.assertEqual(buffer.desde(8.5, 11.0)[0], [9.0, 10.0])
+        self.assertEqual(buffer.desde(0.0, 8.0)[0], [7.0])
+        self.assertEqual(buffer.desde(20.0), ([], []))
+        buffer.agregar(12.0, 120.0)
+        self.assertEqual(buffer.desde(11.0), ([11.0, 12.0], [110.0, 120.0]))
+
+
+class CursorTest(unittest.TestCase):
+    def test_solo_lo_posterior_al_cursor(self):
+        buffer = BufferCircular(10)
+        buffer.extender([(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)])
+        self.assertEqual(buffer.desde_secuencia(1), ([2.0, 3.0], [2.0, 3.0], 3))
+        self.assertEqual(buffer.desde_secuencia(3), ([], [], 3))
+        self.assertEqual(buffer.desde_secuencia(0), ([1.0, 2.0, 3.0], [1.0, 2.0, 3.0], 3))
+
+    def test_cursor_pisado_por_la_vuelta(self):
+        buffer = BufferCircular(4)
+        buffer.extender([(float(i), float(i)) for i in range(10)])
+        # Quedan las muestras 7..10 (numeradas desde 1)
+        self.assertIsNone(buffer.desde_secuencia(5))
+        self.assertEqual(buffer.desde_secuencia(6), ([6.0, 7.0, 8.0, 9.0], [6.0, 7.0, 8.0, 9.0], 10))
+        self.assertEqual(buffer.desde_secuencia(8)[0], [8.0, 9.0])
+
+    def test_cursor_de_otro_arranque(self):
+        buffer = BufferCircular(4)
+        buffer.agregar(1.0, 1.0)
+        self.assertIsNone(buffer.desde_secuencia(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import math
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_storage import LectorCSV
+
+CABECERA = 'Time,Amb_Temp(°C),Humidity(%),Epoch_ms\n'
+
+
+class LectorCSVTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.tmp.name, 'environment.csv')
+        self.lector = LectorCSV()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _agregar(self, texto, modo='a'):
+        with open(self.ruta, modo, encoding='utf-8') as f:
+            f.write(texto)
+
+    def test_todas_las_columnas_en_una_pasada(self):
+        self._agregar(CABECERA + '10:00:00,25.5,60,1\n10:00:01,x,61,2\n')
+        tabla = self.lector.leer(self.ruta)
+        self.assertEqual(tabla.horas, ['10:00:00', '10:00:01'])
+        self.assertEqual(list(tabla.columna(2)), [60.0, 61.0])
+        self.assertTrue(math.isnan(tabla.columna(1)[1]))
+        self.assertEqual(list(tabla.columna(9)), [])
+
+    def test_retoma_desde_el_offset(self):
+        self._agregar(CABECERA + '10:00:00,25.5,60,1\n')
+        self.lector.leer(self.ruta)
+        leidos = self.lector.bytes_parseados
+        self._agregar('10:00:01,26.0,61,2\n')
+        tabla = self.lector.leer(self.ruta)
+        self.assertEqual(tabla.horas, ['10:00:00', '10:00:01'])
+        self.assertEqual(self.lector.bytes_parseados - leidos, len('10:00:01,26.0,61,2\n'))
+
+    def test_linea_a_medio_escribir_se_lee_al_completarse(self):
+        self._agregar(CABECERA + '10:00:00,25.5,60,1\n10:00:01,26')
+        self.assertEqual(self.lector.leer(self.ruta).horas, ['10:00:00'])
+        self._agregar('.0,61,2\n')
+        tabla = self.lector.leer(self.ruta)
+        self.assertEqual(tabla.horas, ['10:00:00', '10:00:01'])
+        self.assertEqual(tabla.columna(1)[1], 26.0)
+
+    def test_archivo_reemplazado_o_achicado_empieza_de_nuevo(self):
+        self._agregar(CABECERA + '10:00:00,25.5,60,1\n10:00:01,26.0,61,2\n')
+        self.lector.leer(self.ruta)
+        self._agregar(CABECERA + '11:00:00,20.0,50,3\n', modo='w')
+        self.assertEqual(self.lector.leer(self.ruta).horas, ['11:00:00'])
+
+        otro = self.ruta + '.tmp'
+        with open(otro, 'w', encoding='utf-8') as f:
+            f.write(CABECERA + '12:00:00,1,2,3\n12:00:01,1,2,3\n')
+        os.replace(otro, self.ruta)
+        self.assertEqual(self.lector.leer(self.ruta).horas, ['12:00:00', '12:00:01'])
+
+    def test_devuelve_copias(self):
+        self._agregar(CABECERA + '10:00:00,25.5,60,1\n')
+        self.lector.leer(self.ruta).horas.append('basura')
+        self.assertEqual(self.lector.leer(self.ruta).horas, ['10:00:00'])
+
+    def test_archivo_inexistente(self):
+        self.assertIsNone(self.lector.leer(self.ruta))
+
+
+if __name__ == '__main__':
+    unittest.main()
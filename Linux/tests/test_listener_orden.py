@@ -0,0 +1,58 @@
+import os
+import sys
+import types
+import tempfile
+import unittest
+import importlib.util
+
+INSTALACION = os.path.join(os.path.dirname(__file__), '..', 'installation')
+sys.path.insert(0, INSTALACION)
+
+
+def cargar_listener(base_dir):
+    """pymqtt-listener.py (nombre con guion) con LOG_DIR_BASE en una carpeta temporal."""
+    ruta = os.path.join(INSTALACION, 'pymqtt-listener.py')
+    with open(ruta, encoding='utf-8') as f:
+        fuente = f.read().replace("LOG_DIR_BASE = '/home/log'", f"LOG_DIR_BASE = {base_dir!r}", 1)
+    modulo = types.ModuleType('pymqtt_listener')
+    modulo.__file__ = ruta
+    exec(compile(fuente, ruta, 'exec'), modulo.__dict__)
+    return modulo
+
+
+@unittest.skipUnless(importlib.util.find_spec('paho'), "requiere paho-mqtt")
+class OrdenEntreLotesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.listener = cargar_listener(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_fila_atrasada_en_el_lote_siguiente(self):
+        procesador = self.listener.ProcesadorMensajes(self.listener.esquemas)
+        rx = 1_800_000_000.0
+        lotes, _ = procesador.preparar({'measure/radiation': [(rx, f"500@{int(rx * 1000)}".encode())]})
+        self.assertEqual(lotes[0][1][0][0], rx)
+
+        # El equipo vacía su buffer: muestra 30 s anterior a la ya escrita
+        rx2 = rx + 5
+        lotes, _ = procesador.preparar({'measure/radiation': [(rx2, f"400@{int((rx - 30) * 1000)}".encode())]})
+        ts, recepcion, valores = lotes[0][1][0]
+        self.assertGreaterEqual(ts, rx)
+        self.assertEqual(ts, recepcion)
+        self.assertEqual(procesador.ts_atrasados, 1)
+
+    def test_filas_en_orden_no_se_tocan(self):
+        procesador = self.listener.ProcesadorMensajes(self.listener.esquemas)
+        rx = 1_800_000_100.0
+        procesador.preparar({'measure/temperature': [(rx, f"20@{int(rx * 1000)}".encode())]})
+        lotes, _ = procesador.preparar({'measure/temperature': [(rx + 1, f"21@{int((rx + 0.5) * 1000)}".encode())]})
+        self.assertEqual(lotes[0][1][0][0], rx + 0.5)
+        self.assertEqual(procesador.ts_atrasados, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
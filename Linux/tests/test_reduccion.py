@@ -0,0 +1,70 @@
+import os
+import sys
+import math
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_storage import reducir_lttb, reducir_minmax, agrupar_resumenes
+
+
+def serie(cantidad):
+    tiempos = [float(i) for i in range(cantidad)]
+    return tiempos, [math.sin(t / 10) for t in tiempos]
+
+
+class ReducirTest(unittest.TestCase):
+    def test_nunca_mas_de_n_puntos(self):
+        tiempos, valores = serie(1000)
+        for reducir in (reducir_lttb, reducir_minmax):
+            for n in (0, 1, 2, 3, 7, 100, 999):
+                t, v = reducir(tiempos, valores, n)
+                self.assertLessEqual(len(t), n, (reducir.__name__, n))
+                self.assertEqual(len(t), len(v))
+                self.assertEqual(t, sorted(t))
+
+    def test_menos_puntos_que_n_devuelve_todo(self):
+        tiempos, valores = serie(10)
+        for reducir in (reducir_lttb, reducir_minmax):
+            self.assertEqual(reducir(tiempos, valores, 10), (tiempos, valores))
+            self.assertEqual(reducir([], [], 5), ([], []))
+
+    def test_lttb_conserva_extremos_y_el_pico(self):
+        tiempos = [float(i) for i in range(500)]
+        valores = [0.0] * 500
+        valores[250] = 100.0
+        t, v = reducir_lttb(tiempos, valores, 20)
+        self.assertEqual(len(t), 20)
+        self.assertEqual((t[0], t[-1]), (0.0, 499.0))
+        self.assertIn(100.0, v)
+
+    def test_lttb_n_chico(self):
+        tiempos, valores = serie(50)
+        self.assertEqual(reducir_lttb(tiempos, valores, 2)[0], [0.0, 49.0])
+        self.assertEqual(reducir_lttb(tiempos, valores, 1)[0], [0.0])
+
+    def test_minmax_conserva_minimo_y_maximo(self):
+        tiempos, valores = serie(1000)
+        _, v = reducir_minmax(tiempos, valores, 40)
+        self.assertEqual((min(v), max(v)), (min(valores), max(valores)))
+
+
+class AgruparResumenesTest(unittest.TestCase):
+    def test_exacto_para_min_max_media(self):
+        # (inicio_ms, cantidad, [(min, max, media, último)])
+        intervalos = [(i * 60000, 2, [(float(i), float(i) + 1, float(i) + 0.5, float(i) + 1)]) for i in range(10)]
+        agrupados = agrupar_resumenes(intervalos, 3)
+        self.assertLessEqual(len(agrupados), 3)
+        self.assertEqual(agrupados[0][0], 0)
+        self.assertEqual(sum(c for _, c, _ in agrupados), 20)
+        minimo, maximo, media, ultimo = agrupados[0][2][0]
+        self.assertEqual((minimo, maximo, media, ultimo), (0.0, 4.0, 2.0, 4.0))
+
+    def test_pocos_intervalos_quedan_igual(self):
+        intervalos = [(0, 1, [(1.0, 1.0, 1.0, 1.0)])]
+        self.assertIs(agrupar_resumenes(intervalos, 5), intervalos)
+        self.assertEqual(len(agrupar_resumenes(intervalos * 4, 0)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'installation'))
+
+from anii_protocol import RegistroEsquemas
+from anii_storage import RegistroCSV
+
+ENCABEZADOS = {'radiation': ['Time', 'Radiation(W/m^2)'],
+               'environment': ['Time', 'Amb_Temp(°C)', 'Humidity(%)', 'Pressure(hPa)']}
+
+
+class RegistroCSVTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.esquemas = RegistroEsquemas()
+        self.dia = time.strftime('%Y_%m_%d')
+        os.makedirs(os.path.join(self.tmp.name, self.dia))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _ruta(self, variable):
+        return os.path.join(self.tmp.name, self.dia, f"{self.dia}_{variable}.csv")
+
+    def _escribir(self, variable, topic, payload):
+        registro = RegistroCSV(self.tmp.name, ENCABEZADOS)
+        _, valores = self.esquemas.parsear(topic, payload)[0]
+        registro.escribir_filas(variable, [(time.time(), time.time(), valores)])
+        registro.cerrar_todos()
+        with open(self._ruta(variable)) as f:
+            return f.read().splitlines()
+
+    def test_conserva_el_texto_de_los_numeros(self):
+        lineas = self._escribir('environment', 'measure/environment', b'25.50,60.00,1013.20')
+        self.assertEqual(lineas[0], 'Time,Amb_Temp(°C),Humidity(%),Pressure(hPa),Epoch_ms')
+        self.assertEqual(lineas[1].split(',')[1:4], ['25.50', '60.00', '1013.20'])
+
+    def test_archivo_con_cabecera_vieja_sigue_sin_epoch(self):
+        with open(self._ruta('radiation'), 'w') as f:
+            f.write('Time,Radiation(W/m^2)\n10:00:00,5.00\n')
+        lineas = self._escribir('radiation', 'measure/radiation', b'7.10')
+        self.assertEqual(lineas[0], 'Time,Radiation(W/m^2)')
+        self.assertEqual(len(lineas[2].split(',')), 2)
+        self.assertEqual(lineas[2].split(',')[1], '7.10')
+
+
+if __name__ == '__main__':
+    unittest.main()
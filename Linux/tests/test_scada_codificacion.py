@@ -0,0 +1,130 @@
+import os
+import sys
+import math
+import types
+import struct
+import tempfile
+import unittest
+import importlib.util
+
+INSTALACION = os.path.join(os.path.dirname(__file__), '..', 'installation')
+SCADA = os.path.join(os.path.dirname(__file__), '..', 'scada')
+sys.path.insert(0, INSTALACION)
+
+DEPENDENCIAS = ('flask', 'flask_socketio', 'eventlet', 'paho')
+
+
+def instalado(*modulos):
+    return all(importlib.util.find_spec(m) for m in modulos)
+
+
+def cargar_app(base_dir):
+    """app.py con LOG_DIR_BASE (y SQLITE_DB) en una carpeta temporal, sin arrancar el servidor."""
+    ruta = os.path.join(SCADA, 'app.py')
+    with open(ruta, encoding='utf-8') as f:
+        fuente = f.read().replace("'/home/log", repr(base_dir)[:-1])
+    modulo = types.ModuleType('scada_app')
+    modulo.__file__ = ruta
+    exec(compile(fuente, ruta, 'exec'), modulo.__dict__)
+    return modulo
+
+
+class Lector:
+    """Lo mismo que leerSeries()/leerDatos() de index.html."""
+
+    def __init__(self, datos):
+        self.datos = datos
+        self.pos = 4
+
+    def leer(self, formato):
+        valores = struct.unpack_from('<' + formato, self.datos, self.pos)
+        self.pos += struct.calcsize('<' + formato)
+        return valores
+
+    def texto(self):
+        largo, = self.leer('B')
+        self.pos += largo
+        return self.datos[self.pos - largo:self.pos].decode()
+
+
+def leer_series(datos):
+    lector = Lector(datos)
+    id_historial = lector.texto()
+    series = {}
+    for _ in range(lector.leer('H')[0]):
+        nombre = lector.texto()
+        banderas, cursor, n, primero = lector.leer('BIId')
+        if banderas & 4:
+            tiempos = list(lector.leer(f'{n}d'))
+        else:
+            tiempos, t = [], primero
+            for delta in lector.leer(f'{n}i'):
+                t += delta
+                tiempos.append(t)
+        serie = {'banderas': banderas, 'cursor': cursor, 't': tiempos, 'v': list(lector.leer(f'{n}f'))}
+        if banderas & 2:
+            serie['min'] = list(lector.leer(f'{n}f'))
+            serie['max'] = list(lector.leer(f'{n}f'))
+        series[nombre] = serie
+    return id_historial, series
+
+
+def leer_datos(datos):
+    lector = Lector(datos)
+    return [(lector.texto(),) + lector.leer('Id') for _ in range(lector.leer('B')[0])]
+
+
+@unittest.skipUnless(instalado(*DEPENDENCIAS), "requiere " + ", ".join(DEPENDENCIAS))
+class CodificacionBinariaTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.app = cargar_app(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_series_con_diferencias_en_i32(self):
+        t0 = 1765432100000
+        datos = self.app.codificar_series([
+            {'var': 'radiation', 't': [t0, t0 + 1000, t0 + 2500], 'v': [1.5, None, 3.25], 'cursor': 7, 'reset': True},
+            {'var': 'env_temp', 't': [t0], 'v': [20.0], 'min': [19.5], 'max': [20.5]},
+        ], id_historial='abc')
+        self.assertEqual(datos[:4], b'ANS1')
+        id_historial, series = leer_series(datos)
+        self.assertEqual(id_historial, 'abc')
+
+        radiacion = series['radiation']
+        self.assertEqual((radiacion['banderas'], radiacion['cursor']), (1, 7))
+        self.assertEqual(radiacion['t'], [t0, t0 + 1000, t0 + 2500])
+        self.assertEqual(radiacion['v'][::2], [1.5, 3.25])
+        self.assertTrue(math.isnan(radiacion['v'][1]))
+
+        temperatura = series['env_temp']
+        self.assertEqual(temperatura['banderas'], 2)
+        self.assertEqual((temperatura['min'], temperatura['max']), ([19.5], [20.5]))
+
+    def test_hueco_que_no_entra_en_i32_va_en_f64(self):
+        t0 = 1765432100000
+        tiempos = [t0, t0 + 40 * 86400 * 1000, t0 + 40 * 86400 * 1000 + 1]
+        _, series = leer_series(self.app.codificar_series([{'var': 'radiation', 't': tiempos, 'v': [1, 2, 3]}]))
+        self.assertEqual(series['radiation']['banderas'], self.app.HORAS_F64)
+        self.assertEqual(series['radiation']['t'], tiempos)
+
+    def test_serie_vacia(self):
+        _, series = leer_series(self.app.codificar_series([{'var': 'radiation', 't': [], 'v': []}]))
+        self.assertEqual(series['radiation']['t'], [])
+
+    def test_datos_en_vivo(self):
+        datos = self.app.codificar_datos([{'sensor': 'env_temp', 'valor': '25.5', 'seq': 3},
+                                          {'sensor': 'process', 'valor': '--'}])
+        self.assertEqual(datos[:4], b'AND1')
+        (sensor, seq, valor), (sensor2, seq2, valor2) = leer_datos(datos)
+        self.assertEqual((sensor, seq, valor), ('env_temp', 3, 25.5))
+        self.assertEqual((sensor2, seq2), ('process', 0))
+        self.assertTrue(math.isnan(valor2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import io
+import os
+import sys
+import types
+import zipfile
+import tempfile
+import unittest
+import importlib.util
+
+INSTALACION = os.path.join(os.path.dirname(__file__), '..', 'installation')
+SCADA = os.path.join(os.path.dirname(__file__), '..', 'scada')
+sys.path.insert(0, INSTALACION)
+
+DEPENDENCIAS = ('flask', 'flask_socketio', 'eventlet', 'paho')
+
+
+def instalado(*modulos):
+    return all(importlib.util.find_spec(m) for m in modulos)
+
+
+def cargar_app(base_dir):
+    """app.py con LOG_DIR_BASE (y SQLITE_DB) en una carpeta temporal, sin arrancar el servidor."""
+    ruta = os.path.join(SCADA, 'app.py')
+    with open(ruta, encoding='utf-8') as f:
+        fuente = f.read().replace("'/home/log", repr(base_dir)[:-1])
+    modulo = types.ModuleType('scada_app')
+    modulo.__file__ = ruta
+    exec(compile(fuente, ruta, 'exec'), modulo.__dict__)
+    return modulo
+
+
+@unittest.skipUnless(instalado(*DEPENDENCIAS), "requiere " + ", ".join(DEPENDENCIAS))
+class ZipEnStreamingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.app = cargar_app(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp(dir=self.tmp.name)
+        self.dia = os.path.join(self.carpeta, '2026_01_01')
+        self.archivos = {
+            '2026_01_01/2026_01_01_radiation.csv': b'Time,Radiation(W/m^2)\n' + b'10:00:00,500.00\n' * 20000,
+            '2026_01_01/2026_01_01_radiation.bin': os.urandom(3 * self.app.ZIP_BLOQUE + 17),
+            '2026_01_01/sub/notas.txt': b'hola',
+            '2026_01_01/vacio.csv': b'',
+        }
+        for relativa, datos in self.archivos.items():
+            self._escribir(relativa, datos)
+        self._escribir('2026_01_01/.oculto', b'no')
+        self._escribir('2026_01_01/db.lock', b'no')
+        self._escribir('2026_01_01/.comprimidos/x.gz', b'no')
+
+    def _escribir(self, relativa, datos):
+        ruta = os.path.join(self.carpeta, relativa)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as f:
+            f.write(datos)
+
+    def test_zip_valido_con_el_contenido_de_la_carpeta(self):
+        bloques = list(self.app.zip_en_streaming(self.dia))
+        with zipfile.ZipFile(io.BytesIO(b''.join(bloques))) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(sorted(zf.namelist()), sorted(self.archivos))
+            for relativa, datos in self.archivos.items():
+                self.assertEqual(zf.read(relativa), datos)
+            self.assertEqual(zf.getinfo('2026_01_01/2026_01_01_radiation.bin').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zf.getinfo('2026_01_01/2026_01_01_radiation.csv').compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_se_entrega_de_a_bloques(self):
+        bloques = [b for b in self.app.zip_en_streaming(self.dia) if b]
+        self.assertGreater(len(bloques), 3)
+        # Nada se acumula: cada bloque es a lo sumo uno leído más las cabeceras
+        self.assertLess(max(map(len, bloques)), 2 * self.app.ZIP_BLOQUE)
+
+    def test_carpeta_vacia(self):
+        vacia = os.path.join(self.carpeta, 'vacia')
+        os.makedirs(vacia)
+        with zipfile.ZipFile(io.BytesIO(b''.join(self.app.zip_en_streaming(vacia)))) as zf:
+            self.assertEqual(zf.namelist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()